@@ -1,30 +1,67 @@
 from __future__ import annotations
+import uuid
 from typing import Optional, Dict, Any, List
 from datetime import datetime, timedelta
 from sqlalchemy.ext.asyncio import AsyncSession
-from sqlalchemy import select, func, and_, delete
+from sqlalchemy import select, func, and_, delete, case, insert, update
 from app.models import (
     Book, BookCopy, EmailUser, Reservation,
     CopyStatus, ReservationStatus
 )
+from app.catalog import bump_catalog_version
+from app.changes import publish_change
+from app.db import dialect_insert
+from app.search import search_book_ids
+from app.users import USER_IDS, normalize_email
 
 DEFAULT_LOAN_DAYS = 30
+SEARCH_MAX_LIMIT = 100
+BATCH_MAX_ITEMS = 500
+BULK_LOOKUP_CHUNK = 500  # barcodes por consulta IN al buscar duplicados en la carga masiva
+
+def _as_id(value: Optional[str]) -> Optional[str]:
+    # Ids externos llegan como texto; uno que no es UUID válido nunca existe en la DB.
+    try:
+        return str(uuid.UUID(str(value).strip())) if value else None
+    except ValueError:
+        return None
 
 def _ok(msg: str, **data):    return {"ok": True,  "message": msg, **({"data": data} if data else {})}
 def _err(msg: str, code="", **data): return {"ok": False, "message": msg, "code": code, **({"data": data} if data else {})}
 
-async def _get_or_create_user(session: AsyncSession, email: str, name: Optional[str]) -> EmailUser:
-    email_norm = (email or "").strip().lower()
-    res = await session.execute(select(EmailUser).where(EmailUser.email == email_norm))
-    user = res.scalar_one_or_none()
-    if user:
-        return user
-    user = EmailUser(email=email_norm, name=(name or "").strip() or None)
-    session.add(user)
-    await session.flush()
-    return user
-
-async def _find_book_by_id_or_title(session: AsyncSession, book_id: Optional[str], title: Optional[str]) -> Optional[Book]:
+async def _find_user_id(session: AsyncSession, email_norm: str) -> Optional[str]:
+    """Id del usuario; los remitentes frecuentes se resuelven desde USER_IDS sin ir a la base."""
+    user_id = USER_IDS.get(email_norm)
+    if user_id is None:
+        user_id = (await session.execute(select(EmailUser.id).where(EmailUser.email == email_norm))).scalar_one_or_none()
+        if user_id is not None:
+            USER_IDS.put(email_norm, user_id)
+    return user_id
+
+async def _get_or_create_user(session: AsyncSession, email_norm: str, name: Optional[str]) -> tuple[str, bool]:
+    """(id, creado). El alta es un INSERT ... ON CONFLICT DO NOTHING: si otro correo del mismo
+    remitente lo creó en paralelo, no hay violación de unicidad y se lee el id existente.
+    Un usuario recién creado se agrega a USER_IDS después del commit (lo hace quien llama)."""
+    user_id = await _find_user_id(session, email_norm)
+    if user_id is not None:
+        return user_id, False
+    user_id = (await session.execute(
+        dialect_insert(session, EmailUser)
+        .values(id=str(uuid.uuid4()), email=email_norm, name=(name or "").strip() or None)
+        .on_conflict_do_nothing(index_elements=["email"])
+        .returning(EmailUser.id)
+    )).scalar_one_or_none()
+    if user_id is not None:
+        return user_id, True
+    return (await session.execute(select(EmailUser.id).where(EmailUser.email == email_norm))).scalar_one(), False
+
+async def _find_book_by_id_or_title(session: AsyncSession, book_id: Optional[str], title: Optional[str], *, read_session: Optional[AsyncSession] = None) -> Optional[Book]:
+    # Si hay sesión de réplica se resuelve allí primero; un fallo cae al primario (read-your-writes).
+    if read_session is not None and read_session is not session:
+        b = await _find_book_by_id_or_title(read_session, book_id, title)
+        if b:
+            return b
+    book_id = _as_id(book_id)
     if book_id:
         r = await session.execute(select(Book).where(Book.id == book_id))
         b = r.scalar_one_or_none()
@@ -38,7 +75,39 @@ async def _find_book_by_id_or_title(session: AsyncSession, book_id: Optional[str
             return b
     return None
 
-async def list_books(session: AsyncSession) -> Dict[str, Any]:
+async def _copy_counts(session: AsyncSession, ids: List[str]) -> Dict[str, tuple[int, int]]:
+    """{book_id: (disponibles, totales)} para los libros indicados, en una sola consulta."""
+    q_counts = (
+        select(
+            BookCopy.book_id,
+            func.count().label("total"),
+            func.sum(case((BookCopy.status == CopyStatus.AVAILABLE, 1), else_=0)).label("available"),
+        )
+        .where(BookCopy.book_id.in_(ids))
+        .group_by(BookCopy.book_id)
+    )
+    return {row.book_id: (int(row.available or 0), int(row.total)) for row in (await session.execute(q_counts))}
+
+async def list_books(session: AsyncSession, *, limit: Optional[int] = None, offset: int = 0) -> Dict[str, Any]:
+    """Catálogo completo; con `limit`, una página ordenada por título (`has_more` indica si hay más)."""
+    if limit is not None:
+        limit = max(1, min(int(limit), SEARCH_MAX_LIMIT))
+        offset = max(0, int(offset or 0))
+        books = (await session.execute(
+            select(Book).order_by(Book.title, Book.id).offset(offset).limit(limit + 1)
+        )).scalars().all()
+        has_more = len(books) > limit
+        books = books[:limit]
+        counts = await _copy_counts(session, [b.id for b in books]) if books else {}
+        items = [{
+            "book_id": b.id,
+            "title": b.title,
+            "author": b.author,
+            "copies_available": counts.get(b.id, (0, 0))[0],
+            "copies_total": counts.get(b.id, (0, 0))[1],
+        } for b in books]
+        msg = "Listado de libros disponible." if items else "No hay más libros en el catálogo."
+        return _ok(msg, items=items, limit=limit, offset=offset, has_more=has_more)
     books: List[Book] = (await session.execute(select(Book))).scalars().all()
     if not books:
         return _ok("No hay libros registrados aún.", items=[])
@@ -59,12 +128,36 @@ async def list_books(session: AsyncSession) -> Dict[str, Any]:
     } for b in books]
     return _ok("Listado de libros disponible.", items=items)
 
+async def search_books(session: AsyncSession, *, q: str, limit: int = 20, offset: int = 0) -> Dict[str, Any]:
+    if not (q or "").strip():
+        return _err("Falta el texto de búsqueda.", code="MISSING_QUERY")
+    limit = max(1, min(int(limit), SEARCH_MAX_LIMIT))
+    offset = max(0, int(offset))
+    hits = await search_book_ids(session, q, limit=limit + 1, offset=offset)
+    has_more = len(hits) > limit
+    hits = hits[:limit]
+    ids = [book_id for book_id, _ in hits]
+    if not ids:
+        return _ok("No encontré libros para esa búsqueda.", items=[], limit=limit, offset=offset, has_more=False)
+    books = {b.id: b for b in (await session.execute(select(Book).where(Book.id.in_(ids)))).scalars()}
+    counts = await _copy_counts(session, ids)
+    items = [{
+        "book_id": b.id,
+        "title": b.title,
+        "author": b.author,
+        "copies_available": counts.get(b.id, (0, 0))[0],
+        "copies_total": counts.get(b.id, (0, 0))[1],
+        "rank": rank,
+    } for b, rank in ((books.get(book_id), rank) for book_id, rank in hits) if b]
+    return _ok("Resultados de búsqueda.", items=items, limit=limit, offset=offset, has_more=has_more)
+
 async def register_book(session: AsyncSession, *, title: str, author: Optional[str]) -> Dict[str, Any]:
     if not title:
         return _err("Falta el título del libro.", code="MISSING_TITLE")
     b = Book(title=title.strip(), author=(author or None))
     session.add(b)
     await session.commit()
+    bump_catalog_version()
     await session.refresh(b)
     return _ok(
         "Libro registrado exitosamente.",
@@ -75,8 +168,11 @@ async def register_book(session: AsyncSession, *, title: str, author: Optional[s
 async def register_copy(session: AsyncSession, *, book_id: str, barcode: str, location: str) -> Dict[str, Any]:
     if not (book_id and barcode and location):
         return _err("Faltan datos para registrar la copia (book_id, barcode, location).", code="MISSING_FIELDS")
-    r = await session.execute(select(Book).where(Book.id == book_id))
-    book = r.scalar_one_or_none()
+    book_id = _as_id(book_id)
+    book = None
+    if book_id:
+        r = await session.execute(select(Book).where(Book.id == book_id))
+        book = r.scalar_one_or_none()
     if not book:
         return _err("El libro indicado no existe.", code="BOOK_NOT_FOUND")
     r2 = await session.execute(select(BookCopy).where(BookCopy.barcode == barcode))
@@ -85,52 +181,289 @@ async def register_copy(session: AsyncSession, *, book_id: str, barcode: str, lo
     c = BookCopy(book_id=book_id, barcode=barcode, location=location, status=CopyStatus.AVAILABLE)
     session.add(c)
     await session.commit()
+    bump_catalog_version()
     await session.refresh(c)
+    publish_change("copy_added", c.book_id, available_delta=1, total_delta=1, barcode=c.barcode)
     return _ok(
         "Copia registrada exitosamente.",
         copy_id=c.id, book_id=c.book_id, title=book.title,
         barcode=c.barcode, location=c.location
     )
 
-async def reserve(session: AsyncSession, *, book_id: Optional[str], book_title: Optional[str], name: Optional[str], email: str) -> Dict[str, Any]:
+def _row_error(row: Dict[str, Any], msg: str, code: str) -> Dict[str, Any]:
+    return {"row": row.get("row"), "barcode": row.get("barcode"), "code": code, "message": msg}
+
+async def register_copies_bulk(session: AsyncSession, *, rows: List[Dict[str, Any]]) -> Dict[str, Any]:
+    """Registra muchas copias en una transacción (filas de una planilla adjunta).
+
+    Cada fila trae `barcode`, `location` y `book_id` o `title`. Libros y códigos de barras
+    existentes se resuelven con consultas por conjunto y las copias se insertan en bloque;
+    las filas inválidas no detienen el lote y se devuelven en `errors` con su número de fila.
+    """
+    if not rows:
+        return _err("No hay filas para registrar.", code="EMPTY_BATCH")
+    errors: List[Dict[str, Any]] = []
+    pending: List[Dict[str, Any]] = []
+    seen: set[str] = set()
+    for row in rows:
+        barcode = str(row.get("barcode") or "").strip()
+        location = str(row.get("location") or "").strip()
+        title = str(row.get("title") or "").strip() or None
+        book_id = _as_id(row.get("book_id"))
+        if not (barcode and location and (row.get("book_id") or title)):
+            errors.append(_row_error(row, "Faltan barcode, location o el libro (book_id/título).", "MISSING_FIELDS"))
+            continue
+        if barcode in seen:
+            errors.append(_row_error(row, "Código de barras repetido en el archivo.", "DUPLICATE_BARCODE"))
+            continue
+        seen.add(barcode)
+        pending.append({**row, "barcode": barcode, "location": location, "title": title, "book_id": book_id})
+
+    ids = {r["book_id"] for r in pending if r["book_id"]}
+    titles = {r["title"] for r in pending if r["title"] and not r["book_id"]}
+    books_by_id: Dict[str, Any] = {}
+    books_by_title: Dict[str, Any] = {}
+    if ids:
+        books_by_id = {b.id: b for b in (await session.execute(select(Book.id, Book.title).where(Book.id.in_(ids))))}
+    if titles:
+        for b in await session.execute(select(Book.id, Book.title).where(Book.title.in_(titles)).order_by(Book.created_at)):
+            books_by_title.setdefault(b.title, b)
+    existing: set[str] = set()
+    barcodes = [r["barcode"] for r in pending]
+    for i in range(0, len(barcodes), BULK_LOOKUP_CHUNK):
+        chunk = barcodes[i:i + BULK_LOOKUP_CHUNK]
+        existing.update((await session.execute(select(BookCopy.barcode).where(BookCopy.barcode.in_(chunk)))).scalars())
+
+    to_insert: List[Dict[str, Any]] = []
+    rows_by_barcode: Dict[str, Dict[str, Any]] = {}
+    for r in pending:
+        book = books_by_id.get(r["book_id"]) if r["book_id"] else books_by_title.get(r["title"])
+        if book is None:
+            errors.append(_row_error(r, "El libro indicado no existe.", "BOOK_NOT_FOUND"))
+        elif r["barcode"] in existing:
+            errors.append(_row_error(r, "El código de barras ya existe.", "BARCODE_EXISTS"))
+        else:
+            rows_by_barcode[r["barcode"]] = r
+            to_insert.append({
+                "id": str(uuid.uuid4()), "book_id": book.id, "barcode": r["barcode"],
+                "location": r["location"], "status": CopyStatus.AVAILABLE,
+            })
+
+    inserted = 0
+    if to_insert:
+        # ON CONFLICT cubre la carrera con otra transacción que registre el mismo barcode entre la consulta y el insert.
+        stmt = dialect_insert(session, BookCopy).on_conflict_do_nothing(index_elements=["barcode"]).returning(BookCopy.barcode)
+        done = set((await session.execute(stmt, to_insert)).scalars())
+        inserted = len(done)
+        for barcode, r in rows_by_barcode.items():
+            if barcode not in done:
+                errors.append(_row_error(r, "El código de barras ya existe.", "BARCODE_EXISTS"))
+        await session.commit()
+        bump_catalog_version()
+        added: Dict[str, int] = {}
+        for row in to_insert:
+            if row["barcode"] in done:
+                added[row["book_id"]] = added.get(row["book_id"], 0) + 1
+        for book_id, n in added.items():
+            publish_change("copies_added", book_id, available_delta=n, total_delta=n)
+    errors.sort(key=lambda e: (e["row"] is None, e["row"] or 0))
+    return _ok(
+        f"Se registraron {inserted} de {len(rows)} copias.",
+        inserted=inserted, failed=len(rows) - inserted, total=len(rows), errors=errors
+    )
+
+async def reserve(session: AsyncSession, *, book_id: Optional[str], book_title: Optional[str], name: Optional[str], email: str, read_session: Optional[AsyncSession] = None) -> Dict[str, Any]:
     if not email:
         return _err("Falta el email del solicitante.", code="MISSING_EMAIL")
-    book = await _find_book_by_id_or_title(session, book_id, book_title)
+    book = await _find_book_by_id_or_title(session, book_id, book_title, read_session=read_session)
     if not book:
         return _err("No encontré el libro solicitado (id/título).", code="BOOK_NOT_FOUND")
     r_copy = await session.execute(
-        select(BookCopy).where(and_(BookCopy.book_id == book.id, BookCopy.status == CopyStatus.AVAILABLE)).limit(1)
+        select(BookCopy).where(and_(BookCopy.book_id == book.id, BookCopy.status == CopyStatus.AVAILABLE))
+        .limit(1).with_for_update(skip_locked=True)
     )
     copy = r_copy.scalar_one_or_none()
+    if read_session is not None and read_session is not session:
+        # La réplica puede ir atrasada: con la copia ya bloqueada se confirma que el libro sigue en el primario.
+        book = await session.get(Book, book.id)
+        if not book:
+            return _err("No encontré el libro solicitado (id/título).", code="BOOK_NOT_FOUND")
     if not copy:
         return _err("No hay copias disponibles para ese libro.", code="NO_AVAILABLE_COPIES")
-    user = await _get_or_create_user(session, email=email, name=name)
+    email_norm = normalize_email(email)
+    user_id, created = await _get_or_create_user(session, email_norm, name)
     copy.status = CopyStatus.RESERVED
     due = datetime.utcnow() + timedelta(days=DEFAULT_LOAN_DAYS)
     res = Reservation(
-        email_user_id=user.id, book_id=book.id, copy_id=copy.id,
+        email_user_id=user_id, book_id=book.id, copy_id=copy.id,
         status=ReservationStatus.ACTIVE, due_date=due
     )
     session.add(res)
     await session.commit()
+    if created:
+        USER_IDS.put(email_norm, user_id)
+    bump_catalog_version()
     await session.refresh(res)
+    publish_change("reserved", book.id, available_delta=-1, barcode=copy.barcode)
     return _ok(
         "La reservación se realizó exitosamente.",
         reservation_id=res.id,
         book_id=book.id, title=book.title,
         copy_id=copy.id, barcode=copy.barcode, location=copy.location,
-        user_email=user.email,
+        user_email=email_norm,
         due_date=res.due_date.isoformat(),
         renewed_cnt=0
     )
 
+async def _upsert_users(session: AsyncSession, names_by_email: Dict[str, Optional[str]]) -> Dict[str, str]:
+    """Crea en bloque los usuarios que falten y devuelve {email: user_id}."""
+    if not names_by_email:
+        return {}
+    rows = [{"id": str(uuid.uuid4()), "email": e, "name": n} for e, n in names_by_email.items()]
+    await session.execute(dialect_insert(session, EmailUser).on_conflict_do_nothing(index_elements=["email"]), rows)
+    r = await session.execute(select(EmailUser.id, EmailUser.email).where(EmailUser.email.in_(list(names_by_email))))
+    return {row.email: row.id for row in r}
+
+async def reserve_batch(session: AsyncSession, *, items: List[Dict[str, Any]]) -> Dict[str, Any]:
+    """Reserva una copia por cada par (libro, usuario) en una sola transacción.
+
+    Las consultas son por conjunto (libros, copias, usuarios, reservas), así que el
+    número de round trips no crece con el tamaño del lote. Cada ítem tiene su propio
+    resultado; si se agotan las copias de un libro, los ítems restantes fallan con
+    NO_AVAILABLE_COPIES y el resto del lote se confirma igual. Si otra transacción
+    toma o bloquea copias candidatas, se buscan otras para esos libros.
+    """
+    if not items:
+        return _err("No hay reservas en el lote.", code="EMPTY_BATCH")
+    if len(items) > BATCH_MAX_ITEMS:
+        return _err(f"El lote supera el máximo de {BATCH_MAX_ITEMS} reservas.", code="BATCH_TOO_LARGE")
+    results: List[Optional[Dict[str, Any]]] = [None] * len(items)
+    wanted: List[tuple[int, Optional[str], Optional[str], str, Optional[str]]] = []
+    for idx, it in enumerate(items):
+        email = normalize_email(it.get("email"))
+        if not email:
+            results[idx] = _err("Falta el email del solicitante.", code="MISSING_EMAIL")
+            continue
+        title = (it.get("book_title") or "").strip() or None
+        wanted.append((idx, _as_id(it.get("book_id")), title, email, (it.get("name") or "").strip() or None))
+
+    ids = {book_id for _, book_id, _, _, _ in wanted if book_id}
+    # Todos los títulos: también sirven de respaldo cuando el id viene pero no existe.
+    titles = {title for _, _, title, _, _ in wanted if title}
+    books_by_id: Dict[str, Book] = {}
+    books_by_title: Dict[str, Book] = {}
+    if ids:
+        books_by_id = {b.id: b for b in (await session.execute(select(Book).where(Book.id.in_(ids)))).scalars()}
+    if titles:
+        for b in (await session.execute(select(Book).where(Book.title.in_(titles)).order_by(Book.created_at))).scalars():
+            books_by_title.setdefault(b.title, b)
+
+    resolved: List[tuple[int, Book, str, Optional[str]]] = []
+    needed: Dict[str, int] = {}
+    for idx, book_id, title, email, name in wanted:
+        book = books_by_id.get(book_id) if book_id else None
+        if book is None and title:
+            book = books_by_title.get(title)
+        if book is None:
+            results[idx] = _err("No encontré el libro solicitado (id/título).", code="BOOK_NOT_FOUND")
+            continue
+        resolved.append((idx, book, email, name))
+        needed[book.id] = needed.get(book.id, 0) + 1
+
+    copies_by_book: Dict[str, List[Any]] = {}
+    missing = dict(needed)
+    seen: List[str] = []
+    while missing:
+        ranked = (
+            select(
+                BookCopy.id, BookCopy.book_id,
+                func.row_number().over(partition_by=BookCopy.book_id, order_by=BookCopy.id).label("rn"),
+            )
+            .where(and_(BookCopy.book_id.in_(list(missing)), BookCopy.status == CopyStatus.AVAILABLE,
+                        BookCopy.id.notin_(seen)))
+            .subquery()
+        )
+        candidates = (await session.execute(
+            select(ranked.c.id, ranked.c.book_id).where(ranked.c.rn <= max(missing.values()))
+        )).all()
+        if not candidates:
+            break
+        seen += [c.id for c in candidates]
+        locked = (await session.execute(
+            select(BookCopy.id, BookCopy.book_id, BookCopy.barcode, BookCopy.location)
+            .where(and_(BookCopy.id.in_([c.id for c in candidates]), BookCopy.status == CopyStatus.AVAILABLE))
+            .with_for_update(skip_locked=True)
+        )).all()
+        offered: Dict[str, int] = {}
+        for c in candidates:
+            offered[c.book_id] = offered.get(c.book_id, 0) + 1
+        for c in locked:
+            copies_by_book.setdefault(c.book_id, []).append(c)
+            offered[c.book_id] -= 1
+        # Candidatas que otra transacción tomó o tiene bloqueadas: se buscan otras solo para esos libros.
+        missing = {
+            book_id: needed[book_id] - len(copies_by_book.get(book_id, ()))
+            for book_id, lost in offered.items()
+            if lost and len(copies_by_book.get(book_id, ())) < needed[book_id]
+        }
+
+    assigned: List[tuple[int, Book, Any, str]] = []
+    users_wanted: Dict[str, Optional[str]] = {}
+    for idx, book, email, name in resolved:
+        pool = copies_by_book.get(book.id) or []
+        if not pool:
+            results[idx] = _err("No hay copias disponibles para ese libro.", code="NO_AVAILABLE_COPIES")
+            continue
+        assigned.append((idx, book, pool.pop(), email))
+        if name or email not in users_wanted:
+            users_wanted[email] = name
+
+    if assigned:
+        user_ids = {e: uid for e in users_wanted if (uid := USER_IDS.get(e))}
+        user_ids.update(await _upsert_users(session, {e: n for e, n in users_wanted.items() if e not in user_ids}))
+        due = datetime.utcnow() + timedelta(days=DEFAULT_LOAN_DAYS)
+        rows = []
+        for idx, book, copy, email in assigned:
+            reservation_id = str(uuid.uuid4())
+            rows.append({
+                "id": reservation_id, "email_user_id": user_ids[email], "book_id": book.id,
+                "copy_id": copy.id, "status": ReservationStatus.ACTIVE, "due_date": due, "renewed_cnt": 0,
+            })
+            results[idx] = _ok(
+                "La reservación se realizó exitosamente.",
+                reservation_id=reservation_id,
+                book_id=book.id, title=book.title,
+                copy_id=copy.id, barcode=copy.barcode, location=copy.location,
+                user_email=email,
+                due_date=due.isoformat(),
+                renewed_cnt=0
+            )
+        await session.execute(
+            update(BookCopy)
+            .where(BookCopy.id.in_([copy.id for _, _, copy, _ in assigned]))
+            .values(status=CopyStatus.RESERVED)
+        )
+        await session.execute(insert(Reservation), rows)
+        await session.commit()
+        USER_IDS.put_many(user_ids)
+        bump_catalog_version()
+        taken: Dict[str, int] = {}
+        for _, book, _, _ in assigned:
+            taken[book.id] = taken.get(book.id, 0) + 1
+        for book_id, n in taken.items():
+            publish_change("reserved", book_id, available_delta=-n)
+    reserved = sum(1 for r in results if r and r["ok"])
+    return _ok(
+        f"Se realizaron {reserved} de {len(items)} reservas.",
+        results=results, reserved=reserved, failed=len(items) - reserved
+    )
+
 async def renew(session: AsyncSession, *, barcode: str, email: str) -> Dict[str, Any]:
     if not (barcode and email):
         return _err("Faltan datos para renovar (barcode, email).", code="MISSING_FIELDS")
-    email_norm = email.strip().lower()
-    r_user = await session.execute(select(EmailUser).where(EmailUser.email == email_norm))
-    user = r_user.scalar_one_or_none()
-    if not user:
+    email_norm = normalize_email(email)
+    user_id = await _find_user_id(session, email_norm)
+    if not user_id:
         return _err("No encontré al usuario.", code="USER_NOT_FOUND")
     r_copy = await session.execute(select(BookCopy).where(BookCopy.barcode == barcode))
     copy = r_copy.scalar_one_or_none()
@@ -138,7 +471,7 @@ async def renew(session: AsyncSession, *, barcode: str, email: str) -> Dict[str,
         return _err("No encontré la copia indicada.", code="COPY_NOT_FOUND")
     r_res = await session.execute(
         select(Reservation).where(
-            and_(Reservation.email_user_id == user.id, Reservation.copy_id == copy.id, Reservation.status == ReservationStatus.ACTIVE)
+            and_(Reservation.email_user_id == user_id, Reservation.copy_id == copy.id, Reservation.status == ReservationStatus.ACTIVE)
         )
     )
     reservation = r_res.scalar_one_or_none()
@@ -150,6 +483,7 @@ async def renew(session: AsyncSession, *, barcode: str, email: str) -> Dict[str,
     reservation.renewed_cnt += 1
     br = await session.execute(select(Book).where(Book.id == reservation.book_id))
     book = br.scalar_one_or_none()
+    # Renovar no cambia la disponibilidad de copias: el catálogo en caché sigue vigente.
     await session.commit()
     await session.refresh(reservation)
     return _ok(
@@ -157,7 +491,7 @@ async def renew(session: AsyncSession, *, barcode: str, email: str) -> Dict[str,
         reservation_id=reservation.id,
         book_id=reservation.book_id, title=(book.title if book else None),
         copy_id=reservation.copy_id, barcode=copy.barcode,
-        user_email=user.email,
+        user_email=email_norm,
         due_date=reservation.due_date.isoformat(),
         renewed_cnt=reservation.renewed_cnt
     )
@@ -165,10 +499,9 @@ async def renew(session: AsyncSession, *, barcode: str, email: str) -> Dict[str,
 async def cancel(session: AsyncSession, *, barcode: str, email: str) -> Dict[str, Any]:
     if not (barcode and email):
         return _err("Faltan datos para cancelar (barcode, email).", code="MISSING_FIELDS")
-    email_norm = email.strip().lower()
-    r_user = await session.execute(select(EmailUser).where(EmailUser.email == email_norm))
-    user = r_user.scalar_one_or_none()
-    if not user:
+    email_norm = normalize_email(email)
+    user_id = await _find_user_id(session, email_norm)
+    if not user_id:
         return _err("No encontré al usuario.", code="USER_NOT_FOUND")
     r_copy = await session.execute(select(BookCopy).where(BookCopy.barcode == barcode))
     copy = r_copy.scalar_one_or_none()
@@ -176,7 +509,7 @@ async def cancel(session: AsyncSession, *, barcode: str, email: str) -> Dict[str
         return _err("No encontré la copia indicada.", code="COPY_NOT_FOUND")
     r = await session.execute(
         select(Reservation).where(
-            and_(Reservation.email_user_id == user.id, Reservation.copy_id == copy.id, Reservation.status == ReservationStatus.ACTIVE)
+            and_(Reservation.email_user_id == user_id, Reservation.copy_id == copy.id, Reservation.status == ReservationStatus.ACTIVE)
         )
     )
     resv = r.scalar_one_or_none()
@@ -184,18 +517,22 @@ async def cancel(session: AsyncSession, *, barcode: str, email: str) -> Dict[str
         return _err("No encontré una reservación activa para esos datos.", code="ACTIVE_RESERVATION_NOT_FOUND")
     resv.status = ReservationStatus.CANCELED
     resv.canceled_at = datetime.utcnow()
-    if copy.status != CopyStatus.AVAILABLE:
+    freed = copy.status != CopyStatus.AVAILABLE
+    if freed:
         copy.status = CopyStatus.AVAILABLE
     br = await session.execute(select(Book).where(Book.id == resv.book_id))
     book = br.scalar_one_or_none()
     await session.commit()
+    bump_catalog_version()
     await session.refresh(resv)
+    if freed:
+        publish_change("canceled", resv.book_id, available_delta=1, barcode=copy.barcode)
     return _ok(
         "La reservación fue cancelada exitosamente.",
         reservation_id=resv.id,
         book_id=resv.book_id, title=(book.title if book else None),
         copy_id=resv.copy_id, barcode=copy.barcode,
-        user_email=user.email,
+        user_email=email_norm,
         canceled_at=(resv.canceled_at.isoformat() if resv.canceled_at else None)
     )
 
@@ -210,12 +547,15 @@ async def delete_book(session: AsyncSession, *, book_id: Optional[str] = None, b
     res_ids = [row[0] for row in r_res_ids]
     if res_ids:
         await session.execute(delete(Reservation).where(Reservation.id.in_(res_ids)))
-    r_copy_ids = await session.execute(select(BookCopy.id).where(BookCopy.book_id == book.id))
-    copy_ids = [row[0] for row in r_copy_ids]
+    r_copies = (await session.execute(select(BookCopy.id, BookCopy.status).where(BookCopy.book_id == book.id))).all()
+    copy_ids = [row.id for row in r_copies]
     if copy_ids:
         await session.execute(delete(BookCopy).where(BookCopy.id.in_(copy_ids)))
     await session.execute(delete(Book).where(Book.id == book.id))
     await session.commit()
+    bump_catalog_version()
+    available = sum(1 for row in r_copies if row.status == CopyStatus.AVAILABLE)
+    publish_change("book_deleted", book.id, available_delta=-available, total_delta=-len(copy_ids))
     return _ok(
         "Libro eliminado exitosamente.",
         book_id=book.id, title=title,
@@ -1,35 +1,125 @@
-from fastapi import APIRouter, Depends, HTTPException
+import asyncio
+import uuid
+from datetime import datetime, timedelta
+from typing import Literal
+from fastapi import APIRouter, Depends, Header, HTTPException, Query, Request, Response
+from fastapi.responses import StreamingResponse
+from pydantic import TypeAdapter
 from sqlalchemy.ext.asyncio import AsyncSession
-from app.deps import get_session
+from app.catalog import VersionedResponseCache, catalog_version, etag_matches
+from app import changes
+from app.config import settings
+from app.db import read_session
+from app.deps import get_session, get_read_session
+from app.export import export_books, export_reservations
+from app.metrics import REGISTRY, CONTENT_TYPE as METRICS_CONTENT_TYPE
+from app.traces import stage_percentiles, to_naive_utc
 
 from app.schemas import (
-    BookIn, BookOut, BookListItem,
+    BookIn, BookOut, BookListItem, BookSearchOut,
     CopyIn, CopyOut,
     ReservationIn, ReservationOut,
+    ReservationBatchIn, ReservationBatchOut, ReservationBatchItemOut,
     RenewalIn, CancelIn,
+    TraceStatsOut,
 )
 
 from app.actions import (
-    list_books, register_book, register_copy,
-    reserve, renew, cancel, delete_book
+    list_books, search_books, register_book, register_copy,
+    reserve, reserve_batch, renew, cancel, delete_book
 )
 
 router = APIRouter()
 
+_book_list_adapter = TypeAdapter(list[BookListItem])
+_responses = VersionedResponseCache(ttl_seconds=settings.CATALOG_CACHE_TTL_SECONDS)
+
 @router.get("/books", response_model=list[BookListItem])
-async def http_list_books(session: AsyncSession = Depends(get_session)):
-    r = await list_books(session)
-    items = (r.get("data") or {}).get("items") or []
-    return [
-        BookListItem(
-            id=it["book_id"],
-            title=it["title"],
-            author=it.get("author"),
-            copies_total=it.get("copies_total", 0),
-            copies_available=it.get("copies_available", 0),
-        )
-        for it in items
-    ]
+async def http_list_books(request: Request):
+    version = catalog_version()
+    cached = _responses.get("books", version)
+    if cached is None:
+        async with read_session() as session:
+            r = await list_books(session)
+        items = (r.get("data") or {}).get("items") or []
+        body = _book_list_adapter.dump_json([
+            BookListItem(
+                id=it["book_id"],
+                title=it["title"],
+                author=it.get("author"),
+                copies_total=it.get("copies_total", 0),
+                copies_available=it.get("copies_available", 0),
+            )
+            for it in items
+        ])
+        cached = _responses.put("books", version, body)
+    headers = {"ETag": cached.etag, "X-Catalog-Version": str(cached.version), "Cache-Control": "no-cache"}
+    if etag_matches(request.headers.get("if-none-match"), cached.etag):
+        return Response(status_code=304, headers=headers)
+    return Response(content=cached.body, media_type="application/json", headers=headers)
+
+@router.get("/books/search", response_model=BookSearchOut)
+async def http_search_books(
+    q: str = Query(..., min_length=1),
+    limit: int = Query(20, ge=1, le=100),
+    offset: int = Query(0, ge=0),
+    session: AsyncSession = Depends(get_read_session),
+):
+    r = await search_books(session, q=q, limit=limit, offset=offset)
+    if not r["ok"]:
+        raise HTTPException(status_code=400, detail=r["message"])
+    d = r["data"]
+    return BookSearchOut(
+        items=[
+            BookListItem(
+                id=it["book_id"],
+                title=it["title"],
+                author=it.get("author"),
+                copies_total=it.get("copies_total", 0),
+                copies_available=it.get("copies_available", 0),
+            )
+            for it in d["items"]
+        ],
+        limit=d["limit"],
+        offset=d["offset"],
+        has_more=d["has_more"],
+    )
+
+async def _sse_events(request: Request, sub: "changes.Subscription", keepalive: float):
+    try:
+        yield b"retry: 3000\n\n"
+        while True:
+            try:
+                raw = await asyncio.wait_for(sub.get(), timeout=keepalive)
+            except asyncio.TimeoutError:
+                if await request.is_disconnected():
+                    break
+                yield b": keep-alive\n\n"
+                continue
+            if raw is None:  # cola desbordada: el cliente reconecta con Last-Event-ID
+                break
+            yield raw
+    finally:
+        sub.close()
+
+@router.get("/books/changes")
+async def http_book_changes(
+    request: Request,
+    book_id: str | None = Query(None, description="Solo cambios de este libro"),
+    last_event_id: str | None = Header(None, alias="Last-Event-ID"),
+):
+    """Flujo SSE de cambios de disponibilidad (deltas de copias disponibles/totales por libro)."""
+    if book_id:
+        try:
+            book_id = str(uuid.UUID(book_id))
+        except ValueError:
+            raise HTTPException(status_code=400, detail="book_id inválido.")
+    sub = changes.BUS.subscribe(book_id=book_id, last_event_id=last_event_id)
+    return StreamingResponse(
+        _sse_events(request, sub, settings.SSE_KEEPALIVE_SECONDS),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
 
 @router.post("/book", response_model=BookOut)
 async def http_create_book(payload: BookIn, session: AsyncSession = Depends(get_session)):
@@ -87,6 +177,31 @@ async def http_create_reservation(payload: ReservationIn, session: AsyncSession
         due_date=d["due_date"],
     )
 
+@router.post("/reservations/batch", response_model=ReservationBatchOut)
+async def http_create_reservations_batch(payload: ReservationBatchIn, session: AsyncSession = Depends(get_session)):
+    r = await reserve_batch(session, items=[it.model_dump() for it in payload.items])
+    if not r["ok"]:
+        raise HTTPException(status_code=400, detail=r["message"])
+    d = r["data"]
+    results = []
+    for idx, item in enumerate(d["results"]):
+        data = item.get("data") or {}
+        results.append(ReservationBatchItemOut(
+            index=idx,
+            ok=item["ok"],
+            code=item.get("code") or None,
+            message=item["message"],
+            reservation=ReservationOut(
+                id=data["reservation_id"],
+                book_id=data["book_id"],
+                copy_id=data["copy_id"],
+                user_email=data["user_email"],
+                status="ACTIVE",
+                due_date=data["due_date"],
+            ) if item["ok"] else None,
+        ))
+    return ReservationBatchOut(reserved=d["reserved"], failed=d["failed"], results=results)
+
 @router.post("/reservation/renewal")
 async def http_renew_reservation(payload: RenewalIn, session: AsyncSession = Depends(get_session)):
     r = await renew(session, barcode=payload.barcode, email=payload.email)
@@ -119,4 +234,43 @@ async def http_delete_book(book_id: str, session: AsyncSession = Depends(get_ses
         code = r.get("code")
         status = 404 if code == "BOOK_NOT_FOUND" else 400
         raise HTTPException(status_code=status, detail=r["message"])
-    return {"detail": r["message"], **(r.get("data") or {})}
\ No newline at end of file
+    return {"detail": r["message"], **(r.get("data") or {})}
+
+_EXPORT_MEDIA_TYPES = {"ndjson": "application/x-ndjson", "csv": "text/csv; charset=utf-8"}
+
+def _export_response(exporter, name: str, fmt: str) -> StreamingResponse:
+    # La sesión vive dentro del generador: se cierra cuando termina el stream, no al salir del endpoint.
+    async def body():
+        async with read_session() as session:
+            async for chunk in exporter(session, fmt):
+                yield chunk
+    return StreamingResponse(
+        body(),
+        media_type=_EXPORT_MEDIA_TYPES[fmt],
+        headers={"Content-Disposition": f'attachment; filename="{name}.{fmt}"'},
+    )
+
+@router.get("/export/books")
+async def http_export_books(format: Literal["ndjson", "csv"] = Query("ndjson")):
+    return _export_response(export_books, "books", format)
+
+@router.get("/export/reservations")
+async def http_export_reservations(format: Literal["ndjson", "csv"] = Query("ndjson")):
+    return _export_response(export_reservations, "reservations", format)
+
+@router.get("/metrics", include_in_schema=False)
+async def http_metrics():
+    return Response(content=REGISTRY.render(), media_type=METRICS_CONTENT_TYPE)
+
+@router.get("/traces/stats", response_model=TraceStatsOut)
+async def http_trace_stats(
+    since: datetime | None = None,
+    until: datetime | None = None,
+    session: AsyncSession = Depends(get_read_session),
+):
+    until = to_naive_utc(until) or datetime.utcnow()
+    since = to_naive_utc(since) or (until - timedelta(hours=1))
+    if since >= until:
+        raise HTTPException(status_code=400, detail="`since` debe ser anterior a `until`.")
+    stages = await stage_percentiles(session, since=since, until=until)
+    return TraceStatsOut(since=since, until=until, stages=stages)
@@ -0,0 +1,205 @@
+"""Carga masiva de copias desde adjuntos CSV/XLSX.
+
+El adjunto llega como flujo de bytes (Graph `$value`) y se interpreta fila por fila:
+CSV se decodifica de forma incremental; XLSX (un zip, que requiere acceso aleatorio)
+se vuelca a un archivo temporal mientras se descarga y luego se recorre con openpyxl
+en modo de solo lectura. Las filas se aplican por lotes con `register_copies_bulk`.
+"""
+import asyncio
+import codecs
+import csv
+import tempfile
+import unicodedata
+from typing import Any, AsyncIterator, Dict, Iterable, List, Optional, Sequence
+from sqlalchemy.ext.asyncio import async_sessionmaker
+from app.actions import register_copies_bulk, _ok, _err
+from app.config import settings
+
+try:
+    import openpyxl
+except ImportError:  # dependencia opcional: pip install "innovati[xlsx]"
+    openpyxl = None
+
+CSV_TYPES = {"text/csv", "application/csv", "application/vnd.ms-excel"}
+XLSX_TYPE = "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet"
+
+# Encabezados aceptados (sin tildes ni mayúsculas) -> campo de la fila.
+HEADER_ALIASES = {
+    "book_id": "book_id", "id_libro": "book_id", "libro_id": "book_id",
+    "title": "title", "titulo": "title", "libro": "title", "book_title": "title",
+    "barcode": "barcode", "codigo": "barcode", "codigo_de_barras": "barcode", "codigo_barras": "barcode",
+    "location": "location", "ubicacion": "location",
+}
+
+class BulkImportError(ValueError):
+    """El archivo no se puede procesar (formato, encabezados o tamaño)."""
+    def __init__(self, msg: str, code: str):
+        super().__init__(msg)
+        self.code = code
+
+def attachment_format(att: Dict[str, Any]) -> Optional[str]:
+    """'csv' | 'xlsx' si el adjunto es una planilla de carga masiva; None en otro caso."""
+    name = (att.get("name") or "").lower()
+    ctype = (att.get("contentType") or "").lower()
+    if att.get("isInline"):
+        return None
+    if name.endswith(".csv") or (ctype in CSV_TYPES and not name.endswith(".xls")):
+        return "csv"
+    if name.endswith(".xlsx") or ctype == XLSX_TYPE:
+        return "xlsx"
+    return None
+
+def _norm_header(value: Any) -> str:
+    text = unicodedata.normalize("NFKD", str(value or "")).encode("ascii", "ignore").decode()
+    return "_".join(text.strip().lower().replace("-", " ").split())
+
+def _header_map(header: Sequence[Any]) -> List[Optional[str]]:
+    fields = [HEADER_ALIASES.get(_norm_header(h)) for h in header]
+    present = set(fields)
+    if not {"barcode", "location"} <= present or not present & {"book_id", "title"}:
+        raise BulkImportError(
+            "Encabezados inválidos: se requieren barcode, location y book_id o título.", "INVALID_HEADER"
+        )
+    return fields
+
+def _to_row(fields: List[Optional[str]], values: Sequence[Any], row_number: int) -> Optional[Dict[str, Any]]:
+    if not any(v not in (None, "") and str(v).strip() for v in values):
+        return None
+    row: Dict[str, Any] = {"row": row_number}
+    for field, value in zip(fields, values):
+        if field and value is not None:
+            # Excel guarda códigos numéricos como float (1234567890.0).
+            if isinstance(value, float) and value.is_integer():
+                value = int(value)
+            row[field] = str(value).strip()
+    return row
+
+async def iter_csv_rows(chunks: AsyncIterator[bytes]) -> AsyncIterator[Dict[str, Any]]:
+    """Filas de un CSV (UTF-8, con o sin BOM; separador `,` o `;`) a medida que llegan los bytes."""
+    decoder = codecs.getincrementaldecoder("utf-8-sig")(errors="replace")
+    buf = ""
+    record = ""
+    fields: Optional[List[Optional[str]]] = None
+    delimiter = ","
+    line_no = 0
+
+    def _records(lines: Iterable[str]):
+        # Un registro puede abarcar varias líneas si un campo entre comillas trae saltos de línea.
+        nonlocal record
+        for line in lines:
+            record += line
+            if record.count('"') % 2 == 0:
+                out, record = record, ""
+                yield out
+
+    async def _lines():
+        nonlocal buf
+        async for chunk in chunks:
+            buf += decoder.decode(chunk)
+            *complete, buf = buf.split("\n")
+            for line in complete:
+                yield line + "\n"
+        buf += decoder.decode(b"", final=True)
+        if buf:
+            yield buf
+
+    async for line in _lines():
+        for rec in _records([line]):
+            line_no += 1  # número de registro, como la fila que muestra una planilla
+            if fields is None:
+                delimiter = ";" if rec.count(";") > rec.count(",") else ","
+                fields = _header_map(next(csv.reader([rec], delimiter=delimiter), []))
+                continue
+            values = next(csv.reader([rec], delimiter=delimiter), [])
+            row = _to_row(fields, values, line_no)
+            if row:
+                yield row
+    if fields is None:
+        raise BulkImportError("El archivo está vacío.", "EMPTY_FILE")
+
+async def limit_bytes(chunks: AsyncIterator[bytes], max_bytes: int) -> AsyncIterator[bytes]:
+    """Corta el flujo en cuanto supera `max_bytes` reales (el `size` de Graph puede faltar o no coincidir)."""
+    seen = 0
+    async for chunk in chunks:
+        seen += len(chunk)
+        if seen > max_bytes:
+            raise BulkImportError(f"El archivo supera el máximo de {max_bytes // (1024 * 1024)} MB.", "FILE_TOO_LARGE")
+        yield chunk
+
+async def iter_xlsx_rows(chunks: AsyncIterator[bytes], max_rows: Optional[int] = None) -> AsyncIterator[Dict[str, Any]]:
+    """Filas de la primera hoja de un XLSX. Con `max_rows`, se rechaza por la dimensión declarada antes de recorrerla."""
+    if openpyxl is None:
+        raise BulkImportError("Para procesar XLSX se requiere openpyxl (pip install openpyxl).", "XLSX_UNSUPPORTED")
+    spool = tempfile.SpooledTemporaryFile(max_size=2 * 1024 * 1024)
+    try:
+        async for chunk in chunks:
+            spool.write(chunk)
+        spool.seek(0)
+        try:
+            wb = await asyncio.to_thread(openpyxl.load_workbook, spool, read_only=True, data_only=True)
+        except Exception as ex:
+            raise BulkImportError(f"No se pudo leer el XLSX: {ex}", "INVALID_FILE") from ex
+        try:
+            ws = wb.worksheets[0]
+            if max_rows is not None and (ws.max_row or 0) - 1 > max_rows:
+                raise BulkImportError(f"El archivo supera el máximo de {max_rows} filas.", "TOO_MANY_ROWS")
+            rows = ws.iter_rows(values_only=True)
+            header = next(rows, None)
+            if header is None:
+                raise BulkImportError("El archivo está vacío.", "EMPTY_FILE")
+            fields = _header_map(header)
+            for n, values in enumerate(rows, start=2):
+                row = _to_row(fields, values, n)
+                if row:
+                    yield row
+        finally:
+            wb.close()
+    finally:
+        spool.close()
+
+async def import_copies(
+    session_factory: async_sessionmaker,
+    chunks: AsyncIterator[bytes],
+    fmt: str,
+    *,
+    batch_rows: int = settings.BULK_BATCH_ROWS,
+    max_rows: int = settings.BULK_MAX_ROWS,
+    max_bytes: int = settings.BULK_MAX_ATTACHMENT_BYTES,
+) -> Dict[str, Any]:
+    """Aplica las filas de un adjunto por lotes de `batch_rows` (una transacción por lote)."""
+    chunks = limit_bytes(chunks, max_bytes)
+    rows_iter = iter_csv_rows(chunks) if fmt == "csv" else iter_xlsx_rows(chunks, max_rows)
+    inserted = total = 0
+    errors: List[Dict[str, Any]] = []
+    batch: List[Dict[str, Any]] = []
+
+    async def _apply():
+        nonlocal inserted
+        async with session_factory() as session:
+            r = await register_copies_bulk(session, rows=batch)
+        data = r.get("data") or {}
+        inserted += data.get("inserted", 0)
+        errors.extend(data.get("errors", []))
+
+    try:
+        async for row in rows_iter:
+            total += 1
+            if total > max_rows:
+                if batch:
+                    await _apply()
+                return _err(f"El archivo supera el máximo de {max_rows} filas; se procesaron las primeras {max_rows}.", code="TOO_MANY_ROWS",
+                            inserted=inserted, total=total - 1, errors=errors)
+            batch.append(row)
+            if len(batch) >= batch_rows:
+                await _apply()
+                batch = []
+        if batch:
+            await _apply()
+    except BulkImportError as ex:
+        return _err(str(ex), code=ex.code, inserted=inserted, total=total, errors=errors)
+    if not total:
+        return _err("El archivo no tiene filas.", code="EMPTY_FILE", inserted=0, total=0, errors=[])
+    return _ok(
+        f"Se registraron {inserted} de {total} copias.",
+        inserted=inserted, failed=total - inserted, total=total, errors=errors
+    )
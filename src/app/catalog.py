@@ -0,0 +1,56 @@
+import hashlib
+import time
+from dataclasses import dataclass
+from typing import Callable, Dict, Optional
+
+# Versión del catálogo en este proceso: la incrementa cada acción que modifica datos (app.actions).
+_version = 0
+
+def catalog_version() -> int:
+    return _version
+
+def bump_catalog_version() -> int:
+    global _version
+    _version += 1
+    return _version
+
+def etag_matches(if_none_match: Optional[str], etag: str) -> bool:
+    if not if_none_match:
+        return False
+    for candidate in if_none_match.split(","):
+        candidate = candidate.strip()
+        if candidate == "*" or candidate.removeprefix("W/") == etag:
+            return True
+    return False
+
+@dataclass(frozen=True)
+class CachedResponse:
+    version: int
+    body: bytes
+    etag: str
+    stored_at: float
+
+class VersionedResponseCache:
+    """Respuestas ya serializadas por versión de catálogo, con TTL corto.
+
+    El TTL acota cuánto puede servirse una respuesta si el cambio ocurrió en otra
+    réplica (o llegó tarde a la réplica de lectura). El ETag es un hash del contenido,
+    así que tras expirar, si nada cambió, el cliente sigue recibiendo 304.
+    """
+
+    def __init__(self, ttl_seconds: float, clock: Callable[[], float] = time.monotonic):
+        self.ttl = ttl_seconds
+        self._clock = clock
+        self._entries: Dict[str, CachedResponse] = {}
+
+    def get(self, key: str, version: int) -> Optional[CachedResponse]:
+        entry = self._entries.get(key)
+        if entry is None or entry.version != version or self._clock() - entry.stored_at > self.ttl:
+            return None
+        return entry
+
+    def put(self, key: str, version: int, body: bytes) -> CachedResponse:
+        etag = f'"{hashlib.sha1(body).hexdigest()[:20]}"'
+        entry = CachedResponse(version=version, body=body, etag=etag, stored_at=self._clock())
+        self._entries[key] = entry
+        return entry
@@ -0,0 +1,143 @@
+"""Bus de cambios de disponibilidad (en proceso) para GET /books/changes (SSE).
+
+Las acciones publican deltas después de confirmar la transacción. Cada evento se
+serializa una sola vez y se reparte a las colas de los suscriptores interesados
+(todos o los de un libro), así el costo por suscriptor es un `put_nowait`.
+Un registro circular con los últimos eventos permite reanudar con `Last-Event-ID`.
+
+Es por proceso: con varias réplicas, cada una publica los cambios que ejecuta. Los
+ids son `<época>-<secuencia>`, con una época aleatoria por proceso, así un
+`Last-Event-ID` emitido por otra réplica (o antes de un reinicio) se detecta y el
+cliente recibe `reset`. Los cambios hechos por correo solo se publican en la réplica
+que tiene el lease del poller (ver `app.worker.leader`); un suscriptor conectado a
+otra réplica solo ve los cambios hechos por la API en esa réplica.
+"""
+import asyncio
+import json
+import uuid
+from collections import deque
+from dataclasses import dataclass, field
+from datetime import datetime
+from typing import Any, Deque, Dict, List, Optional, Set, Tuple
+from app.config import settings
+
+def parse_event_id(value: Optional[str]) -> Optional[Tuple[str, int]]:
+    """`"<época>-<seq>"` -> (época, seq); None si el formato no es válido."""
+    epoch, sep, seq = (value or "").strip().rpartition("-")
+    if not sep or not epoch or not seq.isdigit():
+        return None
+    return epoch, int(seq)
+
+@dataclass(frozen=True)
+class ChangeEvent:
+    epoch: str
+    seq: int
+    type: str
+    book_id: str
+    available_delta: int
+    total_delta: int
+    at: str
+    data: Dict[str, Any] = field(default_factory=dict)
+
+    @property
+    def id(self) -> str:
+        return f"{self.epoch}-{self.seq}"
+
+    def payload(self) -> Dict[str, Any]:
+        return {
+            "id": self.id, "type": self.type, "book_id": self.book_id,
+            "available_delta": self.available_delta, "total_delta": self.total_delta,
+            "at": self.at, **self.data,
+        }
+
+    def encode(self) -> bytes:
+        return f"id: {self.id}\nevent: availability\ndata: {json.dumps(self.payload(), ensure_ascii=False)}\n\n".encode("utf-8")
+
+class Subscription:
+    def __init__(self, bus: "ChangeBus", book_id: Optional[str], maxsize: int):
+        self.bus = bus
+        self.book_id = book_id
+        self.queue: asyncio.Queue = asyncio.Queue(maxsize=maxsize)
+        self.overflowed = False
+
+    def _offer(self, item) -> None:
+        try:
+            self.queue.put_nowait(item)
+        except asyncio.QueueFull:
+            # Suscriptor lento: se le corta el flujo y reanuda con Last-Event-ID desde el registro.
+            self.overflowed = True
+            self.bus._remove(self)
+            while not self.queue.empty():
+                self.queue.get_nowait()
+            self.queue.put_nowait(None)
+
+    async def get(self) -> Optional[bytes]:
+        """Siguiente evento ya codificado; None si el flujo se cortó."""
+        return await self.queue.get()
+
+    def close(self) -> None:
+        self.bus._remove(self)
+
+class ChangeBus:
+    def __init__(self, *, log_size: int = settings.CHANGE_LOG_SIZE, queue_size: int = settings.CHANGE_SUBSCRIBER_QUEUE,
+                 epoch: Optional[str] = None):
+        self.epoch = epoch or uuid.uuid4().hex[:8]
+        self.queue_size = max(1, queue_size)
+        self._log: Deque[tuple[ChangeEvent, bytes]] = deque(maxlen=max(1, log_size))
+        self._seq = 0
+        self._subs: Dict[Optional[str], Set[Subscription]] = {}
+
+    @property
+    def last_id(self) -> str:
+        return f"{self.epoch}-{self._seq}"
+
+    def subscribers(self) -> int:
+        return sum(len(s) for s in self._subs.values())
+
+    def publish(self, type: str, book_id: str, *, available_delta: int = 0, total_delta: int = 0, **data) -> ChangeEvent:
+        self._seq += 1
+        ev = ChangeEvent(
+            epoch=self.epoch, seq=self._seq, type=type, book_id=str(book_id),
+            available_delta=available_delta, total_delta=total_delta,
+            at=datetime.utcnow().isoformat() + "Z", data=data,
+        )
+        raw = ev.encode()
+        self._log.append((ev, raw))
+        for sub in list(self._subs.get(None, ())) + list(self._subs.get(ev.book_id, ())):
+            sub._offer(raw)
+        return ev
+
+    def subscribe(self, *, book_id: Optional[str] = None, last_event_id: Optional[str] = None) -> Subscription:
+        """Nuevo suscriptor. Con `last_event_id` se le reenvían los eventos posteriores que sigan en el registro;
+        si ya no están (hueco) o el id no es de este proceso, recibe primero un evento `reset` para que recargue GET /books."""
+        sub = Subscription(self, book_id, self.queue_size)
+        if last_event_id:
+            parsed = parse_event_id(last_event_id)
+            oldest = self._log[0][0].seq if self._log else self._seq + 1
+            # Reanudable solo si el id es de esta época y está entre el anterior al más viejo retenido y el último.
+            if parsed is None or parsed[0] != self.epoch or not oldest - 1 <= parsed[1] <= self._seq:
+                reset = json.dumps({"last_event_id": last_event_id, "oldest_available": f"{self.epoch}-{oldest}"})
+                sub.queue.put_nowait(f"id: {self.last_id}\nevent: reset\ndata: {reset}\n\n".encode("utf-8"))
+            elif parsed[1] < self._seq:
+                backlog = self.replay(parsed[1], book_id)
+                if len(backlog) >= sub.queue.maxsize:
+                    sub.queue = asyncio.Queue(maxsize=len(backlog) + self.queue_size)
+                for raw in backlog:
+                    sub.queue.put_nowait(raw)
+        self._subs.setdefault(book_id, set()).add(sub)
+        return sub
+
+    def replay(self, after_seq: int, book_id: Optional[str] = None) -> List[bytes]:
+        return [raw for ev, raw in self._log if ev.seq > after_seq and (book_id is None or ev.book_id == book_id)]
+
+    def _remove(self, sub: Subscription) -> None:
+        subs = self._subs.get(sub.book_id)
+        if subs is not None:
+            subs.discard(sub)
+            if not subs:
+                del self._subs[sub.book_id]
+
+BUS = ChangeBus()
+
+def publish_change(type: str, book_id: str, *, available_delta: int = 0, total_delta: int = 0, **data) -> ChangeEvent:
+    return BUS.publish(type, book_id, available_delta=available_delta, total_delta=total_delta, **data)
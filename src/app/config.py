@@ -17,6 +17,21 @@ class Settings:
 
     # DB 
     DATABASE_URL: str = os.getenv("DATABASE_URL")
+    # Réplica de solo lectura (opcional). Si no se define, las lecturas van al primario.
+    DATABASE_READ_URL: str | None = os.getenv("DATABASE_READ_URL")
+    # Espera máxima al conectar a la réplica y segundos que se evita tras un fallo (se lee del primario)
+    DATABASE_READ_CONNECT_TIMEOUT_SECONDS: float = float(os.getenv("DATABASE_READ_CONNECT_TIMEOUT_SECONDS", "2"))
+    DATABASE_READ_COOLDOWN_SECONDS: float = float(os.getenv("DATABASE_READ_COOLDOWN_SECONDS", "30"))
+
+    # Caché de respuestas de GET /books (segundos)
+    CATALOG_CACHE_TTL_SECONDS: float = float(os.getenv("CATALOG_CACHE_TTL_SECONDS", "10"))
+    # Usuarios (email -> id) recordados en memoria por proceso; 0 desactiva el caché
+    USER_CACHE_SIZE: int = int(os.getenv("USER_CACHE_SIZE", "10000"))
+
+    # GET /books/changes (SSE): eventos retenidos para Last-Event-ID, cola por suscriptor y keep-alive
+    CHANGE_LOG_SIZE: int = int(os.getenv("CHANGE_LOG_SIZE", "1000"))
+    CHANGE_SUBSCRIBER_QUEUE: int = int(os.getenv("CHANGE_SUBSCRIBER_QUEUE", "256"))
+    SSE_KEEPALIVE_SECONDS: float = float(os.getenv("SSE_KEEPALIVE_SECONDS", "15"))
 
     # Microsoft Graph
     GRAPH_TENANT_ID: str | None = os.getenv("GRAPH_TENANT_ID")
@@ -24,9 +39,50 @@ class Settings:
     GRAPH_CLIENT_SECRET: str | None = os.getenv("GRAPH_CLIENT_SECRET")
     GRAPH_USER_UPN: str | None = os.getenv("GRAPH_USER_UPN") 
     GRAPH_POLL_INTERVAL_SECONDS: int = int(os.getenv("GRAPH_POLL_INTERVAL_SECONDS", "60"))
+    # Varios buzones (uno por sede): "norte@x.org,sur@x.org:120" (":segundos" fija el intervalo de ese buzón).
+    # Si no se define, se usa GRAPH_USER_UPN.
+    GRAPH_USER_UPNS: str | None = os.getenv("GRAPH_USER_UPNS")
+    # Máximo de correos por buzón en cada turno (reparto justo entre buzones) y buzones atendidos en paralelo
+    GRAPH_MAILBOX_QUOTA: int = int(os.getenv("GRAPH_MAILBOX_QUOTA", "5"))
+    GRAPH_MAILBOX_CONCURRENCY: int = int(os.getenv("GRAPH_MAILBOX_CONCURRENCY", "4"))
+    # Conexiones HTTP a Graph: HTTP/2 (multiplexado) y límites del pool/keep-alive
+    GRAPH_HTTP2: bool = _as_bool(os.getenv("GRAPH_HTTP2"), True)
+    GRAPH_TIMEOUT_SECONDS: float = float(os.getenv("GRAPH_TIMEOUT_SECONDS", "20"))
+    GRAPH_MAX_CONNECTIONS: int = int(os.getenv("GRAPH_MAX_CONNECTIONS", "10"))
+    GRAPH_MAX_KEEPALIVE_CONNECTIONS: int = int(os.getenv("GRAPH_MAX_KEEPALIVE_CONNECTIONS", "5"))
+    GRAPH_KEEPALIVE_EXPIRY_SECONDS: float = float(os.getenv("GRAPH_KEEPALIVE_EXPIRY_SECONDS", "60"))
+    # El token se renueva en segundo plano este tiempo antes de vencer
+    GRAPH_TOKEN_REFRESH_MARGIN_SECONDS: float = float(os.getenv("GRAPH_TOKEN_REFRESH_MARGIN_SECONDS", "300"))
 
     # Habilitar/deshabilitar el poller
     ENABLE_EMAIL_POLLER: bool = _as_bool(os.getenv("ENABLE_EMAIL_POLLER"), False)
+    # Con varias réplicas, solo la que tiene el lease (tabla leader_lease) ejecuta el poller
+    LEADER_ELECTION: bool = _as_bool(os.getenv("LEADER_ELECTION"), True)
+    LEADER_LEASE_TTL_SECONDS: float = float(os.getenv("LEADER_LEASE_TTL_SECONDS", "15"))
+    LEADER_RENEW_SECONDS: float = float(os.getenv("LEADER_RENEW_SECONDS", "5"))
+    # Archivo .ndjson.gz donde el poller graba cada correo procesado (para benchmarks.replay). Vacío = sin captura
+    POLLER_CAPTURE_PATH: str | None = os.getenv("POLLER_CAPTURE_PATH") or None
+    # Respuestas en HTML (si no, texto plano) y libros por página en las respuestas de listado
+    REPLY_HTML: bool = _as_bool(os.getenv("REPLY_HTML"), True)
+    REPLY_LIST_PAGE_SIZE: int = int(os.getenv("REPLY_LIST_PAGE_SIZE", "20"))
+
+    # Protección del buzón: límite por remitente y fusión de solicitudes repetidas
+    SENDER_BURST: int = int(os.getenv("SENDER_BURST", "5"))
+    SENDER_REFILL_PER_HOUR: float = float(os.getenv("SENDER_REFILL_PER_HOUR", "30"))
+    DUPLICATE_WINDOW_SECONDS: int = int(os.getenv("DUPLICATE_WINDOW_SECONDS", "600"))
+
+    # Registro de correos procesados (email_log)
+    EMAIL_LOG_RETENTION_DAYS: int = int(os.getenv("EMAIL_LOG_RETENTION_DAYS", "30"))  # 0 = sin poda
+    EMAIL_LOG_ARCHIVE: bool = _as_bool(os.getenv("EMAIL_LOG_ARCHIVE"), False)
+    EMAIL_LOG_PRUNE_BATCH: int = int(os.getenv("EMAIL_LOG_PRUNE_BATCH", "1000"))
+    EMAIL_LOG_PRUNE_INTERVAL_SECONDS: int = int(os.getenv("EMAIL_LOG_PRUNE_INTERVAL_SECONDS", "3600"))
+    EMAIL_LOG_FLUSH_SECONDS: float = float(os.getenv("EMAIL_LOG_FLUSH_SECONDS", "5"))
+    EMAIL_LOG_FLUSH_BATCH: int = int(os.getenv("EMAIL_LOG_FLUSH_BATCH", "100"))
+
+    # Carga masiva de copias por adjunto CSV/XLSX
+    BULK_MAX_ATTACHMENT_BYTES: int = int(os.getenv("BULK_MAX_ATTACHMENT_BYTES", str(10 * 1024 * 1024)))
+    BULK_MAX_ROWS: int = int(os.getenv("BULK_MAX_ROWS", "10000"))
+    BULK_BATCH_ROWS: int = int(os.getenv("BULK_BATCH_ROWS", "1000"))
 
     # Gemini
     GEMINI_API_KEY: str | None = os.getenv("GEMINI_API_KEY")
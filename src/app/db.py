@@ -1,3 +1,8 @@
+import time
+from contextlib import asynccontextmanager
+from typing import Any, AsyncIterator, Dict
+from sqlalchemy.engine import make_url
+from sqlalchemy.exc import DBAPIError
 from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker, AsyncSession
 from sqlalchemy.orm import DeclarativeBase
 from app.config import settings
@@ -9,7 +14,68 @@ engine = create_async_engine(settings.DATABASE_URL, echo=False, future=True, poo
 
 SessionLocal = async_sessionmaker(engine, expire_on_commit=False, class_=AsyncSession)
 
+def _connect_timeout_args(url: str, timeout: float) -> Dict[str, Any]:
+    """`connect_args` con timeout de conexión según el driver (sin él se espera el del sistema operativo)."""
+    driver = make_url(url).get_driver_name()
+    if driver == "asyncpg":
+        return {"timeout": timeout}
+    if driver.startswith("psycopg"):
+        return {"connect_timeout": max(1, int(timeout))}
+    return {}
+
+# Réplica de lectura: si DATABASE_READ_URL no está definida, apunta al mismo engine/sesiones del primario.
+read_engine = (
+    create_async_engine(
+        settings.DATABASE_READ_URL, echo=False, future=True, pool_pre_ping=True, pool_recycle=1800,
+        connect_args=_connect_timeout_args(settings.DATABASE_READ_URL, settings.DATABASE_READ_CONNECT_TIMEOUT_SECONDS),
+    )
+    if settings.DATABASE_READ_URL else engine
+)
+# Tras un fallo de la réplica, las lecturas van directo al primario hasta este instante (time.monotonic()).
+_replica_down_until = 0.0
+
+ReadSessionLocal = (
+    async_sessionmaker(read_engine, expire_on_commit=False, class_=AsyncSession)
+    if read_engine is not engine else SessionLocal
+)
+
+@asynccontextmanager
+async def read_session(*, fresh: bool = False) -> AsyncIterator[AsyncSession]:
+    """Sesión para consultas de solo lectura.
+
+    Usa la réplica cuando está configurada y disponible. Con ``fresh=True``
+    (read-your-writes) o si la réplica no responde, cae al primario; tras un fallo
+    la réplica se omite durante DATABASE_READ_COOLDOWN_SECONDS.
+    """
+    global _replica_down_until
+    session = None
+    if not fresh and ReadSessionLocal is not SessionLocal and time.monotonic() >= _replica_down_until:
+        session = ReadSessionLocal()
+        try:
+            await session.connection()
+        except (DBAPIError, OSError) as ex:
+            await session.close()
+            session = None
+            _replica_down_until = time.monotonic() + settings.DATABASE_READ_COOLDOWN_SECONDS
+            print(f"[db] Réplica no disponible; lecturas al primario por {settings.DATABASE_READ_COOLDOWN_SECONDS:.0f}s: {ex}")
+    if session is None:
+        session = SessionLocal()
+    async with session:
+        yield session
+
+def dialect_insert(session: AsyncSession, model):
+    """`insert()` del dialecto de la sesión (SQLite/PostgreSQL), con soporte de ON CONFLICT."""
+    if session.bind.dialect.name == "postgresql":
+        from sqlalchemy.dialects.postgresql import insert
+    else:
+        from sqlalchemy.dialects.sqlite import insert
+    return insert(model)
+
 async def init_db():
-    from app import models 
+    from app import models
+    from app.migrations import upgrade
+    from app.search import ensure_search_index
     async with engine.begin() as conn:
         await conn.run_sync(Base.metadata.create_all)
+        await conn.run_sync(upgrade)
+        await conn.run_sync(ensure_search_index)
@@ -1,7 +1,16 @@
+import asyncio
 import time
-from typing import Any, Dict, List, Optional
+from typing import Any, AsyncIterator, Awaitable, Callable, Dict, List, Optional
 import httpx
 import re
+from app.config import settings
+from app.metrics import GRAPH_REQUEST_SECONDS, GRAPH_TOKEN_REFRESH_SECONDS
+
+try:
+    import h2  # noqa: F401  (extra httpx[http2])
+    _HTTP2_AVAILABLE = True
+except ImportError:
+    _HTTP2_AVAILABLE = False
 
 class GraphClient:
     def __init__(
@@ -9,9 +18,13 @@ class GraphClient:
         tenant_id: str,
         client_id: str,
         client_secret: str,
-        user_upn: str,
+        user_upn: Optional[str] = None,
         base_url: str = "https://graph.microsoft.com/v1.0",
         token_url_tpl: str = "https://login.microsoftonline.com/{tenant}/oauth2/v2.0/token",
+        transport: Optional[httpx.AsyncBaseTransport] = None,
+        refresh_margin: float = settings.GRAPH_TOKEN_REFRESH_MARGIN_SECONDS,
+        clock: Callable[[], float] = time.time,
+        sleep: Callable[[float], Awaitable[None]] = asyncio.sleep,
     ):
         self.tenant_id = tenant_id
         self.client_id = client_id
@@ -19,73 +32,167 @@ class GraphClient:
         self.user_upn = user_upn
         self.base_url = base_url
         self.token_url = token_url_tpl.format(tenant=tenant_id)
+        self.refresh_margin = refresh_margin
+        # Reloj y espera inyectables para probar la renovación sin esperar tiempo real.
+        self._clock = clock
+        self._sleep = sleep
 
         self._access_token: Optional[str] = None
-        self._exp_epoch: float = 0.0
-        self._http = httpx.AsyncClient(timeout=20)
+        self._valid_until: float = 0.0
+        self._renew_at: float = 0.0
+        # Single-flight: solo una corrutina pide token a la vez; las demás esperan y reutilizan el resultado.
+        self._token_lock = asyncio.Lock()
+        self._renewer: Optional[asyncio.Task] = None
+        http2 = settings.GRAPH_HTTP2 and _HTTP2_AVAILABLE
+        if settings.GRAPH_HTTP2 and not _HTTP2_AVAILABLE:
+            print("[graph] Paquete h2 no instalado (httpx[http2]); se usa HTTP/1.1.")
+        self._http = httpx.AsyncClient(
+            timeout=settings.GRAPH_TIMEOUT_SECONDS,
+            http2=http2,
+            limits=httpx.Limits(
+                max_connections=settings.GRAPH_MAX_CONNECTIONS,
+                max_keepalive_connections=settings.GRAPH_MAX_KEEPALIVE_CONNECTIONS,
+                keepalive_expiry=settings.GRAPH_KEEPALIVE_EXPIRY_SECONDS,
+            ),
+            transport=transport,
+        )
+
+    async def start(self) -> None:
+        """Obtiene el primer token y arranca su renovación en segundo plano."""
+        if self._renewer is None or self._renewer.done():
+            self._renewer = asyncio.create_task(self._renew_loop())
+        await self._get_token()
 
     async def aclose(self):
+        if self._renewer is not None:
+            self._renewer.cancel()
+            try:
+                await self._renewer
+            except asyncio.CancelledError:
+                pass
+            self._renewer = None
         await self._http.aclose()
 
-    async def _get_token(self) -> str:
-        now = time.time()
-        if self._access_token and now < (self._exp_epoch - 60):
-            return self._access_token
-
+    async def _fetch_token(self) -> str:
         data = {
             "client_id": self.client_id,
             "client_secret": self.client_secret,
             "scope": "https://graph.microsoft.com/.default",
             "grant_type": "client_credentials",
         }
-        resp = await self._http.post(self.token_url, data=data)
+        now = self._clock()
+        with GRAPH_TOKEN_REFRESH_SECONDS.time():
+            resp = await self._http.post(self.token_url, data=data)
         resp.raise_for_status()
         payload = resp.json()
+        ttl = int(payload.get("expires_in", 3600))
         self._access_token = payload["access_token"]
-        self._exp_epoch = now + int(payload.get("expires_in", 3600))
+        self._valid_until = now + ttl - min(60, ttl * 0.1)
+        # Renovación proactiva: `refresh_margin` antes de vencer, pero nunca antes de la mitad de la vida del token.
+        self._renew_at = now + ttl - min(self.refresh_margin, ttl / 2)
         return self._access_token
 
+    async def _get_token(self) -> str:
+        if self._access_token and self._clock() < self._valid_until:
+            return self._access_token
+        async with self._token_lock:
+            if self._access_token and self._clock() < self._valid_until:
+                return self._access_token
+            return await self._fetch_token()
+
+    async def _renew_loop(self) -> None:
+        while True:
+            await self._sleep(max(0.0, self._renew_at - self._clock()))
+            try:
+                async with self._token_lock:
+                    # Una llamada en línea pudo renovarlo mientras tanto.
+                    if self._clock() >= self._renew_at:
+                        await self._fetch_token()
+            except Exception as ex:
+                # Se reintenta mientras el token actual siga vigente; si vence, las llamadas lo piden en línea.
+                print(f"[graph] No se pudo renovar el token: {ex}")
+                await self._sleep(min(30.0, max(5.0, (self._valid_until - self._clock()) / 4)))
+
+    def _mailbox(self, user_upn: Optional[str]) -> str:
+        # Un mismo cliente (pool HTTP y token de la app) sirve a varios buzones.
+        upn = user_upn or self.user_upn
+        if not upn:
+            raise ValueError("Falta el buzón (user_upn).")
+        return f"{self.base_url}/users/{upn}"
+
     async def _auth_headers(self) -> Dict[str, str]:
         token = await self._get_token()
         return {"Authorization": f"Bearer {token}"}
 
-    async def list_unread_messages(self, top: int = 5) -> List[Dict[str, Any]]:
-        url = f"{self.base_url}/users/{self.user_upn}/mailFolders/inbox/messages"
+    async def list_unread_messages(self, top: int = 5, *, user_upn: Optional[str] = None) -> List[Dict[str, Any]]:
+        url = f"{self._mailbox(user_upn)}/mailFolders/inbox/messages"
         params = {
             "$filter": "isRead eq false",
             "$orderby": "receivedDateTime desc",
             "$top": str(top),
             "$select": "id,subject,from,receivedDateTime,bodyPreview",
         }
-        resp = await self._http.get(url, headers=await self._auth_headers(), params=params)
+        headers = await self._auth_headers()
+        with GRAPH_REQUEST_SECONDS.labels("list").time():
+            resp = await self._http.get(url, headers=headers, params=params)
         resp.raise_for_status()
         return resp.json().get("value", [])
 
-    async def send_mail(self, to_email: str, subject: str, body_text: str) -> None:
-        url = f"{self.base_url}/users/{self.user_upn}/sendMail"
+    async def send_mail(self, to_email: str, subject: str, body_text: str, *, body_html: Optional[str] = None,
+                        user_upn: Optional[str] = None) -> None:
+        """Envía un correo; con `body_html` el cuerpo va en HTML (Graph admite un solo cuerpo por mensaje)."""
+        url = f"{self._mailbox(user_upn)}/sendMail"
+        body = {"contentType": "HTML", "content": body_html} if body_html else {"contentType": "Text", "content": body_text}
         payload = {
             "message": {
                 "subject": subject,
-                "body": {"contentType": "Text", "content": body_text},
+                "body": body,
                 "toRecipients": [{"emailAddress": {"address": to_email}}],
             }
         }
-        resp = await self._http.post(url, headers=await self._auth_headers(), json=payload)
+        headers = await self._auth_headers()
+        with GRAPH_REQUEST_SECONDS.labels("send").time():
+            resp = await self._http.post(url, headers=headers, json=payload)
         resp.raise_for_status()
 
-    async def mark_as_read(self, message_id: str, is_read: bool = True) -> None:
-        url = f"{self.base_url}/users/{self.user_upn}/messages/{message_id}"
+    async def mark_as_read(self, message_id: str, is_read: bool = True, *, user_upn: Optional[str] = None) -> None:
+        url = f"{self._mailbox(user_upn)}/messages/{message_id}"
         payload = {"isRead": is_read}
-        resp = await self._http.patch(url, headers=await self._auth_headers(), json=payload)
+        headers = await self._auth_headers()
+        with GRAPH_REQUEST_SECONDS.labels("mark").time():
+            resp = await self._http.patch(url, headers=headers, json=payload)
         resp.raise_for_status()
 
-    async def get_message(self, message_id: str) -> dict:
-        url = f"{self.base_url}/users/{self.user_upn}/messages/{message_id}"
-        params = {"$select": "id,subject,from,receivedDateTime,body,bodyPreview"}
-        resp = await self._http.get(url, headers=await self._auth_headers(), params=params)
+    async def get_message(self, message_id: str, *, user_upn: Optional[str] = None) -> dict:
+        url = f"{self._mailbox(user_upn)}/messages/{message_id}"
+        params = {"$select": "id,subject,from,receivedDateTime,body,bodyPreview,internetMessageHeaders,hasAttachments"}
+        headers = await self._auth_headers()
+        with GRAPH_REQUEST_SECONDS.labels("get").time():
+            resp = await self._http.get(url, headers=headers, params=params)
         resp.raise_for_status()
         return resp.json()
 
+    async def list_attachments(self, message_id: str, *, user_upn: Optional[str] = None) -> List[Dict[str, Any]]:
+        """Metadatos de los adjuntos (sin el contenido)."""
+        url = f"{self._mailbox(user_upn)}/messages/{message_id}/attachments"
+        params = {"$select": "id,name,contentType,size,isInline"}
+        headers = await self._auth_headers()
+        with GRAPH_REQUEST_SECONDS.labels("attachments").time():
+            resp = await self._http.get(url, headers=headers, params=params)
+        resp.raise_for_status()
+        return resp.json().get("value", [])
+
+    async def stream_attachment(self, message_id: str, attachment_id: str, *, user_upn: Optional[str] = None,
+                                chunk_size: int = 64 * 1024) -> AsyncIterator[bytes]:
+        """Contenido crudo del adjunto (`$value`) en trozos, sin cargarlo completo en memoria."""
+        url = f"{self._mailbox(user_upn)}/messages/{message_id}/attachments/{attachment_id}/$value"
+        headers = await self._auth_headers()
+        with GRAPH_REQUEST_SECONDS.labels("attachment").time():
+            async with self._http.stream("GET", url, headers=headers) as resp:
+                resp.raise_for_status()
+                async for chunk in resp.aiter_bytes(chunk_size):
+                    yield chunk
+
     def html_to_text(html: str) -> str:
         if not html: return ""
         return re.sub(r"<[^>]+>", " ", html).replace("&nbsp;", " ").strip()
@@ -0,0 +1,75 @@
+import csv
+import io
+import json
+from datetime import datetime
+from enum import Enum
+from typing import AsyncIterator, Sequence
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+from app.models import Book, BookCopy, EmailUser, Reservation
+
+EXPORT_BATCH_ROWS = 2000
+
+BOOK_COLUMNS = ("book_id", "title", "author", "created_at", "copy_id", "barcode", "status", "location")
+RESERVATION_COLUMNS = (
+    "reservation_id", "status", "start_date", "due_date", "canceled_at", "renewed_cnt",
+    "book_id", "title", "copy_id", "barcode", "user_email",
+)
+
+_BOOKS_QUERY = (
+    select(
+        Book.id.label("book_id"), Book.title, Book.author, Book.created_at,
+        BookCopy.id.label("copy_id"), BookCopy.barcode, BookCopy.status, BookCopy.location,
+    )
+    .outerjoin(BookCopy, BookCopy.book_id == Book.id)
+    .order_by(Book.id, BookCopy.id)
+)
+
+_RESERVATIONS_QUERY = (
+    select(
+        Reservation.id.label("reservation_id"), Reservation.status, Reservation.start_date,
+        Reservation.due_date, Reservation.canceled_at, Reservation.renewed_cnt,
+        Reservation.book_id, Book.title, Reservation.copy_id, BookCopy.barcode,
+        EmailUser.email.label("user_email"),
+    )
+    .join(Book, Book.id == Reservation.book_id)
+    .join(BookCopy, BookCopy.id == Reservation.copy_id)
+    .join(EmailUser, EmailUser.id == Reservation.email_user_id)
+    .order_by(Reservation.start_date, Reservation.id)
+)
+
+def _plain(value):
+    if isinstance(value, datetime):
+        return value.isoformat()
+    if isinstance(value, Enum):
+        return value.value
+    return value
+
+def _encode_ndjson(rows: Sequence, columns: Sequence[str]) -> bytes:
+    return "".join(
+        json.dumps({c: _plain(v) for c, v in zip(columns, row)}, ensure_ascii=False) + "\n" for row in rows
+    ).encode("utf-8")
+
+def _encode_csv(rows: Sequence, columns: Sequence[str], header: bool) -> bytes:
+    buf = io.StringIO()
+    w = csv.writer(buf)
+    if header:
+        w.writerow(columns)
+    w.writerows([("" if v is None else _plain(v)) for v in row] for row in rows)
+    return buf.getvalue().encode("utf-8")
+
+async def _stream(session: AsyncSession, stmt, columns: Sequence[str], fmt: str) -> AsyncIterator[bytes]:
+    # Cursor del lado del servidor: el motor entrega lotes de EXPORT_BATCH_ROWS y nunca se materializa todo.
+    if fmt == "csv":
+        yield _encode_csv([], columns, header=True)
+    result = await session.stream(stmt.execution_options(yield_per=EXPORT_BATCH_ROWS))
+    async for rows in result.partitions():
+        yield _encode_csv(rows, columns, header=False) if fmt == "csv" else _encode_ndjson(rows, columns)
+
+def export_books(session: AsyncSession, fmt: str = "ndjson") -> AsyncIterator[bytes]:
+    """Catálogo completo: una fila por copia (o una por libro sin copias)."""
+    return _stream(session, _BOOKS_QUERY, BOOK_COLUMNS, fmt)
+
+def export_reservations(session: AsyncSession, fmt: str = "ndjson") -> AsyncIterator[bytes]:
+    """Historial completo de reservaciones con libro, copia y usuario."""
+    return _stream(session, _RESERVATIONS_QUERY, RESERVATION_COLUMNS, fmt)
@@ -1,8 +1,9 @@
 import asyncio
 from fastapi import FastAPI
 from app.config import settings
-from app.db import init_db
+from app.db import init_db, SessionLocal
 from app.api.router import router
+from app.worker.leader import LeaderElector
 from app.worker.poller import run_poller
 
 app = FastAPI(title=settings.APP_NAME)
@@ -12,4 +13,15 @@ app.include_router(router)
 async def on_startup():
     await init_db()
     if settings.ENABLE_EMAIL_POLLER:
-        asyncio.create_task(run_poller())
+        if settings.LEADER_ELECTION:
+            # Todas las réplicas compiten por el lease; solo la titular ejecuta el poller.
+            app.state.poller_elector = LeaderElector(SessionLocal, "email_poller")
+            app.state.poller_elector.start(run_poller)
+        else:
+            asyncio.create_task(run_poller())
+
+@app.on_event("shutdown")
+async def on_shutdown():
+    elector = getattr(app.state, "poller_elector", None)
+    if elector is not None:
+        await elector.stop()
@@ -0,0 +1,228 @@
+"""Métricas en memoria con salida en formato de texto de Prometheus.
+
+Implementación mínima (sin dependencias): contadores, gauges e histogramas con
+etiquetas. Cada observación es una búsqueda en un dict y un `bisect`, así que el
+costo en el camino caliente es despreciable. El event loop es de un solo hilo, por
+lo que no se usan locks.
+"""
+import time
+from abc import ABC, abstractmethod
+from bisect import bisect_left
+from typing import Callable, Dict, List, Optional, Sequence, Tuple
+
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+E2E_BUCKETS = (1.0, 5.0, 15.0, 30.0, 60.0, 120.0, 300.0, 600.0, 1800.0, 3600.0)
+
+def _fmt(v: float) -> str:
+    return "+Inf" if v == float("inf") else repr(float(v))
+
+def _escape(v: str) -> str:
+    return str(v).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+def _label_str(names: Sequence[str], values: Sequence[str], extra: str = "") -> str:
+    parts = [f'{n}="{_escape(v)}"' for n, v in zip(names, values)]
+    if extra:
+        parts.append(extra)
+    return "{" + ",".join(parts) + "}" if parts else ""
+
+class _Metric(ABC):
+    kind = ""
+
+    def __init__(self, name: str, doc: str, labelnames: Sequence[str] = ()):
+        self.name = name
+        self.doc = doc
+        self.labelnames = tuple(labelnames)
+        self._children: Dict[Tuple[str, ...], object] = {}
+
+    def labels(self, *values: str):
+        key = tuple(str(v) for v in values)
+        child = self._children.get(key)
+        if child is None:
+            if len(key) != len(self.labelnames):
+                raise ValueError(f"{self.name}: se esperaban etiquetas {self.labelnames}")
+            child = self._children[key] = self._new_child()
+        return child
+
+    @property
+    def family(self) -> str:
+        """Nombre con el que se exponen HELP/TYPE y las muestras."""
+        return self.name
+
+    @abstractmethod
+    def _new_child(self): ...
+
+    @abstractmethod
+    def _samples(self) -> List[str]: ...
+
+    def render(self) -> str:
+        lines = [f"# HELP {self.family} {self.doc}", f"# TYPE {self.family} {self.kind}"]
+        lines += self._samples()
+        return "\n".join(lines)
+
+class _Value:
+    __slots__ = ("value",)
+
+    def __init__(self):
+        self.value = 0.0
+
+    def inc(self, amount: float = 1.0) -> None:
+        self.value += amount
+
+    def set(self, value: float) -> None:
+        self.value = value
+
+class Counter(_Metric):
+    kind = "counter"
+
+    @property
+    def family(self) -> str:
+        # Las muestras de un contador llevan sufijo `_total`; HELP/TYPE deben usar el mismo nombre.
+        return f"{self.name}_total"
+
+    def _new_child(self):
+        return _Value()
+
+    def inc(self, amount: float = 1.0) -> None:
+        self.labels().inc(amount)
+
+    def _samples(self):
+        return [f"{self.family}{_label_str(self.labelnames, k)} {_fmt(c.value)}" for k, c in self._children.items()]
+
+class Gauge(_Metric):
+    kind = "gauge"
+
+    def __init__(self, name: str, doc: str, labelnames: Sequence[str] = (), fn: Optional[Callable[[], float]] = None):
+        super().__init__(name, doc, labelnames)
+        self._fn = fn
+
+    def _new_child(self):
+        return _Value()
+
+    def set(self, value: float) -> None:
+        self.labels().set(value)
+
+    def set_function(self, fn: Callable[[], float]) -> None:
+        """Valor calculado al momento de exponer las métricas (sin costo en el camino caliente)."""
+        self._fn = fn
+
+    def _samples(self):
+        if self._fn is not None:
+            try:
+                return [f"{self.name} {_fmt(self._fn())}"]
+            except Exception:
+                return []
+        return [f"{self.name}{_label_str(self.labelnames, k)} {_fmt(c.value)}" for k, c in self._children.items()]
+
+class _Timer:
+    __slots__ = ("_child", "_t0")
+
+    def __init__(self, child):
+        self._child = child
+
+    def __enter__(self):
+        self._t0 = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self._child.observe(time.perf_counter() - self._t0)
+        return False
+
+class _HistogramChild:
+    __slots__ = ("buckets", "counts", "sum", "count")
+
+    def __init__(self, buckets: Tuple[float, ...]):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value: float) -> None:
+        self.counts[bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+    def time(self) -> _Timer:
+        return _Timer(self)
+
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def __init__(self, name: str, doc: str, labelnames: Sequence[str] = (), buckets: Sequence[float] = DEFAULT_BUCKETS):
+        super().__init__(name, doc, labelnames)
+        self.buckets = tuple(sorted(buckets))
+
+    def _new_child(self):
+        return _HistogramChild(self.buckets)
+
+    def observe(self, value: float) -> None:
+        self.labels().observe(value)
+
+    def time(self) -> _Timer:
+        return self.labels().time()
+
+    def _samples(self):
+        out = []
+        for key, child in self._children.items():
+            acc = 0
+            for bound, n in zip(self.buckets + (float("inf"),), child.counts):
+                acc += n
+                le = 'le="' + _fmt(bound) + '"'
+                out.append(f"{self.name}_bucket{_label_str(self.labelnames, key, le)} {acc}")
+            out.append(f"{self.name}_sum{_label_str(self.labelnames, key)} {_fmt(child.sum)}")
+            out.append(f"{self.name}_count{_label_str(self.labelnames, key)} {child.count}")
+        return out
+
+class Registry:
+    def __init__(self):
+        self._metrics: Dict[str, _Metric] = {}
+
+    def register(self, metric: _Metric) -> _Metric:
+        self._metrics[metric.name] = metric
+        return metric
+
+    def render(self) -> str:
+        return "\n".join(m.render() for m in self._metrics.values()) + "\n"
+
+REGISTRY = Registry()
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+# --- Métricas de la aplicación ---
+
+GRAPH_REQUEST_SECONDS = REGISTRY.register(Histogram(
+    "innovati_graph_request_seconds", "Latencia de llamadas a Microsoft Graph por operación.", ["op"]))
+GRAPH_TOKEN_REFRESH_SECONDS = REGISTRY.register(Histogram(
+    "innovati_graph_token_refresh_seconds", "Latencia de renovación del token OAuth de Graph."))
+LLM_REQUEST_SECONDS = REGISTRY.register(Histogram(
+    "innovati_llm_request_seconds", "Latencia de llamadas a Gemini."))
+LLM_PARSE_FAILURES = REGISTRY.register(Counter(
+    "innovati_llm_parse_failures", "Respuestas del LLM que no se pudieron interpretar."))
+DB_ACTION_SECONDS = REGISTRY.register(Histogram(
+    "innovati_db_action_seconds", "Latencia de la acción de base de datos por intent.", ["intent"]))
+EMAIL_E2E_SECONDS = REGISTRY.register(Histogram(
+    "innovati_email_e2e_seconds", "Desde la recepción del correo hasta el envío de la respuesta.", buckets=E2E_BUCKETS))
+EMAILS_PROCESSED = REGISTRY.register(Counter(
+    "innovati_emails_processed", "Correos procesados por intent y código de resultado.", ["intent", "code"]))
+EMAILS_SUPPRESSED = REGISTRY.register(Counter(
+    "innovati_emails_suppressed", "Correos descartados sin procesar, por motivo.", ["reason"]))
+EMAIL_BACKLOG = REGISTRY.register(Gauge(
+    "innovati_email_backlog", "Correos no leídos vistos en el último ciclo del poller, por buzón.", ["mailbox"]))
+POLLER_LEADER = REGISTRY.register(Gauge(
+    "innovati_poller_leader", "1 si esta réplica tiene el lease del poller."))
+
+def _pool_stat(attr: str) -> Callable[[], float]:
+    def read() -> float:
+        from app.db import engine
+        return float(getattr(engine.pool, attr)())
+    return read
+
+DB_POOL_CHECKED_OUT = REGISTRY.register(Gauge(
+    "innovati_db_pool_checked_out", "Conexiones del pool de la DB primaria en uso.", fn=_pool_stat("checkedout")))
+DB_POOL_SIZE = REGISTRY.register(Gauge(
+    "innovati_db_pool_size", "Tamaño configurado del pool de la DB primaria.", fn=_pool_stat("size")))
+
+def _sse_subscribers() -> float:
+    from app.changes import BUS
+    return float(BUS.subscribers())
+
+SSE_SUBSCRIBERS = REGISTRY.register(Gauge(
+    "innovati_sse_subscribers", "Suscriptores conectados a GET /books/changes.", fn=_sse_subscribers))
@@ -0,0 +1,67 @@
+import uuid
+from sqlalchemy import text
+from sqlalchemy.engine import Connection
+
+# Columnas de llaves (PK y FK) que pasaron de String(uuid4) a UUIDKey.
+KEY_COLUMNS = {
+    "book": ["id"],
+    "book_copie": ["id", "book_id"],
+    "email_user": ["id"],
+    "reservations": ["id", "email_user_id", "book_id", "copy_id"],
+    "email_log": ["id"],
+}
+
+def _pg_migrate_keys(conn: Connection) -> None:
+    pending = conn.execute(
+        text("""SELECT table_name, column_name FROM information_schema.columns
+                WHERE table_schema = current_schema() AND data_type = 'character varying'
+                  AND table_name = ANY(:tables)"""),
+        {"tables": list(KEY_COLUMNS)},
+    ).all()
+    pending = [(t, c) for t, c in pending if c in KEY_COLUMNS[t]]
+    if not pending:
+        return
+    # Las FKs no admiten tipos mixtos: se guardan, se eliminan y se recrean tal cual tras el cambio de tipo.
+    fks = conn.exec_driver_sql(
+        """SELECT con.conrelid::regclass::text, con.conname, pg_get_constraintdef(con.oid)
+           FROM pg_constraint con
+           WHERE con.contype = 'f' AND con.connamespace = current_schema()::regnamespace"""
+    ).all()
+    fks = [fk for fk in fks if fk[0] in KEY_COLUMNS]
+    for table, name, _ in fks:
+        conn.exec_driver_sql(f'ALTER TABLE "{table}" DROP CONSTRAINT "{name}"')
+    for table, column in pending:
+        conn.exec_driver_sql(f'ALTER TABLE "{table}" ALTER COLUMN "{column}" TYPE uuid USING "{column}"::uuid')
+    for table, name, definition in fks:
+        conn.exec_driver_sql(f'ALTER TABLE "{table}" ADD CONSTRAINT "{name}" {definition}')
+
+def _sqlite_migrate_keys(conn: Connection) -> None:
+    # El índice FTS se liga por rowid (no guarda ids), así que no hay que reconstruirlo.
+    for table, columns in KEY_COLUMNS.items():
+        for column in columns:
+            rows = conn.exec_driver_sql(
+                f'SELECT rowid, "{column}" FROM "{table}" WHERE typeof("{column}") = \'text\''
+            ).all()
+            if not rows:
+                continue
+            conn.exec_driver_sql(
+                f'UPDATE "{table}" SET "{column}" = ? WHERE rowid = ?',
+                [(uuid.UUID(value).bytes, rowid) for rowid, value in rows],
+            )
+
+def migrate_keys(conn: Connection) -> None:
+    """Convierte llaves UUID guardadas como texto (esquema anterior) al formato compacto. Idempotente."""
+    if conn.dialect.name == "postgresql":
+        _pg_migrate_keys(conn)
+    elif conn.dialect.name == "sqlite":
+        _sqlite_migrate_keys(conn)
+
+def ensure_indexes(conn: Connection) -> None:
+    """Índices añadidos después de crear las tablas (create_all no los agrega a tablas existentes)."""
+    conn.exec_driver_sql("CREATE INDEX IF NOT EXISTS ix_email_log_processed_at ON email_log (processed_at)")
+    conn.exec_driver_sql("CREATE INDEX IF NOT EXISTS ix_book_copie_book_id_id ON book_copie (book_id, id)")
+    conn.exec_driver_sql("CREATE INDEX IF NOT EXISTS ix_reservations_start_date_id ON reservations (start_date, id)")
+
+def upgrade(conn: Connection) -> None:
+    migrate_keys(conn)
+    ensure_indexes(conn)
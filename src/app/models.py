@@ -1,11 +1,39 @@
 import enum, uuid
 from datetime import datetime
 from sqlalchemy import (
-    String, Integer, Enum, ForeignKey, Text, Boolean, func, DateTime
+    String, Integer, Enum, ForeignKey, Text, Boolean, func, DateTime, LargeBinary, Float, Index
 )
+from sqlalchemy.dialects import postgresql
 from sqlalchemy.orm import Mapped, mapped_column, relationship
+from sqlalchemy.types import TypeDecorator
 from app.db import Base
 
+class UUIDKey(TypeDecorator):
+    """UUID expuesto como `str` en Python: nativo (16 bytes) en PostgreSQL y BLOB(16) en el resto."""
+    impl = LargeBinary(16)
+    cache_ok = True
+
+    def load_dialect_impl(self, dialect):
+        if dialect.name == "postgresql":
+            return dialect.type_descriptor(postgresql.UUID(as_uuid=False))
+        return dialect.type_descriptor(LargeBinary(16))
+
+    def process_bind_param(self, value, dialect):
+        if value is None:
+            return None
+        u = value if isinstance(value, uuid.UUID) else uuid.UUID(str(value))
+        return str(u) if dialect.name == "postgresql" else u.bytes
+
+    def process_result_value(self, value, dialect):
+        if value is None:
+            return None
+        if isinstance(value, (bytes, bytearray, memoryview)):
+            return str(uuid.UUID(bytes=bytes(value)))
+        return str(uuid.UUID(str(value)))
+
+def _new_id() -> str:
+    return str(uuid.uuid4())
+
 class ReservationStatus(str, enum.Enum):
     ACTIVE = "ACTIVE"
     CANCELED = "CANCELED"
@@ -20,7 +48,7 @@ class CopyStatus(str, enum.Enum):
 
 class Book(Base):
     __tablename__ = "book"
-    id: Mapped[str] = mapped_column(String, primary_key=True, default=lambda: str(uuid.uuid4()))
+    id: Mapped[str] = mapped_column(UUIDKey, primary_key=True, default=_new_id)
     title: Mapped[str] = mapped_column(String, nullable=False, index=True)
     author: Mapped[str | None] = mapped_column(String)
     created_at: Mapped[datetime] = mapped_column(DateTime(timezone=True), server_default=func.now())
@@ -28,36 +56,75 @@ class Book(Base):
 
 class BookCopy(Base):
     __tablename__ = "book_copie"
-    id: Mapped[str] = mapped_column(String, primary_key=True, default=lambda: str(uuid.uuid4()))
-    book_id: Mapped[str] = mapped_column(String, ForeignKey("book.id", ondelete="CASCADE"), nullable=False, index=True) 
+    id: Mapped[str] = mapped_column(UUIDKey, primary_key=True, default=_new_id)
+    book_id: Mapped[str] = mapped_column(UUIDKey, ForeignKey("book.id", ondelete="CASCADE"), nullable=False, index=True) 
     barcode: Mapped[str] = mapped_column(String, unique=True, nullable=False)
     status: Mapped[CopyStatus] = mapped_column(Enum(CopyStatus, native_enum=False), default=CopyStatus.AVAILABLE)
     location: Mapped[str] = mapped_column(String, nullable=False)
     book = relationship("Book", back_populates="copies") 
+    # Recorre las copias de cada libro en orden de id (exportación) sin ordenar en memoria.
+    __table_args__ = (Index("ix_book_copie_book_id_id", "book_id", "id"),)
 
 class EmailUser(Base):
     __tablename__ = "email_user"
-    id: Mapped[str] = mapped_column(String, primary_key=True, default=lambda: str(uuid.uuid4()))
+    id: Mapped[str] = mapped_column(UUIDKey, primary_key=True, default=_new_id)
     email: Mapped[str] = mapped_column(String, unique=True, index=True)
     name: Mapped[str | None] = mapped_column(String)
 
 class Reservation(Base):
     __tablename__ = "reservations"
-    id: Mapped[str] = mapped_column(String, primary_key=True, default=lambda: str(uuid.uuid4()))
-    email_user_id: Mapped[str] = mapped_column(String, ForeignKey("email_user.id", ondelete="RESTRICT"), nullable=False, index=True)
-    book_id: Mapped[str] = mapped_column(String, ForeignKey("book.id", ondelete="RESTRICT"), nullable=False, index=True)
-    copy_id: Mapped[str] = mapped_column(String, ForeignKey("book_copie.id", ondelete="RESTRICT"), nullable=False, index=True)
+    id: Mapped[str] = mapped_column(UUIDKey, primary_key=True, default=_new_id)
+    email_user_id: Mapped[str] = mapped_column(UUIDKey, ForeignKey("email_user.id", ondelete="RESTRICT"), nullable=False, index=True)
+    book_id: Mapped[str] = mapped_column(UUIDKey, ForeignKey("book.id", ondelete="RESTRICT"), nullable=False, index=True)
+    copy_id: Mapped[str] = mapped_column(UUIDKey, ForeignKey("book_copie.id", ondelete="RESTRICT"), nullable=False, index=True)
     status: Mapped[ReservationStatus] = mapped_column(Enum(ReservationStatus, native_enum=False), default=ReservationStatus.ACTIVE, nullable=False)
     start_date: Mapped[datetime] = mapped_column(DateTime(timezone=True), server_default=func.now())
     due_date: Mapped[datetime] = mapped_column(DateTime(timezone=True))
     canceled_at: Mapped[datetime | None] = mapped_column(DateTime(timezone=True), nullable=True)
     renewed_cnt: Mapped[int] = mapped_column(Integer, default=0)
+    # Exportación en orden cronológico servida por el índice (sin ordenar toda la tabla).
+    __table_args__ = (Index("ix_reservations_start_date_id", "start_date", "id"),)
 
 class EmailLog(Base):
     __tablename__ = "email_log"
-    id: Mapped[str] = mapped_column(String, primary_key=True, default=lambda: str(uuid.uuid4()))
+    id: Mapped[str] = mapped_column(UUIDKey, primary_key=True, default=_new_id)
     message_id: Mapped[str | None] = mapped_column(String, unique=True, index=True)
     from_email: Mapped[str] = mapped_column(String, index=True)
     subject: Mapped[str | None] = mapped_column(String)
     processed: Mapped[bool] = mapped_column(Boolean, default=False)
+    processed_at: Mapped[datetime | None] = mapped_column(DateTime(timezone=True), nullable=True, index=True)
+
+class EmailLogArchive(Base):
+    __tablename__ = "email_log_archive"
+    id: Mapped[str] = mapped_column(UUIDKey, primary_key=True)
+    message_id: Mapped[str | None] = mapped_column(String, index=True)
+    from_email: Mapped[str] = mapped_column(String)
+    subject: Mapped[str | None] = mapped_column(String)
+    processed: Mapped[bool] = mapped_column(Boolean, default=False)
     processed_at: Mapped[datetime | None] = mapped_column(DateTime(timezone=True), nullable=True)
+
+class EmailTrace(Base):
+    __tablename__ = "email_trace"
+    id: Mapped[str] = mapped_column(UUIDKey, primary_key=True, default=_new_id)
+    message_id: Mapped[str | None] = mapped_column(String, index=True)
+    intent: Mapped[str | None] = mapped_column(String)
+    confidence: Mapped[float | None] = mapped_column(Float)
+    received_at: Mapped[datetime | None] = mapped_column(DateTime(timezone=True))
+    picked_up_at: Mapped[datetime] = mapped_column(DateTime(timezone=True), index=True)
+    queue_ms: Mapped[float | None] = mapped_column(Float)
+    fetch_ms: Mapped[float | None] = mapped_column(Float)
+    llm_ms: Mapped[float | None] = mapped_column(Float)
+    db_ms: Mapped[float | None] = mapped_column(Float)
+    reply_ms: Mapped[float | None] = mapped_column(Float)
+    total_ms: Mapped[float | None] = mapped_column(Float)
+    llm_input_tokens: Mapped[int | None] = mapped_column(Integer)
+    llm_output_tokens: Mapped[int | None] = mapped_column(Integer)
+
+class LeaderLease(Base):
+    """Lease de liderazgo: el titular vigente es el único que ejecuta la tarea `name` (p. ej. el poller)."""
+    __tablename__ = "leader_lease"
+    name: Mapped[str] = mapped_column(String, primary_key=True)
+    holder: Mapped[str] = mapped_column(String, nullable=False)
+    acquired_at: Mapped[datetime] = mapped_column(DateTime(timezone=True), nullable=False)
+    renewed_at: Mapped[datetime] = mapped_column(DateTime(timezone=True), nullable=False)
+    expires_at: Mapped[datetime] = mapped_column(DateTime(timezone=True), nullable=False)
@@ -1,9 +1,12 @@
-from typing import Literal, Tuple, Dict, Any
+from typing import Literal, Optional, Tuple, Dict, Any
 from pydantic import BaseModel, Field
 from langchain.prompts import PromptTemplate, ChatPromptTemplate
 from langchain_core.output_parsers import JsonOutputParser
 from langchain.schema import SystemMessage, HumanMessage
 from app.nlp.client import GeminiClient
+from app.config import settings
+from app.metrics import LLM_REQUEST_SECONDS, LLM_PARSE_FAILURES
+from app.replies import find_page_token
 import logging
 
 logger = logging.getLogger(__name__)
@@ -24,7 +27,7 @@ Operaciones típicas (intent) con sus parámetros:
 - reserve(book_title?:string, book_id?:string, name:string, email:string)
 - renew(barcode:string, email:string)
 - cancel(barcode:string, email:string)
-- list_books()
+- list_books(offset?:integer)
 - register_book(title:string, author?:string)
 - register_copy(book_id:string, barcode:string, location:string)
 - delete_book(book_title?:string, book_id?:string)
@@ -40,7 +43,7 @@ Debes devolver un JSON **estricto** que cumpla con el siguiente esquema:
 - reserve: { "book_title"?:string, "book_id"?:string, "name":string, "email":string }
 - renew:   { "barcode":string, "email":string }
 - cancel:  { "barcode":string, "email":string }
-- list_books: {}
+- list_books: { "offset"?:integer }
 - register_book:  { "title":string, "author"?:string }
 - register_copy:  { "book_id":string, "barcode":string, "location":string }
 - delete_book:    { "book_title"?:string, "book_id"?:string }
@@ -72,15 +75,32 @@ HUMAN_TMPL = PromptTemplate(
 )
 
 
-async def extract_intent_sql_like(subject: str, body_text: str) -> Tuple[dict, str]:
+def _page_request(subject: str) -> Optional[Tuple[dict, str]]:
+    # "[[libros:N]]" en el asunto: página siguiente de un listado enviado antes; no hace falta el LLM.
+    offset = find_page_token(subject)
+    if offset is None:
+        return None
+    sql_like = f"SELECT * FROM book ORDER BY title LIMIT {settings.REPLY_LIST_PAGE_SIZE} OFFSET {offset};"
+    return {
+        "intent": "list_books", "params": {"offset": offset}, "confidence": 1.0,
+        "reason": "token de página", "sql_like": sql_like,
+        "usage": {"input_tokens": None, "output_tokens": None},
+    }, sql_like
+
+async def extract_intent_sql_like(subject: str, body_text: str, client: Optional[GeminiClient] = None) -> Tuple[dict, str]:
+    page = _page_request(subject)
+    if page is not None:
+        return page
     subj = (subject or "").strip() or "(sin asunto)"
     body = (body_text or "").strip() or "(sin cuerpo)"
-    client = GeminiClient()
+    client = client or GeminiClient()
     system_msgs = SYSTEM_TMPL.format_messages()
     human_msg = HumanMessage(content=HUMAN_TMPL.format(subject=subj, body=body))
     messages = [*system_msgs, human_msg]
+    resp = None
     try:
-        resp = await client.ainvoke(messages)
+        with LLM_REQUEST_SECONDS.time():
+            resp = await client.ainvoke(messages)
         raw_text = getattr(resp, "content", "")
         if not isinstance(raw_text, str):
             raw_text = str(raw_text)
@@ -102,14 +122,18 @@ async def extract_intent_sql_like(subject: str, body_text: str) -> Tuple[dict, s
         sql_like = data.get("sql_like") or "-- no-sql"
         confidence = float(data.get("confidence") or 0.0)
         reason = data.get("reason") or ""
+        usage = getattr(resp, "usage_metadata", None) or {}
         clean = {
             "intent": intent,
             "params": params,
             "confidence": confidence,
             "reason": reason,
             "sql_like": sql_like,
+            "usage": {"input_tokens": usage.get("input_tokens"), "output_tokens": usage.get("output_tokens")},
         }
         return clean, sql_like
     except Exception as e:
+        if resp is not None:
+            LLM_PARSE_FAILURES.inc()
         logger.warning("[parser] Fallback a UNKNOWN: %s", e, exc_info=True)
         return {"intent": "unknown", "params": {}, "confidence": 0.0, "reason": f"parse-error: {e}"}, "-- no-sql"
\ No newline at end of file
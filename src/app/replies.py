@@ -0,0 +1,319 @@
+"""Respuestas por correo: registro de plantillas por (intent, código de resultado).
+
+Las plantillas se compilan una sola vez al importar el módulo: cada cadena con
+campos `{clave}` o `{clave|por defecto}` queda como una tupla de partes literales y
+campos, y cada (intent, código) apunta a una función que arma bloques (párrafos,
+listas, enlaces). Los mismos bloques se serializan a texto plano y a HTML.
+
+Los listados van por páginas. Cada página indica el token `[[libros:N]]`; un correo
+con ese token en el asunto se interpreta como `list_books` desde el libro N sin
+consultar al LLM (ver `app.nlp.parser.extract_intent_sql_like`).
+"""
+import html
+import re
+from dataclasses import dataclass, field
+from typing import Any, Callable, Dict, List, Optional, Tuple
+from urllib.parse import quote
+
+GREETING = "¡Hola! 👋"
+BULK_REPLY_MAX_ERRORS = 500
+
+# ---------- tokens de página ----------
+
+_PAGE_TOKEN = re.compile(r"\[\[\s*libros\s*:\s*(\d+)\s*\]\]", re.I)
+
+def page_token(offset: int) -> str:
+    return f"[[libros:{offset}]]"
+
+def find_page_token(text: Optional[str]) -> Optional[int]:
+    """Offset del token `[[libros:N]]` en `text` (el asunto), o None."""
+    m = _PAGE_TOKEN.search(text or "")
+    return int(m.group(1)) if m else None
+
+def strip_page_token(text: str) -> str:
+    return " ".join(_PAGE_TOKEN.sub(" ", text or "").split())
+
+# ---------- bloques ----------
+
+@dataclass(frozen=True)
+class Para:
+    text: str
+
+@dataclass(frozen=True)
+class Items:
+    lines: Tuple[str, ...]
+
+@dataclass(frozen=True)
+class Numbered:
+    lines: Tuple[str, ...]
+    start: int = 1
+
+@dataclass(frozen=True)
+class Link:
+    """En texto se muestra `text`; en HTML, un enlace `label` a `href`."""
+    text: str
+    label: str
+    href: str
+
+GAP = Para("")
+
+@dataclass
+class ReplyContext:
+    intent: str
+    params: Dict[str, Any]
+    result: Dict[str, Any]
+    reply_to: Optional[str] = None
+    data: Dict[str, Any] = field(init=False)
+
+    def __post_init__(self):
+        self.data = self.result.get("data") or {}
+
+    def value(self, key: str, default: Any = "-") -> Any:
+        return self.data.get(key) or self.params.get(key) or default
+
+_FIELD = re.compile(r"\{(\w+)(?:\|([^}]*))?\}")
+
+class Fmt:
+    """Cadena con campos, compilada: `{clave}` (por defecto "-") o `{clave|valor}`."""
+    __slots__ = ("parts",)
+
+    def __init__(self, src: str):
+        parts: List[Tuple[str, Optional[str], Optional[str]]] = []
+        pos = 0
+        for m in _FIELD.finditer(src):
+            if m.start() > pos:
+                parts.append((src[pos:m.start()], None, None))
+            parts.append(("", m.group(1), "-" if m.group(2) is None else m.group(2)))
+            pos = m.end()
+        if pos < len(src):
+            parts.append((src[pos:], None, None))
+        self.parts = tuple(parts)
+
+    def __call__(self, ctx: ReplyContext) -> str:
+        return "".join(lit if key is None else str(ctx.value(key, default)) for lit, key, default in self.parts)
+
+# ---------- registro ----------
+
+Renderer = Callable[[ReplyContext], List[Any]]
+_REGISTRY: Dict[Tuple[str, str], Renderer] = {}
+
+def register(intent: str, *codes: str):
+    """Registra un renderer para `intent` y los códigos dados ("OK" = éxito, "*" = cualquier otro error)."""
+    def deco(fn: Renderer) -> Renderer:
+        for code in codes or ("OK",):
+            _REGISTRY[(intent, code)] = fn
+        return fn
+    return deco
+
+def _details(header: str, *lines: str) -> Renderer:
+    head, fmts = Fmt(header), tuple(Fmt(ln) for ln in lines)
+    return lambda ctx: [Para(head(ctx)), Items(tuple(f(ctx) for f in fmts))]
+
+def _error(message: str) -> Renderer:
+    blocks = [Para(f"❌ {message}")]
+    return lambda ctx: blocks
+
+def _fallback_error(default: str) -> Renderer:
+    return lambda ctx: [Para(f"❌ {ctx.result.get('message') or default}")]
+
+_SUCCESS = {
+    "reserve": _details(
+        "✅ Reserva realizada con éxito.",
+        "Libro: {title|desconocido} (ID: {book_id})",
+        "Copia (barcode): {barcode}",
+        "Ubicación: {location}",
+        "Usuario: {user_email}",
+        "Vencimiento: {due_date}",
+        "Renovaciones: {renewed_cnt|0}",
+        "Id de reservación: {reservation_id}",
+    ),
+    "renew": _details(
+        "🔁 Renovación exitosa.",
+        "Copia (barcode): {barcode}",
+        "Libro: {title} (ID: {book_id})",
+        "Usuario: {user_email}",
+        "Nuevo vencimiento: {due_date}",
+        "Total de renovaciones: {renewed_cnt}",
+        "Id de reservación: {reservation_id}",
+    ),
+    "cancel": _details(
+        "🗑️ Reservación cancelada.",
+        "Libro: {title} (ID: {book_id})",
+        "Copia (barcode): {barcode}",
+        "Usuario: {user_email}",
+        "Cancelado en: {canceled_at}",
+        "Id de reservación: {reservation_id}",
+    ),
+    "register_book": _details(
+        "📚 Libro registrado correctamente.",
+        "Título: {title}",
+        "Autor: {author}",
+        "ID: {book_id}",
+        "Creado en: {created_at}",
+    ),
+    "register_copy": _details(
+        "🧾 Copia registrada correctamente.",
+        "Libro: {title} (ID: {book_id})",
+        "Copia (barcode): {barcode}",
+        "Ubicación: {location}",
+        "ID de copia: {copy_id}",
+    ),
+    "delete_book": _details(
+        "🧹 Libro eliminado.",
+        "Título: {title}",
+        "ID: {book_id}",
+        "Copias eliminadas: {removed_copies|0}",
+        "Reservaciones eliminadas: {removed_reservations|0}",
+    ),
+}
+
+# intent -> ({código: mensaje}, mensaje si el código no está en la tabla y la acción no trae uno)
+_ERRORS = {
+    "reserve": ({
+        "BOOK_NOT_FOUND": "No encontré el libro por id/título.",
+        "NO_AVAILABLE_COPIES": "No hay copias disponibles para ese libro.",
+        "MISSING_EMAIL": "Falta el correo del solicitante.",
+    }, "No pudimos realizar la reserva."),
+    "renew": ({
+        "MISSING_FIELDS": "Debes enviar barcode y email.",
+        "USER_NOT_FOUND": "No encontré al usuario.",
+        "COPY_NOT_FOUND": "No encontré la copia indicada.",
+        "ACTIVE_RESERVATION_NOT_FOUND": "No hay una reservación activa para esos datos.",
+        "RESERVATION_EXPIRED": "La reservación está vencida; no se puede renovar.",
+    }, "No pudimos renovar la reservación."),
+    "cancel": ({
+        "MISSING_FIELDS": "Debes enviar barcode y email.",
+        "USER_NOT_FOUND": "No encontré al usuario.",
+        "COPY_NOT_FOUND": "No encontré la copia indicada.",
+        "ACTIVE_RESERVATION_NOT_FOUND": "No hay una reservación activa para esos datos.",
+    }, "No pudimos cancelar la reservación."),
+    "register_book": ({
+        "MISSING_TITLE": "Falta el título del libro.",
+    }, "No pudimos registrar el libro."),
+    "register_copy": ({
+        "MISSING_FIELDS": "Faltan book_id, barcode o location.",
+        "BOOK_NOT_FOUND": "El libro indicado no existe.",
+        "BARCODE_EXISTS": "El código de barras ya existe.",
+    }, "No pudimos registrar la copia."),
+    "delete_book": ({
+        "MISSING_ID_OR_TITLE": "Debes indicar el id o el título del libro.",
+        "BOOK_NOT_FOUND": "No encontré el libro solicitado.",
+    }, "No pudimos eliminar el libro."),
+}
+
+for _intent, _renderer in _SUCCESS.items():
+    register(_intent, "OK")(_renderer)
+for _intent, (_messages, _default) in _ERRORS.items():
+    for _code, _message in _messages.items():
+        register(_intent, _code)(_error(_message))
+    register(_intent, "*")(_fallback_error(_default))
+
+@register("list_books", "OK")
+def _list_books(ctx: ReplyContext) -> List[Any]:
+    items = ctx.data.get("items") or []
+    offset = int(ctx.data.get("offset") or 0)
+    if not items:
+        return [Para("📖 No hay más libros en el catálogo." if offset else "📖 No hay libros registrados aún.")]
+    blocks: List[Any] = [
+        Para(f"📖 Listado de libros ({offset + 1}–{offset + len(items)}):"),
+        Numbered(tuple(
+            f"{it.get('title') or '-'} — {it.get('author') or '-'} | "
+            f"Copias: {it.get('copies_available', 0)}/{it.get('copies_total', 0)} (ID: {it.get('book_id') or '-'})"
+            for it in items
+        ), start=offset + 1),
+        GAP,
+        Para(
+            f"Resumen: Libros: {len(items)} · Copias totales: {sum(i.get('copies_total', 0) for i in items)}"
+            f" · Disponibles: {sum(i.get('copies_available', 0) for i in items)}."
+        ),
+    ]
+    if ctx.data.get("has_more"):
+        token = page_token(offset + len(items))
+        text = f"➡️ Para ver los siguientes, envía un correo con el asunto: {token}"
+        blocks.append(GAP)
+        if ctx.reply_to:
+            blocks.append(Link(text, "➡️ Ver los siguientes libros", f"mailto:{ctx.reply_to}?subject={quote(token)}"))
+        else:
+            blocks.append(Para(text))
+    return blocks
+
+register("list_books", "*")(_error("No fue posible obtener el listado en este momento."))
+# Aviso al remitente que agotó su cupo (SenderThrottle); el correo no se procesa.
+register("rate_limited", "*")(lambda ctx: [Para(
+    "⏳ Alcanzaste el límite de solicitudes por correo, así que este mensaje no se procesó. "
+    "Vuelve a enviarlo en unos minutos."
+)])
+
+@register("register_copies_bulk", "OK", "*")
+def _bulk(ctx: ReplyContext) -> List[Any]:
+    ok = ctx.result.get("ok", False)
+    blocks: List[Any] = [Para("📦 Carga masiva de copias." if ok else "❌ No se pudo procesar la carga masiva.")]
+    for f in ctx.data.get("files") or []:
+        fd = f.get("data") or {}
+        blocks += [GAP, Para(f"Archivo: {f.get('name') or '-'}")]
+        if f.get("ok"):
+            blocks.append(Items((f"Copias registradas: {fd.get('inserted', 0)} de {fd.get('total', 0)}",)))
+        else:
+            blocks.append(Para(f"❌ {f.get('message') or 'No pudimos procesar el archivo.'}"))
+        errs = fd.get("errors") or []
+        if errs:
+            blocks.append(Para(f"Filas con errores ({len(errs)}):"))
+            blocks.append(Items(tuple(
+                f"Fila {e.get('row', '-')}: {e.get('message')} (barcode: {e.get('barcode') or '-'})"
+                for e in errs[:BULK_REPLY_MAX_ERRORS]
+            )))
+            if len(errs) > BULK_REPLY_MAX_ERRORS:
+                blocks.append(Para(f"... y {len(errs) - BULK_REPLY_MAX_ERRORS} filas más con errores."))
+    return blocks
+
+_UNKNOWN_BLOCKS = [Para("🤖 No entendí tu solicitud. ¿Podrías darme un poco más de contexto?")]
+
+def _unknown(ctx: ReplyContext) -> List[Any]:
+    return _UNKNOWN_BLOCKS
+
+def renderer_for(intent: str, ok: bool, code: str) -> Renderer:
+    if not ok:
+        return _REGISTRY.get((intent, code)) or _REGISTRY.get((intent, "*")) or _unknown
+    return _REGISTRY.get((intent, "OK")) or _unknown
+
+# ---------- salida ----------
+
+@dataclass(frozen=True)
+class RenderedReply:
+    text: str
+    html: str
+
+def _to_text(blocks: List[Any]) -> str:
+    lines: List[str] = []
+    for b in blocks:
+        if isinstance(b, Para):
+            lines.append(b.text)
+        elif isinstance(b, Items):
+            lines += [f"- {ln}" for ln in b.lines if ln]
+        elif isinstance(b, Numbered):
+            lines += [f"{n}) {ln}" for n, ln in enumerate(b.lines, start=b.start)]
+        elif isinstance(b, Link):
+            lines.append(b.text)
+    return "\n".join(lines)
+
+def _to_html(blocks: List[Any]) -> str:
+    out: List[str] = []
+    for b in blocks:
+        if isinstance(b, Para):
+            if b.text:
+                out.append(f"<p>{html.escape(b.text)}</p>")
+        elif isinstance(b, Items):
+            out.append("<ul>" + "".join(f"<li>{html.escape(ln)}</li>" for ln in b.lines if ln) + "</ul>")
+        elif isinstance(b, Numbered):
+            out.append(f'<ol start="{b.start}">' + "".join(f"<li>{html.escape(ln)}</li>" for ln in b.lines) + "</ol>")
+        elif isinstance(b, Link):
+            out.append(f'<p><a href="{html.escape(b.href)}">{html.escape(b.label)}</a></p>')
+    return '<div style="font-family: sans-serif">' + "".join(out) + "</div>"
+
+def render_reply(intent: str, params: dict, result: dict, processed_at_iso: str, *, reply_to: Optional[str] = None) -> RenderedReply:
+    """Respuesta al correo en texto plano y HTML, según la plantilla de (intent, código)."""
+    ok = bool(result.get("ok", False))
+    ctx = ReplyContext(intent=intent, params=params or {}, result=result, reply_to=reply_to)
+    body = renderer_for(intent, ok, result.get("code") or "")(ctx)
+    blocks = [Para(GREETING), GAP, *body, GAP, Para(f"(Procesado: {processed_at_iso}Z)")]
+    return RenderedReply(text=_to_text(blocks), html=_to_html(blocks))
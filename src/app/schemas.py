@@ -1,4 +1,4 @@
-from pydantic import BaseModel, constr
+from pydantic import BaseModel, Field, constr
 from datetime import datetime
 
 class BookIn(BaseModel):
@@ -17,6 +17,12 @@ class BookListItem(BaseModel):
     copies_available: int
     copies_total: int
 
+class BookSearchOut(BaseModel):
+    items: list[BookListItem]
+    limit: int
+    offset: int
+    has_more: bool
+
 class CopyIn(BaseModel):
     barcode: constr(pattern=r'^\d{10}$')
     location: str
@@ -41,6 +47,27 @@ class ReservationOut(BaseModel):
     status: str
     due_date: datetime
 
+class ReservationBatchItemIn(BaseModel):
+    book_id: str | None = None
+    book_title: str | None = None
+    name: str | None = None
+    email: str
+
+class ReservationBatchIn(BaseModel):
+    items: list[ReservationBatchItemIn] = Field(..., min_length=1, max_length=500)
+
+class ReservationBatchItemOut(BaseModel):
+    index: int
+    ok: bool
+    code: str | None = None
+    message: str
+    reservation: ReservationOut | None = None
+
+class ReservationBatchOut(BaseModel):
+    reserved: int
+    failed: int
+    results: list[ReservationBatchItemOut]
+
 class RenewalIn(BaseModel):
     barcode: constr(pattern=r'^\d{10}$')
     email: str
@@ -56,4 +83,15 @@ class ReservationOut(BaseModel):
 
 class CancelIn(BaseModel):
     barcode: constr(pattern=r'^\d{10}$')
-    email: str
\ No newline at end of file
+    email: str
+
+class StageStatsOut(BaseModel):
+    count: int
+    p50: float | None
+    p95: float | None
+    p99: float | None
+
+class TraceStatsOut(BaseModel):
+    since: datetime
+    until: datetime
+    stages: dict[str, StageStatsOut]
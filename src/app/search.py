@@ -0,0 +1,103 @@
+import re
+from typing import List, Tuple
+from sqlalchemy import text, or_, select, Float
+from sqlalchemy.engine import Connection
+from sqlalchemy.ext.asyncio import AsyncSession
+from app.models import Book, UUIDKey
+
+# Índice de texto completo sobre book(title, author).
+# - SQLite: tabla virtual FTS5 de contenido externo (`content='book'`), con una fila por libro
+#   de `rowid` igual al de `book`; los triggers la mantienen y borran por rowid (sin recorrerla).
+#   `book` no tiene INTEGER PRIMARY KEY, así que un VACUUM puede renumerar sus rowids:
+#   después de uno, ejecutar `rebuild_search_index`.
+# - PostgreSQL: columna tsvector generada + índice GIN.
+# - Otros motores: LIKE sin índice (solo para desarrollo).
+
+_SQLITE_DDL = [
+    """CREATE VIRTUAL TABLE book_fts USING fts5(
+        title, author, content = 'book', content_rowid = 'rowid', tokenize = 'unicode61 remove_diacritics 2'
+    )""",
+    """CREATE TRIGGER book_fts_ai AFTER INSERT ON book BEGIN
+        INSERT INTO book_fts(rowid, title, author) VALUES (new.rowid, new.title, new.author);
+    END""",
+    """CREATE TRIGGER book_fts_ad AFTER DELETE ON book BEGIN
+        INSERT INTO book_fts(book_fts, rowid, title, author) VALUES ('delete', old.rowid, old.title, old.author);
+    END""",
+    """CREATE TRIGGER book_fts_au AFTER UPDATE OF title, author ON book BEGIN
+        INSERT INTO book_fts(book_fts, rowid, title, author) VALUES ('delete', old.rowid, old.title, old.author);
+        INSERT INTO book_fts(rowid, title, author) VALUES (new.rowid, new.title, new.author);
+    END""",
+    "INSERT INTO book_fts(book_fts) VALUES ('rebuild')",
+]
+# Esquema anterior (columna book_id UNINDEXED, borrado por book_id): se reemplaza.
+_SQLITE_DROP = [
+    "DROP TRIGGER IF EXISTS book_fts_ai",
+    "DROP TRIGGER IF EXISTS book_fts_ad",
+    "DROP TRIGGER IF EXISTS book_fts_au",
+    "DROP TABLE IF EXISTS book_fts",
+]
+
+_POSTGRES_DDL = [
+    """ALTER TABLE book ADD COLUMN IF NOT EXISTS search_tsv tsvector GENERATED ALWAYS AS (
+        setweight(to_tsvector('simple', coalesce(title, '')), 'A') ||
+        setweight(to_tsvector('simple', coalesce(author, '')), 'B')
+    ) STORED""",
+    "CREATE INDEX IF NOT EXISTS ix_book_search_tsv ON book USING GIN (search_tsv)",
+]
+
+_SQLITE_SEARCH = text("""
+    SELECT b.id AS id, bm25(book_fts, 10.0, 5.0) AS rank
+    FROM book_fts JOIN book b ON b.rowid = book_fts.rowid
+    WHERE book_fts MATCH :q
+    ORDER BY rank, b.id
+    LIMIT :limit OFFSET :offset
+""").columns(id=UUIDKey(), rank=Float())
+
+_POSTGRES_SEARCH = text("""
+    SELECT b.id AS id, ts_rank(b.search_tsv, q) AS rank
+    FROM book b, to_tsquery('simple', :q) q
+    WHERE b.search_tsv @@ q
+    ORDER BY rank DESC, b.id
+    LIMIT :limit OFFSET :offset
+""").columns(id=UUIDKey(), rank=Float())
+
+def _terms(q: str) -> List[str]:
+    return re.findall(r"\w+", (q or "").lower())
+
+def ensure_search_index(conn: Connection) -> None:
+    """Crea (idempotente) el índice de texto completo. Pensado para `conn.run_sync`."""
+    dialect = conn.dialect.name
+    if dialect == "sqlite":
+        current = conn.exec_driver_sql(
+            "SELECT sql FROM sqlite_master WHERE type = 'table' AND name = 'book_fts'"
+        ).scalar()
+        if current and "content = 'book'" in current:
+            return
+        for stmt in _SQLITE_DROP + _SQLITE_DDL:
+            conn.exec_driver_sql(stmt)
+    elif dialect == "postgresql":
+        for stmt in _POSTGRES_DDL:
+            conn.exec_driver_sql(stmt)
+
+def rebuild_search_index(conn: Connection) -> None:
+    """Regenera el índice FTS de SQLite desde `book` (p. ej. tras un VACUUM)."""
+    if conn.dialect.name == "sqlite":
+        conn.exec_driver_sql("INSERT INTO book_fts(book_fts) VALUES ('rebuild')")
+
+async def search_book_ids(session: AsyncSession, q: str, *, limit: int, offset: int) -> List[Tuple[str, float]]:
+    """Ids de libros que coinciden con `q` (prefijo por término, todos requeridos), ordenados por relevancia."""
+    terms = _terms(q)
+    if not terms:
+        return []
+    dialect = session.bind.dialect.name
+    if dialect == "sqlite":
+        match = " ".join(f'"{t}"*' for t in terms)
+        rows = await session.execute(_SQLITE_SEARCH, {"q": match, "limit": limit, "offset": offset})
+    elif dialect == "postgresql":
+        match = " & ".join(f"{t}:*" for t in terms)
+        rows = await session.execute(_POSTGRES_SEARCH, {"q": match, "limit": limit, "offset": offset})
+    else:
+        conds = [or_(Book.title.ilike(f"%{t}%"), Book.author.ilike(f"%{t}%")) for t in terms]
+        stmt = select(Book.id).where(*conds).order_by(Book.title).limit(limit).offset(offset)
+        return [(row.id, 0.0) for row in await session.execute(stmt)]
+    return [(row.id, float(row.rank)) for row in rows]
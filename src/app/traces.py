@@ -0,0 +1,87 @@
+import math
+import time
+from contextlib import contextmanager
+from datetime import datetime, timezone
+from typing import Any, Dict, List, Optional
+from sqlalchemy import select, func, and_
+from sqlalchemy.ext.asyncio import AsyncSession
+from app.models import EmailTrace
+
+STAGES = ("queue", "fetch", "llm", "db", "reply", "total")
+PERCENTILES = (("p50", 0.50), ("p95", 0.95), ("p99", 0.99))
+
+def to_naive_utc(dt: Optional[datetime]) -> Optional[datetime]:
+    if dt is None or dt.tzinfo is None:
+        return dt
+    return dt.astimezone(timezone.utc).replace(tzinfo=None)
+
+class StageTrace:
+    """Traza liviana de un correo: tiempos por etapa, tokens del LLM y confianza del intent."""
+
+    def __init__(self, received_at: Optional[datetime] = None):
+        self.received_at = to_naive_utc(received_at)
+        self.picked_up_at = datetime.utcnow()
+        self._t0 = time.perf_counter()
+        self.stages_ms: Dict[str, float] = {}
+
+    @contextmanager
+    def stage(self, name: str):
+        t0 = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.stages_ms[name] = self.stages_ms.get(name, 0.0) + (time.perf_counter() - t0) * 1000
+
+    def as_row(self, *, message_id: str, intent: Optional[str], confidence: Optional[float],
+               usage: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
+        usage = usage or {}
+        queue_ms = None
+        if self.received_at:
+            queue_ms = max(0.0, (self.picked_up_at - self.received_at).total_seconds() * 1000)
+        return {
+            "message_id": message_id,
+            "intent": intent,
+            "confidence": confidence,
+            "received_at": self.received_at,
+            "picked_up_at": self.picked_up_at,
+            "queue_ms": queue_ms,
+            "fetch_ms": self.stages_ms.get("fetch"),
+            "llm_ms": self.stages_ms.get("llm"),
+            "db_ms": self.stages_ms.get("db"),
+            "reply_ms": self.stages_ms.get("reply"),
+            "total_ms": (time.perf_counter() - self._t0) * 1000,
+            "llm_input_tokens": usage.get("input_tokens"),
+            "llm_output_tokens": usage.get("output_tokens"),
+        }
+
+def _percentile(sorted_values: List[float], q: float) -> Optional[float]:
+    # Percentil por rango más cercano.
+    if not sorted_values:
+        return None
+    k = min(len(sorted_values) - 1, max(0, math.ceil(q * len(sorted_values)) - 1))
+    return sorted_values[k]
+
+async def stage_percentiles(session: AsyncSession, *, since: datetime, until: datetime) -> Dict[str, Any]:
+    """p50/p95/p99 (ms) por etapa para los correos tomados entre `since` y `until`."""
+    since, until = to_naive_utc(since), to_naive_utc(until)
+    window = and_(EmailTrace.picked_up_at >= since, EmailTrace.picked_up_at < until)
+    cols = {stage: getattr(EmailTrace, f"{stage}_ms") for stage in STAGES}
+    out: Dict[str, Any] = {}
+    if session.bind.dialect.name == "postgresql":
+        aggs = []
+        for stage, col in cols.items():
+            aggs.append(func.count(col))
+            aggs += [func.percentile_cont(q).within_group(col) for _, q in PERCENTILES]
+        row = (await session.execute(select(*aggs).where(window))).one()
+        step = 1 + len(PERCENTILES)
+        for i, stage in enumerate(STAGES):
+            vals = row[i * step:(i + 1) * step]
+            out[stage] = {"count": int(vals[0]), **{
+                name: (float(v) if v is not None else None) for (name, _), v in zip(PERCENTILES, vals[1:])
+            }}
+        return out
+    rows = (await session.execute(select(*cols.values()).where(window))).all()
+    for i, stage in enumerate(STAGES):
+        values = sorted(r[i] for r in rows if r[i] is not None)
+        out[stage] = {"count": len(values), **{name: _percentile(values, q) for name, q in PERCENTILES}}
+    return out
@@ -0,0 +1,53 @@
+from collections import OrderedDict
+from typing import Dict, Optional
+from app.config import settings
+
+def normalize_email(email: Optional[str]) -> str:
+    return (email or "").strip().lower()
+
+class UserIdCache:
+    """LRU en proceso: email normalizado -> id de `email_user`.
+
+    Solo se guardan ids ya confirmados en la base (leídos o insertados y con commit),
+    así que una transacción revertida nunca deja un id inexistente en el caché. Un
+    email nunca cambia de id (no hay borrado ni fusión de usuarios); si se agrega,
+    debe llamar a `discard`.
+    """
+
+    def __init__(self, max_size: int = settings.USER_CACHE_SIZE):
+        self.max_size = max(0, max_size)
+        self._ids: "OrderedDict[str, str]" = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, email: str) -> Optional[str]:
+        user_id = self._ids.get(email)
+        if user_id is None:
+            self.misses += 1
+            return None
+        self._ids.move_to_end(email)
+        self.hits += 1
+        return user_id
+
+    def put(self, email: str, user_id: str) -> None:
+        if not self.max_size or not email:
+            return
+        self._ids[email] = user_id
+        self._ids.move_to_end(email)
+        while len(self._ids) > self.max_size:
+            self._ids.popitem(last=False)
+
+    def put_many(self, ids_by_email: Dict[str, str]) -> None:
+        for email, user_id in ids_by_email.items():
+            self.put(email, user_id)
+
+    def discard(self, email: str) -> None:
+        self._ids.pop(email, None)
+
+    def clear(self) -> None:
+        self._ids.clear()
+
+    def __len__(self) -> int:
+        return len(self._ids)
+
+USER_IDS = UserIdCache()
@@ -0,0 +1,109 @@
+"""Captura del tráfico del poller para reproducirlo fuera de producción.
+
+Con `POLLER_CAPTURE_PATH` definido, cada correo procesado agrega un registro JSON
+(una línea) a un archivo gzip de solo anexado: el mensaje tal como lo devolvió
+Graph, los adjuntos de carga masiva, el texto ya preprocesado, la respuesta cruda
+del LLM, el intent, el resultado de la acción y la respuesta enviada.
+`benchmarks.replay` vuelve a pasar esos registros por `process_message`.
+
+El archivo contiene correos reales (datos personales): tratarlo como tal.
+"""
+import asyncio
+import base64
+import gzip
+import json
+import zlib
+from datetime import datetime
+from types import SimpleNamespace
+from typing import Any, AsyncIterator, Dict, Iterator, List, Optional
+
+CAPTURE_VERSION = 1
+
+class CaptureWriter:
+    """Escritor de NDJSON comprimido. Cada apertura agrega un miembro gzip nuevo (gzip los concatena)."""
+
+    def __init__(self, path: str, *, flush_every: int = 50):
+        self.path = path
+        self.flush_every = max(1, flush_every)
+        self.written = 0
+        self._pending = 0
+        self._fh = gzip.open(path, "ab")
+
+    def write(self, record: Dict[str, Any]) -> None:
+        line = json.dumps({"v": CAPTURE_VERSION, "captured_at": datetime.utcnow().isoformat() + "Z", **record},
+                          ensure_ascii=False, default=str)
+        self._fh.write(line.encode("utf-8") + b"\n")
+        self.written += 1
+        self._pending += 1
+        if self._pending >= self.flush_every:
+            self.flush()
+
+    def flush(self) -> None:
+        # Z_SYNC_FLUSH deja legible todo lo escrito aunque el proceso muera sin cerrar el archivo.
+        self._fh.flush(zlib.Z_SYNC_FLUSH)
+        self._pending = 0
+
+    def close(self) -> None:
+        if not self._fh.closed:
+            self._fh.close()
+
+def read_capture(path: str) -> Iterator[Dict[str, Any]]:
+    """Registros de un archivo de captura, en orden. Tolera un final truncado (proceso interrumpido)."""
+    with gzip.open(path, "rb") as fh:
+        while True:
+            try:
+                line = fh.readline()
+            except (EOFError, zlib.error):
+                return
+            if not line:
+                return
+            if line.endswith(b"\n"):
+                yield json.loads(line)
+
+async def tee_chunks(chunks: AsyncIterator[bytes], sink: List[bytes]) -> AsyncIterator[bytes]:
+    """Deja pasar el flujo de un adjunto guardando una copia para la captura."""
+    async for chunk in chunks:
+        sink.append(chunk)
+        yield chunk
+
+def encode_bytes(data: bytes) -> str:
+    return base64.b64encode(data).decode("ascii")
+
+def decode_bytes(data: str) -> bytes:
+    return base64.b64decode(data)
+
+class RecordingLLM:
+    """Envuelve el cliente del LLM para un solo correo y guarda su respuesta cruda."""
+
+    def __init__(self, inner):
+        self.inner = inner
+        self.response: Optional[Dict[str, Any]] = None
+
+    async def ainvoke(self, messages):
+        try:
+            resp = await self.inner.ainvoke(messages)
+        except Exception as ex:
+            self.response = {"error": str(ex)}
+            raise
+        content = getattr(resp, "content", "")
+        self.response = {
+            "content": content if isinstance(content, str) else str(content),
+            "usage": dict(getattr(resp, "usage_metadata", None) or {}),
+        }
+        return resp
+
+class RecordedLLM:
+    """Devuelve la respuesta grabada en la captura, con el mismo contrato que `GeminiClient.ainvoke`."""
+
+    def __init__(self, response: Optional[Dict[str, Any]], *, latency: float = 0.0):
+        self.response = response or {"error": "sin respuesta grabada"}
+        self.latency = latency
+        self.calls = 0
+
+    async def ainvoke(self, messages):
+        self.calls += 1
+        if self.latency > 0:
+            await asyncio.sleep(self.latency)
+        if "error" in self.response:
+            raise RuntimeError(f"LLM (grabado): {self.response['error']}")
+        return SimpleNamespace(content=self.response.get("content", ""), usage_metadata=self.response.get("usage") or {})
@@ -0,0 +1,159 @@
+import asyncio
+from datetime import datetime, timedelta
+from typing import Any, Dict, List
+from sqlalchemy import select, delete, insert
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker
+from app.config import settings
+from app.db import dialect_insert
+from app.models import EmailLog, EmailLogArchive, EmailTrace
+
+_ARCHIVE_COLUMNS = ("id", "message_id", "from_email", "subject", "processed", "processed_at")
+
+class EmailLogBuffer:
+    """Escritura diferida de `EmailLog` (y su `EmailTrace`): acumula filas y las inserta por lotes fuera del ciclo de correo."""
+
+    def __init__(
+        self,
+        session_factory: async_sessionmaker,
+        *,
+        batch_size: int = settings.EMAIL_LOG_FLUSH_BATCH,
+        flush_seconds: float = settings.EMAIL_LOG_FLUSH_SECONDS,
+        max_pending: int | None = None,
+    ):
+        self._session_factory = session_factory
+        self.batch_size = max(1, batch_size)
+        self.flush_seconds = max(0.1, flush_seconds)
+        # Si la DB no responde, se retienen a lo sumo `max_pending` filas (las más nuevas).
+        self.max_pending = max_pending or self.batch_size * 20
+        self._pending: List[Dict[str, Any]] = []
+        self._traces: List[Dict[str, Any]] = []
+        self._wakeup = asyncio.Event()
+        self._lock = asyncio.Lock()
+
+    def __len__(self) -> int:
+        return len(self._pending)
+
+    def add(self, *, message_id: str | None, from_email: str, subject: str | None,
+            processed: bool = True, processed_at: datetime | None = None,
+            trace: Dict[str, Any] | None = None) -> None:
+        if trace:
+            self._traces.append(trace)
+        self._pending.append({
+            "message_id": message_id,
+            "from_email": from_email or "",
+            "subject": subject,
+            "processed": processed,
+            "processed_at": processed_at or datetime.utcnow(),
+        })
+        if len(self._pending) >= self.batch_size:
+            self._wakeup.set()
+
+    async def flush(self) -> int:
+        async with self._lock:
+            rows, self._pending = self._pending, []
+            traces, self._traces = self._traces, []
+            if not rows and not traces:
+                return 0
+            try:
+                async with self._session_factory() as session:
+                    if rows:
+                        stmt = dialect_insert(session, EmailLog).on_conflict_do_nothing(index_elements=["message_id"])
+                        await session.execute(stmt, rows)
+                    if traces:
+                        await session.execute(insert(EmailTrace), traces)
+                    await session.commit()
+            except BaseException:
+                self._pending = (rows + self._pending)[-self.max_pending:]
+                self._traces = (traces + self._traces)[-self.max_pending:]
+                raise
+            return len(rows)
+
+    async def run(self) -> None:
+        """Bucle de vaciado: cada `flush_seconds` o en cuanto se llena un lote."""
+        while True:
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout=self.flush_seconds)
+            except asyncio.TimeoutError:
+                pass
+            self._wakeup.clear()
+            try:
+                await self.flush()
+            except Exception as ex:
+                print(f"[email_log] Error al guardar lote ({len(self._pending)} pendientes): {ex}")
+
+async def prune_email_logs(
+    session: AsyncSession,
+    *,
+    older_than: datetime,
+    batch_size: int = settings.EMAIL_LOG_PRUNE_BATCH,
+    archive: bool = settings.EMAIL_LOG_ARCHIVE,
+) -> int:
+    """Elimina (y opcionalmente archiva) registros anteriores a `older_than` en lotes pequeños.
+
+    Cada lote es su propia transacción para no retener locks ni inflar el WAL.
+    """
+    removed = 0
+    while True:
+        ids = (await session.execute(
+            select(EmailLog.id)
+            .where(EmailLog.processed_at < older_than)
+            .order_by(EmailLog.processed_at)
+            .limit(batch_size)
+        )).scalars().all()
+        if not ids:
+            break
+        if archive:
+            cols = [getattr(EmailLog, c) for c in _ARCHIVE_COLUMNS]
+            await session.execute(
+                insert(EmailLogArchive).from_select(_ARCHIVE_COLUMNS, select(*cols).where(EmailLog.id.in_(ids)))
+            )
+        await session.execute(delete(EmailLog).where(EmailLog.id.in_(ids)))
+        await session.commit()
+        removed += len(ids)
+        if len(ids) < batch_size:
+            break
+        await asyncio.sleep(0)
+    return removed
+
+async def prune_email_traces(
+    session: AsyncSession,
+    *,
+    older_than: datetime,
+    batch_size: int = settings.EMAIL_LOG_PRUNE_BATCH,
+) -> int:
+    """Elimina las trazas (`EmailTrace`) tomadas antes de `older_than`, en lotes como `prune_email_logs`."""
+    removed = 0
+    while True:
+        ids = (await session.execute(
+            select(EmailTrace.id)
+            .where(EmailTrace.picked_up_at < older_than)
+            .order_by(EmailTrace.picked_up_at)
+            .limit(batch_size)
+        )).scalars().all()
+        if not ids:
+            break
+        await session.execute(delete(EmailTrace).where(EmailTrace.id.in_(ids)))
+        await session.commit()
+        removed += len(ids)
+        if len(ids) < batch_size:
+            break
+        await asyncio.sleep(0)
+    return removed
+
+async def run_email_log_retention(session_factory: async_sessionmaker) -> None:
+    """Poda periódica de `email_log` y `email_trace` según EMAIL_LOG_RETENTION_DAYS (0 la desactiva)."""
+    days = settings.EMAIL_LOG_RETENTION_DAYS
+    if days <= 0:
+        return
+    interval = max(60, settings.EMAIL_LOG_PRUNE_INTERVAL_SECONDS)
+    while True:
+        try:
+            older_than = datetime.utcnow() - timedelta(days=days)
+            async with session_factory() as session:
+                removed = await prune_email_logs(session, older_than=older_than)
+                traces = await prune_email_traces(session, older_than=older_than)
+            if removed or traces:
+                print(f"[email_log] Poda: {removed} registros y {traces} trazas con más de {days} días.")
+        except Exception as ex:
+            print(f"[email_log] Error en poda: {ex}")
+        await asyncio.sleep(interval)
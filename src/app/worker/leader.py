@@ -0,0 +1,151 @@
+"""Elección de líder por lease en la base de datos.
+
+Cada réplica de la API crea un `LeaderElector`; solo la que tiene el lease vigente
+(fila `leader_lease` con `expires_at` en el futuro) ejecuta la tarea, el resto sigue
+atendiendo HTTP. El titular renueva cada `renew_every` segundos; si muere, otra
+réplica toma el lease en cuanto vence (`ttl`). Al apagarse, el titular lo libera
+para que el relevo sea inmediato.
+
+Se usa una fila en lugar de `pg_advisory_lock` para que funcione igual en SQLite y
+PostgreSQL y no dependa de mantener abierta una conexión dedicada (que un pooler
+en modo transacción no garantiza). Los relojes de las réplicas deben estar
+sincronizados (NTP) con un margen muy inferior a `ttl`.
+"""
+import asyncio
+import os
+import socket
+import uuid
+from datetime import datetime, timedelta
+from typing import Awaitable, Callable, Optional
+from sqlalchemy import case, or_, update
+from sqlalchemy.ext.asyncio import async_sessionmaker
+from app.config import settings
+from app.db import dialect_insert
+from app.metrics import POLLER_LEADER
+from app.models import LeaderLease
+
+def default_holder() -> str:
+    return f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}"
+
+class LeaderElector:
+    def __init__(
+        self,
+        session_factory: async_sessionmaker,
+        name: str = "email_poller",
+        *,
+        holder: Optional[str] = None,
+        ttl: float = settings.LEADER_LEASE_TTL_SECONDS,
+        renew_every: float = settings.LEADER_RENEW_SECONDS,
+    ):
+        self.session_factory = session_factory
+        self.name = name
+        self.holder = holder or default_holder()
+        self.ttl = max(1.0, ttl)
+        # Renovar al menos dos veces por lease: un fallo aislado no provoca relevo.
+        self.renew_every = min(max(0.1, renew_every), self.ttl / 2)
+        self.is_leader = False
+        self._lease_until: Optional[datetime] = None
+        self._task: Optional[asyncio.Task] = None
+        self._runner: Optional[asyncio.Task] = None
+
+    async def try_acquire(self) -> bool:
+        """Toma o renueva el lease. True si esta réplica queda como titular."""
+        now = datetime.utcnow()
+        expires = now + timedelta(seconds=self.ttl)
+        async with self.session_factory() as session:
+            # Renueva el propio lease o toma uno vencido; la condición hace la operación atómica.
+            res = await session.execute(
+                update(LeaderLease)
+                .where(LeaderLease.name == self.name)
+                .where(or_(LeaderLease.holder == self.holder, LeaderLease.expires_at < now))
+                .values(
+                    holder=self.holder, renewed_at=now, expires_at=expires,
+                    acquired_at=case((LeaderLease.holder == self.holder, LeaderLease.acquired_at), else_=now),
+                )
+                .execution_options(synchronize_session=False)
+            )
+            acquired = res.rowcount == 1
+            if not acquired:
+                res = await session.execute(
+                    dialect_insert(session, LeaderLease)
+                    .values(name=self.name, holder=self.holder, acquired_at=now, renewed_at=now, expires_at=expires)
+                    .on_conflict_do_nothing(index_elements=["name"])
+                )
+                acquired = res.rowcount == 1
+            await session.commit()
+        self._set_leader(acquired, expires if acquired else None)
+        return acquired
+
+    async def release(self) -> None:
+        """Cede el lease (lo deja vencido) si esta réplica es la titular."""
+        if not self.is_leader:
+            return
+        try:
+            async with self.session_factory() as session:
+                await session.execute(
+                    update(LeaderLease)
+                    .where(LeaderLease.name == self.name, LeaderLease.holder == self.holder)
+                    .values(expires_at=datetime.utcnow() - timedelta(seconds=1))
+                    .execution_options(synchronize_session=False)
+                )
+                await session.commit()
+        except Exception as ex:
+            print(f"[leader] Error liberando lease '{self.name}': {ex}")
+        self._set_leader(False, None)
+
+    def _set_leader(self, leader: bool, until: Optional[datetime]) -> None:
+        if leader != self.is_leader:
+            print(f"[leader] {self.holder} {'toma' if leader else 'deja'} el lease '{self.name}'")
+        self.is_leader = leader
+        self._lease_until = until
+        POLLER_LEADER.set(1 if leader else 0)
+
+    async def _stop_task(self) -> None:
+        task, self._task = self._task, None
+        if task and not task.done():
+            task.cancel()
+            try:
+                await task
+            except (asyncio.CancelledError, Exception):
+                pass
+
+    async def run(self, work: Callable[[], Awaitable[None]]) -> None:
+        """Compite por el lease y ejecuta `work()` mientras esta réplica sea la titular."""
+        try:
+            while True:
+                try:
+                    await self.try_acquire()
+                except Exception as ex:
+                    print(f"[leader] Error renovando lease '{self.name}': {ex}")
+                    # Sin poder renovar, se deja de actuar como líder antes de que venza el lease.
+                    if self.is_leader and (self._lease_until is None or datetime.utcnow() + timedelta(seconds=self.renew_every) >= self._lease_until):
+                        self._set_leader(False, None)
+                if self.is_leader and self._task is None:
+                    self._task = asyncio.create_task(work())
+                elif not self.is_leader and self._task is not None:
+                    print(f"[leader] Lease '{self.name}' perdido: se detiene la tarea")
+                    await self._stop_task()
+                if self._task is not None and self._task.done():
+                    exc = None if self._task.cancelled() else self._task.exception()
+                    if exc is None:
+                        break  # la tarea terminó por sí sola (p. ej. configuración incompleta)
+                    print(f"[leader] La tarea '{self.name}' falló: {exc}; se reinicia")
+                    self._task = None
+                await asyncio.sleep(self.renew_every)
+        finally:
+            await self._stop_task()
+            await self.release()
+
+    def start(self, work: Callable[[], Awaitable[None]]) -> asyncio.Task:
+        self._runner = asyncio.create_task(self.run(work))
+        return self._runner
+
+    async def stop(self) -> None:
+        """Detiene la tarea y libera el lease para que otra réplica la retome sin esperar el ttl."""
+        runner, self._runner = self._runner, None
+        if runner and not runner.done():
+            runner.cancel()
+            try:
+                await runner
+            except asyncio.CancelledError:
+                pass
@@ -1,241 +1,350 @@
 import asyncio
-from datetime import datetime
+import time
+from contextlib import asynccontextmanager
+from dataclasses import dataclass
+from datetime import datetime, timezone
 import re
 from app.config import settings
 from app.email.client import GraphClient
+from app.nlp.client import GeminiClient
 from app.nlp.parser import extract_intent_sql_like
-from app.db import SessionLocal
-from app.models import EmailLog
+from app.db import ReadSessionLocal, SessionLocal, read_session
+from app.worker.email_log import EmailLogBuffer, run_email_log_retention
+from app.bulk_import import attachment_format, import_copies
+from app.replies import render_reply, strip_page_token
+from app.worker.capture import CaptureWriter, RecordingLLM, encode_bytes, tee_chunks
+from app.worker.throttle import RATE_LIMITED, SenderThrottle
+from app.traces import StageTrace
+from app.metrics import DB_ACTION_SECONDS, EMAIL_BACKLOG, EMAIL_E2E_SECONDS, EMAILS_PROCESSED, EMAILS_SUPPRESSED
 from app.actions import list_books, register_book, register_copy, reserve, renew, cancel, delete_book
 
+KNOWN_INTENTS = {"list_books", "register_book", "register_copy", "register_copies_bulk", "reserve", "renew", "cancel", "delete_book"}
+
 def _html_to_text(html: str | None) -> str:
     if not html:
         return ""
     return re.sub(r"<[^>]+>", " ", html).replace("&nbsp;", " ").strip()
 
-def _friendly_reply(intent: str, params: dict, result: dict, processed_at_iso: str) -> str:
-    success = result.get("ok", False)
-    data = result.get("data") or {}
-    code = result.get("code") or ""
-    def _val(k, alt=None): return data.get(k) or params.get(k) or alt
-    def _line_items(lines: list[str]) -> list[str]:
-        return [f"- {ln}" for ln in lines if ln]
-    def _header(txt: str) -> str:
-        return txt.strip()
-    lines: list[str] = ["¡Hola! 👋", ""]
-    if intent == "reserve":
-        if success:
-            lines.append(_header("✅ Reserva realizada con éxito."))
-            items = _line_items([
-                f"Libro: {_val('title', 'desconocido')} (ID: {_val('book_id','-')})",
-                f"Copia (barcode): {_val('barcode','-')}",
-                f"Ubicación: {_val('location','-')}",
-                f"Usuario: {_val('user_email','-')}",
-                f"Vencimiento: {_val('due_date','-')}",
-                f"Renovaciones: {_val('renewed_cnt', 0)}",
-                f"Id de reservación: {_val('reservation_id','-')}",
-            ])
-            lines += items
-        else:
-            msg = {
-                "BOOK_NOT_FOUND": "No encontré el libro por id/título.",
-                "NO_AVAILABLE_COPIES": "No hay copias disponibles para ese libro.",
-                "MISSING_EMAIL": "Falta el correo del solicitante."
-            }.get(code, result.get("message") or "No pudimos realizar la reserva.")
-            lines.append(f"❌ {msg}")
-    elif intent == "renew":
-        if success:
-            lines.append(_header("🔁 Renovación exitosa."))
-            items = _line_items([
-                f"Copia (barcode): {_val('barcode','-')}",
-                f"Libro: {_val('title','-')} (ID: {_val('book_id','-')})",
-                f"Usuario: {_val('user_email','-')}",
-                f"Nuevo vencimiento: {_val('due_date','-')}",
-                f"Total de renovaciones: {_val('renewed_cnt','-')}",
-                f"Id de reservación: {_val('reservation_id','-')}",
-            ])
-            lines += items
-        else:
-            msg = {
-                "MISSING_FIELDS": "Debes enviar barcode y email.",
-                "USER_NOT_FOUND": "No encontré al usuario.",
-                "COPY_NOT_FOUND": "No encontré la copia indicada.",
-                "ACTIVE_RESERVATION_NOT_FOUND": "No hay una reservación activa para esos datos.",
-                "RESERVATION_EXPIRED": "La reservación está vencida; no se puede renovar."
-            }.get(code, result.get("message") or "No pudimos renovar la reservación.")
-            lines.append(f"❌ {msg}")
-    elif intent == "cancel":
-        if success:
-            lines.append(_header("🗑️ Reservación cancelada."))
-            items = _line_items([
-                f"Libro: {_val('title','-')} (ID: {_val('book_id','-')})",
-                f"Copia (barcode): {_val('barcode','-')}",
-                f"Usuario: {_val('user_email','-')}",
-                f"Cancelado en: {_val('canceled_at','-')}",
-                f"Id de reservación: {_val('reservation_id','-')}",
-            ])
-            lines += items
-        else:
-            msg = {
-                "MISSING_FIELDS": "Debes enviar barcode y email.",
-                "USER_NOT_FOUND": "No encontré al usuario.",
-                "COPY_NOT_FOUND": "No encontré la copia indicada.",
-                "ACTIVE_RESERVATION_NOT_FOUND": "No hay una reservación activa para esos datos."
-            }.get(code, result.get("message") or "No pudimos cancelar la reservación.")
-            lines.append(f"❌ {msg}")
-    elif intent == "register_book":
-        if success:
-            lines.append(_header("📚 Libro registrado correctamente."))
-            items = _line_items([
-                f"Título: {_val('title','-')}",
-                f"Autor: {_val('author','-')}",
-                f"ID: {_val('book_id','-')}",
-                f"Creado en: {_val('created_at','-')}",
-            ])
-            lines += items
-        else:
-            msg = {
-                "MISSING_TITLE": "Falta el título del libro."
-            }.get(code, result.get("message") or "No pudimos registrar el libro.")
-            lines.append(f"❌ {msg}")
-    elif intent == "register_copy":
-        if success:
-            lines.append(_header("🧾 Copia registrada correctamente."))
-            items = _line_items([
-                f"Libro: {_val('title','-')} (ID: {_val('book_id','-')})",
-                f"Copia (barcode): {_val('barcode','-')}",
-                f"Ubicación: {_val('location','-')}",
-                f"ID de copia: {_val('copy_id','-')}",
-            ])
-            lines += items
-        else:
-            msg = {
-                "MISSING_FIELDS": "Faltan book_id, barcode o location.",
-                "BOOK_NOT_FOUND": "El libro indicado no existe.",
-                "BARCODE_EXISTS": "El código de barras ya existe."
-            }.get(code, result.get("message") or "No pudimos registrar la copia.")
-            lines.append(f"❌ {msg}")
-    elif intent == "list_books":
-        if success:
-            items = (data.get("items") or [])
-            total = sum(i.get("copies_total", 0) for i in items)
-            disp = sum(i.get("copies_available", 0) for i in items)
-            lines.append(_header("📖 Listado de libros (primeros 10):"))
-            for idx, it in enumerate(items[:10], start=1):
-                title = it.get("title") or "-"
-                author = it.get("author") or "-"
-                bid = it.get("book_id") or "-"
-                ct = it.get("copies_total", 0)
-                ca = it.get("copies_available", 0)
-                lines.append(f"{idx}) {title} — {author} | Copias: {ca}/{ct} (ID: {bid})")
-            lines.append("")
-            lines.append(f"Resumen: Libros: {len(items)} · Copias totales: {total} · Disponibles: {disp}.")
-        else:
-            lines.append("❌ No fue posible obtener el listado en este momento.")
-    elif intent == "delete_book":
-        if success:
-            lines.append(_header("🧹 Libro eliminado."))
-            items = _line_items([
-                f"Título: {_val('title','-')}",
-                f"ID: {_val('book_id','-')}",
-                f"Copias eliminadas: {_val('removed_copies',0)}",
-                f"Reservaciones eliminadas: {_val('removed_reservations',0)}",
-            ])
-            lines += items
+def _received_at(msg: dict) -> datetime | None:
+    raw = msg.get("receivedDateTime")
+    if not raw:
+        return None
+    try:
+        return datetime.fromisoformat(raw.replace("Z", "+00:00"))
+    except ValueError:
+        return None
+
+@asynccontextmanager
+async def _replica_session():
+    """Sesión de la réplica de lectura, o None sin réplica (no abrir una segunda sesión del primario)."""
+    if ReadSessionLocal is SessionLocal:
+        yield None
+        return
+    async with read_session() as rs:
+        yield rs
+
+async def _run_action(intent: str, params: dict, intent_data: dict, from_email: str, from_name: str) -> dict:
+    async with SessionLocal() as session:
+        try:
+            if intent == "list_books":
+                try:
+                    offset = max(0, int(params.get("offset") or 0))
+                except (TypeError, ValueError):
+                    offset = 0
+                async with read_session() as rs:
+                    return await list_books(rs, limit=settings.REPLY_LIST_PAGE_SIZE, offset=offset)
+            elif intent == "register_book":
+                return await register_book(session, title=params.get("title"), author=params.get("author"))
+            elif intent == "register_copy":
+                return await register_copy(session, book_id=params.get("book_id"), barcode=params.get("barcode"), location=params.get("location"))
+            elif intent == "reserve":
+                async with _replica_session() as rs:
+                    return await reserve(session,
+                        book_id=params.get("book_id"),
+                        book_title=params.get("book_title"),
+                        name=params.get("name") or from_name,
+                        email=params.get("email") or from_email,
+                        read_session=rs,
+                    )
+            elif intent == "renew":
+                return await renew(session, barcode=params.get("barcode"), email=params.get("email") or from_email)
+            elif intent == "cancel":
+                return await cancel(session, barcode=params.get("barcode"), email=params.get("email") or from_email)
+            elif intent == "delete_book":
+                return await delete_book(
+                    session,
+                    book_id=params.get("book_id"),
+                    book_title=params.get("book_title"),
+                )
+            return {"ok": False, "message": f"No entendí la solicitud. ({intent_data.get('reason','sin razón')})", "code": "UNKNOWN_INTENT"}
+        except Exception as action_ex:
+            return {"ok": False, "message": f"Error interno al ejecutar la operación: {action_ex}", "code": "ACTION_ERROR"}
+
+async def _bulk_attachments(client: GraphClient, msg_id: str, user_upn: str | None) -> list[tuple[dict, str]]:
+    atts = await client.list_attachments(msg_id, user_upn=user_upn)
+    return [(a, fmt) for a in atts if (fmt := attachment_format(a))]
+
+async def _run_bulk_import(client: GraphClient, msg_id: str, attachments: list[tuple[dict, str]], user_upn: str | None,
+                           captured: list | None = None) -> dict:
+    files = []
+    for att, fmt in attachments:
+        content: list[bytes] = []
+        # Rechazo temprano por el `size` de Graph; import_copies vuelve a limitar con los bytes reales.
+        if (att.get("size") or 0) > settings.BULK_MAX_ATTACHMENT_BYTES:
+            r = {"ok": False, "message": f"El archivo supera el máximo de {settings.BULK_MAX_ATTACHMENT_BYTES // (1024 * 1024)} MB.", "code": "FILE_TOO_LARGE"}
         else:
-            msg = {
-                "MISSING_ID_OR_TITLE": "Debes indicar el id o el título del libro.",
-                "BOOK_NOT_FOUND": "No encontré el libro solicitado."
-            }.get(code, result.get("message") or "No pudimos eliminar el libro.")
-            lines.append(f"❌ {msg}")
+            try:
+                chunks = client.stream_attachment(msg_id, att["id"], user_upn=user_upn)
+                if captured is not None:
+                    chunks = tee_chunks(chunks, content)
+                r = await import_copies(SessionLocal, chunks, fmt)
+            except Exception as ex:
+                r = {"ok": False, "message": f"Error interno al procesar el archivo: {ex}", "code": "ACTION_ERROR"}
+        files.append({"name": att.get("name"), **r})
+        if captured is not None:
+            captured.append({**att, "content": encode_bytes(b"".join(content)) if content else None})
+    inserted = sum((f.get("data") or {}).get("inserted", 0) for f in files)
+    total = sum((f.get("data") or {}).get("total", 0) for f in files)
+    ok = any(f["ok"] for f in files)
+    return {
+        "ok": ok, "message": f"Se registraron {inserted} de {total} copias.",
+        "code": "" if ok else files[0].get("code", ""), "data": {"files": files, "inserted": inserted, "total": total},
+    }
+
+def _capture(capture: CaptureWriter | None, **record) -> None:
+    if capture is None:
+        return
+    try:
+        capture.write(record)
+    except Exception as ex:
+        print(f"[poller] No se pudo escribir la captura: {ex}")
+
+async def process_message(client: GraphClient, msg: dict, *, throttle: SenderThrottle, log_buffer: EmailLogBuffer,
+                          llm=None, user_upn: str | None = None, capture: CaptureWriter | None = None) -> None:
+    """Procesa un correo no leído: interpreta, ejecuta la acción, responde y lo marca como leído.
+
+    Con `capture`, agrega el correo y lo que produjo cada etapa al archivo de captura.
+    """
+    msg_id = msg["id"]
+    trace = StageTrace(_received_at(msg))
+    with trace.stage("fetch"):
+        full = await client.get_message(msg_id, user_upn=user_upn)
+    subject = full.get("subject") or "(sin asunto)"
+    from_obj = (full.get("from") or {}).get("emailAddress") or {}
+    from_email = from_obj.get("address") or ""
+    from_name = from_obj.get("name") or ""
+    body_html = (full.get("body") or {}).get("content") or ""
+    body_text = _html_to_text(body_html) or (full.get("bodyPreview") or "")
+    suppressed = throttle.check(
+        from_email=from_email, subject=subject, body=body_text,
+        headers=full.get("internetMessageHeaders"), has_attachments=bool(full.get("hasAttachments")),
+    )
+    if suppressed:
+        EMAILS_SUPPRESSED.labels(suppressed).inc()
+        print(f"[poller] Correo de {from_email or '?'} suprimido ({suppressed}). Totales: {dict(throttle.suppressed)}")
+        if suppressed == RATE_LIMITED and throttle.should_notify(from_email):
+            notice = render_reply("rate_limited", {}, {"ok": False, "code": RATE_LIMITED}, datetime.utcnow().isoformat())
+            await client.send_mail(
+                to_email=from_email, subject=f"Re: {strip_page_token(subject) or '(sin asunto)'}", body_text=notice.text,
+                body_html=notice.html if settings.REPLY_HTML else None, user_upn=user_upn,
+            )
+        await client.mark_as_read(msg_id, True, user_upn=user_upn)
+        log_buffer.add(message_id=msg_id, from_email=from_email, subject=subject)
+        _capture(capture, mailbox=user_upn or client.user_upn, message=full, text=body_text, suppressed=suppressed)
+        return
+    bulk = []
+    if full.get("hasAttachments"):
+        with trace.stage("fetch"):
+            bulk = await _bulk_attachments(client, msg_id, user_upn)
+    recorder = None
+    if bulk:
+        # Planillas adjuntas: se aplican directo, sin pasar por el LLM.
+        intent_data = {
+            "intent": "register_copies_bulk", "params": {"files": [a.get("name") for a, _ in bulk]},
+            "confidence": 1.0, "reason": "adjunto de carga masiva",
+        }
     else:
-        lines.append("🤖 No entendí tu solicitud. ¿Podrías darme un poco más de contexto?")
-    lines.append("")
-    lines.append(f"(Procesado: {processed_at_iso}Z)")
-    return "\n".join(lines)
+        try:
+            if capture is not None:
+                recorder = RecordingLLM(llm or GeminiClient())
+            with trace.stage("llm"):
+                intent_data, sql_like = await extract_intent_sql_like(subject, body_text, client=recorder or llm)
+        except Exception as e:
+            intent_data = {"intent": "unknown", "params": {}, "confidence": 0.0, "reason": f"llm-error: {e}"}
+            sql_like = "-- no-sql (error LLM)"
+
+    intent = (intent_data.get("intent") or "unknown").strip()
+    params = intent_data.get("params") or {}
+    intent_label = intent if intent in KNOWN_INTENTS else "unknown"
+    action_t0 = time.perf_counter()
+    captured_files = [] if capture is not None and bulk else None
+    with trace.stage("db"):
+        if bulk:
+            result = await _run_bulk_import(client, msg_id, bulk, user_upn, captured_files)
+        else:
+            result = await _run_action(intent, params, intent_data, from_email, from_name)
+    action_elapsed = time.perf_counter() - action_t0
+    DB_ACTION_SECONDS.labels(intent_label).observe(action_elapsed)
+    EMAILS_PROCESSED.labels(intent_label, result.get("code") or ("OK" if result.get("ok") else "ERROR")).inc()
+    processed_at_iso = datetime.utcnow().isoformat()
+    reply = render_reply(intent, params, result, processed_at_iso, reply_to=user_upn or client.user_upn)
+    with trace.stage("reply"):
+        if from_email:
+            await client.send_mail(
+                to_email=from_email, subject=f"Re: {strip_page_token(subject) or '(sin asunto)'}", body_text=reply.text,
+                body_html=reply.html if settings.REPLY_HTML else None, user_upn=user_upn,
+            )
+            received_at = _received_at(full) or _received_at(msg)
+            if received_at:
+                EMAIL_E2E_SECONDS.observe((datetime.now(timezone.utc) - received_at).total_seconds())
+        await client.mark_as_read(msg_id, True, user_upn=user_upn)
+    log_buffer.add(
+        message_id=msg_id, from_email=from_email, subject=subject,
+        trace=trace.as_row(
+            message_id=msg_id, intent=intent_label,
+            confidence=intent_data.get("confidence"), usage=intent_data.get("usage"),
+        ),
+    )
+    _capture(
+        capture, mailbox=user_upn or client.user_upn, message=full, attachments=captured_files, text=body_text,
+        llm=recorder.response if recorder else None, intent=intent_data, result=result, reply=reply.text,
+        stages_ms=trace.stages_ms,
+    )
+
+async def poll_once(client: GraphClient, *, throttle: SenderThrottle, log_buffer: EmailLogBuffer, llm=None,
+                    top: int = 5, user_upn: str | None = None, capture: CaptureWriter | None = None) -> int:
+    """Un ciclo del poller sobre un buzón. Devuelve cuántos correos no leídos encontró."""
+    unread = await client.list_unread_messages(top=top, user_upn=user_upn)
+    EMAIL_BACKLOG.labels(user_upn or client.user_upn or "").set(len(unread))
+    if unread:
+        print(f"[poller] {user_upn or client.user_upn}: {len(unread)} no leídos.")
+    for msg in unread:
+        await process_message(client, msg, throttle=throttle, log_buffer=log_buffer, llm=llm, user_upn=user_upn, capture=capture)
+    return len(unread)
+
+def build_throttle(own_addresses: list[str] | None = None) -> SenderThrottle:
+    return SenderThrottle(
+        burst=settings.SENDER_BURST,
+        refill_per_hour=settings.SENDER_REFILL_PER_HOUR,
+        duplicate_window_seconds=settings.DUPLICATE_WINDOW_SECONDS,
+        own_addresses=own_addresses or [settings.GRAPH_USER_UPN],
+    )
+
+@dataclass
+class Mailbox:
+    """Estado de sincronización de un buzón: su agenda, su throttle y sus errores consecutivos."""
+    upn: str
+    interval: float
+    throttle: SenderThrottle
+    next_due: float = 0.0
+    last_polled_at: datetime | None = None
+    last_backlog: int = 0
+    processed: int = 0
+    errors: int = 0
+
+MAX_BACKOFF_SECONDS = 900
+
+def parse_mailboxes(raw: str | None, default_upn: str | None, default_interval: float) -> list[tuple[str, float]]:
+    """'a@x.org,b@x.org:120' -> [('a@x.org', default_interval), ('b@x.org', 120.0)]. Sin lista, usa `default_upn`."""
+    out: dict[str, float] = {}
+    for item in (raw or default_upn or "").split(","):
+        upn, _, secs = item.strip().partition(":")
+        if not upn:
+            continue
+        interval = default_interval
+        if secs.strip():
+            try:
+                interval = max(5.0, float(secs))
+            except ValueError:
+                print(f"[poller] Intervalo inválido en GRAPH_USER_UPNS ('{item.strip()}'); se usan {default_interval}s")
+        out.setdefault(upn.lower(), interval)
+    return list(out.items())
+
+def build_mailboxes(entries: list[tuple[str, float]]) -> list[Mailbox]:
+    # Todos los buzones propios cuentan como "nuestros": una sede no le responde en bucle a otra.
+    own = [upn for upn, _ in entries]
+    return [Mailbox(upn=upn, interval=interval, throttle=build_throttle(own)) for upn, interval in entries]
+
+async def _poll_mailbox(client: GraphClient, box: Mailbox, *, log_buffer: EmailLogBuffer, llm, quota: int,
+                        capture: CaptureWriter | None = None) -> None:
+    try:
+        seen = await poll_once(client, throttle=box.throttle, log_buffer=log_buffer, llm=llm, top=quota, user_upn=box.upn,
+                               capture=capture)
+    except Exception as ex:
+        box.errors += 1
+        delay = min(box.interval * 2 ** box.errors, MAX_BACKOFF_SECONDS)
+        box.next_due = time.monotonic() + delay
+        print(f"[poller] Error en buzón {box.upn} ({box.errors} seguidos); reintento en {delay:.0f}s: {ex}")
+        return
+    box.errors = 0
+    box.last_polled_at = datetime.utcnow()
+    box.last_backlog = seen
+    box.processed += seen
+    # Si agotó su cuota probablemente le quedan correos: vuelve a estar listo, pero detrás de los demás buzones.
+    box.next_due = time.monotonic() + (0 if seen >= quota else box.interval)
+
+async def poll_mailboxes(client: GraphClient, mailboxes: list[Mailbox], *, log_buffer: EmailLogBuffer, llm=None,
+                         quota: int = 5, concurrency: int = 4, capture: CaptureWriter | None = None) -> int:
+    """Un turno: atiende los buzones vencidos (los más atrasados primero), cada uno con a lo sumo `quota` correos."""
+    now = time.monotonic()
+    due = sorted((b for b in mailboxes if b.next_due <= now), key=lambda b: b.next_due)
+    sem = asyncio.Semaphore(max(1, concurrency))
+
+    async def _one(box: Mailbox):
+        async with sem:
+            await _poll_mailbox(client, box, log_buffer=log_buffer, llm=llm, quota=quota, capture=capture)
+
+    await asyncio.gather(*(_one(b) for b in due))
+    return len(due)
 
 async def run_poller():
-    if not all([settings.GRAPH_TENANT_ID, settings.GRAPH_CLIENT_ID, settings.GRAPH_CLIENT_SECRET, settings.GRAPH_USER_UPN]):
+    entries = parse_mailboxes(settings.GRAPH_USER_UPNS, settings.GRAPH_USER_UPN, max(5, int(settings.GRAPH_POLL_INTERVAL_SECONDS)))
+    if not all([settings.GRAPH_TENANT_ID, settings.GRAPH_CLIENT_ID, settings.GRAPH_CLIENT_SECRET, entries]):
         print("[poller] Falta configuración GRAPH_* en .env. Poller deshabilitado.")
         return
+    # Recursos compartidos por todos los buzones: pool HTTP + token de Graph, cliente de Gemini y pool de la DB.
     client = GraphClient(
         tenant_id=settings.GRAPH_TENANT_ID,
         client_id=settings.GRAPH_CLIENT_ID,
         client_secret=settings.GRAPH_CLIENT_SECRET,
-        user_upn=settings.GRAPH_USER_UPN,
     )
     try:
-        interval = max(5, int(settings.GRAPH_POLL_INTERVAL_SECONDS))
-        print(f"[poller] Iniciado. Intervalo: {interval}s | Buzón: {settings.GRAPH_USER_UPN}")
+        llm = GeminiClient()
+    except Exception as ex:
+        print(f"[poller] Cliente de Gemini no disponible: {ex}")
+        llm = None
+    mailboxes = build_mailboxes(entries)
+    capture = None
+    if settings.POLLER_CAPTURE_PATH:
+        try:
+            capture = CaptureWriter(settings.POLLER_CAPTURE_PATH)
+            print(f"[poller] Capturando tráfico en {settings.POLLER_CAPTURE_PATH}")
+        except OSError as ex:
+            print(f"[poller] No se pudo abrir el archivo de captura: {ex}")
+    log_buffer = EmailLogBuffer(SessionLocal)
+    background = [
+        asyncio.create_task(log_buffer.run()),
+        asyncio.create_task(run_email_log_retention(SessionLocal)),
+    ]
+    try:
+        try:
+            await client.start()
+        except Exception as ex:
+            print(f"[poller] No se pudo obtener el token inicial de Graph: {ex}")
+        print(f"[poller] Iniciado. Buzones: {', '.join(f'{b.upn} ({b.interval:.0f}s)' for b in mailboxes)}")
         while True:
-            try:
-                unread = await client.list_unread_messages(top=5)
-                if unread:
-                    print(f"[poller] {len(unread)} no leídos.")
-                for msg in unread:
-                    msg_id = msg["id"]
-                    full = await client.get_message(msg_id)
-                    subject = full.get("subject") or "(sin asunto)"
-                    from_obj = (full.get("from") or {}).get("emailAddress") or {}
-                    from_email = from_obj.get("address") or ""
-                    from_name = from_obj.get("name") or ""
-                    body_html = (full.get("body") or {}).get("content") or ""
-                    body_text = _html_to_text(body_html) or (full.get("bodyPreview") or "")
-                    try:
-                        intent_data, sql_like = await extract_intent_sql_like(subject, body_text)
-                    except Exception as e:
-                        intent_data = {"intent": "unknown", "params": {}, "confidence": 0.0, "reason": f"llm-error: {e}"}
-                        sql_like = "-- no-sql (error LLM)"
-
-                    intent = (intent_data.get("intent") or "unknown").strip()
-                    params = intent_data.get("params") or {}
-                    async with SessionLocal() as session:
-                        result = {"ok": False, "message": "No se pudo procesar la solicitud.", "code": "UNHANDLED_INTENT"}
-                        try:
-                            if intent == "list_books":
-                                result = await list_books(session)
-                            elif intent == "register_book":
-                                result = await register_book(session, title=params.get("title"), author=params.get("author"))
-                            elif intent == "register_copy":
-                                result = await register_copy(session, book_id=params.get("book_id"), barcode=params.get("barcode"), location=params.get("location"))
-                            elif intent == "reserve":
-                                result = await reserve(session,
-                                    book_id=params.get("book_id"),
-                                    book_title=params.get("book_title"),
-                                    name=params.get("name") or from_name,
-                                    email=params.get("email") or from_email
-                                )
-                            elif intent == "renew":
-                                result = await renew(session, barcode=params.get("barcode"), email=params.get("email") or from_email)
-                            elif intent == "cancel":
-                                result = await cancel(session, barcode=params.get("barcode"), email=params.get("email") or from_email)
-                            elif intent == "delete_book":
-                                result = await delete_book(
-                                    session,
-                                    book_id=params.get("book_id"),
-                                    book_title=params.get("book_title"),
-                                )
-                            else:
-                                result = {"ok": False, "message": f"No entendí la solicitud. ({intent_data.get('reason','sin razón')})", "code": "UNKNOWN_INTENT"}
-                        except Exception as action_ex:
-                            result = {"ok": False, "message": f"Error interno al ejecutar la operación: {action_ex}", "code": "ACTION_ERROR"}
-                        processed_at_iso = datetime.utcnow().isoformat()
-                        reply = _friendly_reply(intent, params, result, processed_at_iso)
-                        if from_email:
-                            await client.send_mail(to_email=from_email, subject=f"Re: {subject}", body_text=reply)
-                        await client.mark_as_read(msg_id, True)
-                        log = EmailLog(
-                            message_id=msg_id,
-                            from_email=from_email or "",
-                            subject=subject,
-                            processed=True,
-                            processed_at=datetime.utcnow(),
-                        )
-                        session.add(log)
-                        await session.commit()
-                await asyncio.sleep(interval)
-            except Exception as ex:
-                print(f"[poller] Error en ciclo: {ex}")
-                await asyncio.sleep(interval * 2)
+            await poll_mailboxes(
+                client, mailboxes, log_buffer=log_buffer, llm=llm,
+                quota=settings.GRAPH_MAILBOX_QUOTA, concurrency=settings.GRAPH_MAILBOX_CONCURRENCY, capture=capture,
+            )
+            await asyncio.sleep(max(0.0, min(b.next_due for b in mailboxes) - time.monotonic()))
     finally:
+        for task in background:
+            task.cancel()
+        try:
+            await log_buffer.flush()
+        except Exception as ex:
+            print(f"[poller] No se pudo guardar el registro pendiente: {ex}")
+        if capture is not None:
+            capture.close()
         await client.aclose()
@@ -0,0 +1,138 @@
+import hashlib
+import re
+import time
+from collections import Counter, OrderedDict
+from typing import Callable, Iterable, Optional
+
+# Motivos de supresión (también usados como etiqueta en métricas).
+LOOP = "loop"
+DUPLICATE = "duplicate"
+RATE_LIMITED = "rate_limited"
+
+_AUTO_PRECEDENCE = {"bulk", "junk", "list", "auto_reply"}
+_AUTO_HEADERS = {"x-autoreply", "x-autorespond", "x-auto-response"}
+_REPLY_PREFIX = re.compile(r"^\s*((re|rv|fw|fwd|aw|respuesta|automatic reply|respuesta automática)\s*:\s*)", re.I)
+
+def _strip_prefixes(subject: str) -> tuple[str, int]:
+    count = 0
+    s = subject or ""
+    while True:
+        m = _REPLY_PREFIX.match(s)
+        if not m:
+            return s.strip().lower(), count
+        s = s[m.end():]
+        count += 1
+
+def is_auto_generated(headers: Iterable[dict] | None, from_email: str, subject: str, own_addresses: Iterable[str] = ()) -> bool:
+    """Detecta autorespuestas, rebotes y nuestras propias respuestas que vuelven al buzón."""
+    sender = (from_email or "").strip().lower()
+    if not sender or sender in {a.strip().lower() for a in own_addresses if a}:
+        return True
+    for h in headers or ():
+        name = (h.get("name") or "").strip().lower()
+        value = (h.get("value") or "").strip().lower()
+        if name == "auto-submitted" and value and value != "no":
+            return True
+        if name == "precedence" and value in _AUTO_PRECEDENCE:
+            return True
+        if name in _AUTO_HEADERS:
+            return True
+        if name == "return-path" and value in {"<>", ""}:
+            return True
+    _, prefixes = _strip_prefixes(subject)
+    return prefixes >= 3
+
+class TokenBucket:
+    __slots__ = ("tokens", "updated")
+
+    def __init__(self, capacity: float, now: float):
+        self.tokens = capacity
+        self.updated = now
+
+class SenderThrottle:
+    """Limitador por remitente (token bucket), detección de bucles y fusión de solicitudes repetidas."""
+
+    def __init__(
+        self,
+        *,
+        burst: int,
+        refill_per_hour: float,
+        duplicate_window_seconds: float,
+        own_addresses: Iterable[str] = (),
+        max_tracked: int = 10_000,
+        clock: Callable[[], float] = time.monotonic,
+    ):
+        self.capacity = float(max(1, burst))
+        self.refill_per_sec = max(0.0, refill_per_hour) / 3600.0
+        self.window = max(0.0, duplicate_window_seconds)
+        self.own_addresses = [a for a in own_addresses if a]
+        self.max_tracked = max_tracked
+        self._clock = clock
+        self._buckets: "OrderedDict[str, TokenBucket]" = OrderedDict()
+        self._recent: "OrderedDict[str, float]" = OrderedDict()
+        self._notified: "OrderedDict[str, None]" = OrderedDict()
+        self.suppressed: Counter = Counter()
+
+    def _request_key(self, sender: str, subject: str, body: str) -> str:
+        norm_subject, _ = _strip_prefixes(subject)
+        norm_body = " ".join((body or "").lower().split())
+        return hashlib.sha1(f"{sender}\x00{norm_subject}\x00{norm_body}".encode("utf-8")).hexdigest()
+
+    def _take_token(self, sender: str, now: float) -> bool:
+        bucket = self._buckets.get(sender)
+        if bucket is None:
+            bucket = TokenBucket(self.capacity, now)
+            self._buckets[sender] = bucket
+            if len(self._buckets) > self.max_tracked:
+                self._buckets.popitem(last=False)
+        else:
+            self._buckets.move_to_end(sender)
+            bucket.tokens = min(self.capacity, bucket.tokens + (now - bucket.updated) * self.refill_per_sec)
+            bucket.updated = now
+        if bucket.tokens < 1.0:
+            return False
+        bucket.tokens -= 1.0
+        return True
+
+    def check(self, *, from_email: str, subject: str, body: str, headers: Iterable[dict] | None = None,
+              has_attachments: bool = False) -> Optional[str]:
+        """Devuelve el motivo de supresión (LOOP, DUPLICATE, RATE_LIMITED) o None si el correo debe procesarse.
+
+        Los correos con adjuntos no se fusionan: dos planillas distintas pueden llegar con el mismo texto.
+        """
+        reason = self._check(from_email, subject, body, headers, has_attachments)
+        if reason:
+            self.suppressed[reason] += 1
+        return reason
+
+    def _check(self, from_email, subject, body, headers, has_attachments=False) -> Optional[str]:
+        if is_auto_generated(headers, from_email, subject, self.own_addresses):
+            return LOOP
+        sender = from_email.strip().lower()
+        now = self._clock()
+        key = None
+        if self.window and not has_attachments:
+            key = self._request_key(sender, subject, body)
+            seen = self._recent.get(key)
+            if seen is not None and now - seen < self.window:
+                return DUPLICATE
+        if not self._take_token(sender, now):
+            return RATE_LIMITED
+        self._notified.pop(sender, None)
+        # Solo una solicitud que se procesa ocupa la ventana de duplicados: el reintento tras un rechazo pasa.
+        if key is not None:
+            self._recent[key] = now
+            self._recent.move_to_end(key)
+            while self._recent and (len(self._recent) > self.max_tracked or now - next(iter(self._recent.values())) >= self.window):
+                self._recent.popitem(last=False)
+        return None
+
+    def should_notify(self, from_email: str) -> bool:
+        """True la primera vez que un remitente es limitado (hasta que vuelva a tener cupo): se le avisa una sola vez."""
+        sender = (from_email or "").strip().lower()
+        if not sender or sender in self._notified:
+            return False
+        self._notified[sender] = None
+        if len(self._notified) > self.max_tracked:
+            self._notified.popitem(last=False)
+        return True
@@ -0,0 +1,91 @@
+"""Utilidades compartidas por los benchmarks: versión del código, guardado y comparación de resultados."""
+import json
+import os
+import platform
+import subprocess
+from datetime import datetime
+from pathlib import Path
+from typing import Any, Dict, Iterable, Optional
+from sqlalchemy.engine import make_url
+
+RESULTS_DIR = Path(__file__).resolve().parent / "results"
+
+def use_database(url: Optional[str], default: str) -> str:
+    """Fija DATABASE_URL antes de importar `app` (la configuración se lee al importar).
+
+    Nunca se hereda DATABASE_URL del entorno: los benchmarks vacían la base (`reset_database`)
+    y la del entorno suele ser la de la app. Sin `url` explícita se usa `default`, un SQLite propio.
+    """
+    if not url and os.environ.get("DATABASE_URL"):
+        print(f"[bench] Se ignora DATABASE_URL del entorno; se usa {default} (pasa --url para otra base)")
+    url = url or default
+    os.environ["DATABASE_URL"] = url
+    return url
+
+async def reset_database(url: str) -> None:
+    """Deja la base vacía con el esquema de la app (borra el archivo en SQLite)."""
+    from app.db import Base, engine, init_db
+    from app import models
+    from app.users import USER_IDS
+    USER_IDS.clear()
+    u = make_url(url)
+    if u.get_backend_name() == "sqlite":
+        if u.database and u.database != ":memory:":
+            await engine.dispose()
+            Path(u.database).unlink(missing_ok=True)
+    else:
+        async with engine.begin() as conn:
+            await conn.run_sync(Base.metadata.drop_all)
+    await init_db()
+
+def git_commit() -> str:
+    try:
+        out = subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True, check=True,
+            cwd=Path(__file__).resolve().parent,
+        )
+        dirty = subprocess.run(
+            ["git", "status", "--porcelain", "--untracked-files=no"], capture_output=True, text=True,
+            cwd=Path(__file__).resolve().parent,
+        ).stdout.strip()
+        return out.stdout.strip() + ("-dirty" if dirty else "")
+    except (OSError, subprocess.CalledProcessError):
+        return "unknown"
+
+def save_result(kind: str, payload: Dict[str, Any], out_dir: Optional[Path] = None) -> Path:
+    out_dir = Path(out_dir or RESULTS_DIR)
+    out_dir.mkdir(parents=True, exist_ok=True)
+    commit = git_commit()
+    stamp = datetime.utcnow().strftime("%Y%m%dT%H%M%SZ")
+    doc = {
+        "kind": kind,
+        "commit": commit,
+        "created_at": stamp,
+        "python": platform.python_version(),
+        "machine": platform.machine(),
+        **payload,
+    }
+    path = out_dir / f"{kind}-{stamp}-{commit}.json"
+    path.write_text(json.dumps(doc, indent=2, ensure_ascii=False), encoding="utf-8")
+    return path
+
+def latest_result(kind: str, out_dir: Optional[Path] = None, exclude: Optional[Path] = None) -> Optional[Path]:
+    files = sorted(p for p in Path(out_dir or RESULTS_DIR).glob(f"{kind}-*.json") if p != exclude)
+    return files[-1] if files else None
+
+def _get(doc: Dict[str, Any], dotted: str):
+    cur: Any = doc
+    for part in dotted.split("."):
+        if not isinstance(cur, dict) or part not in cur:
+            return None
+        cur = cur[part]
+    return cur
+
+def compare(current: Dict[str, Any], baseline: Dict[str, Any], keys: Iterable[str]) -> Dict[str, Dict[str, Any]]:
+    """Diferencia relativa (%) de cada métrica `a.b.c` entre dos resultados."""
+    out = {}
+    for key in keys:
+        cur, base = _get(current, key), _get(baseline, key)
+        if isinstance(cur, (int, float)) and isinstance(base, (int, float)) and base:
+            out[key] = {"baseline": base, "current": cur, "change_pct": round((cur - base) / base * 100, 1)}
+    return out
@@ -0,0 +1,98 @@
+"""Generador de catálogos sintéticos para benchmarks (libros, copias, usuarios y reservaciones).
+
+Se inserta por lotes con Core (`insert()` + executemany) y se genera en streaming, así
+que 1M de copias no se materializan en memoria. Es determinista para una misma semilla.
+"""
+import random
+import uuid
+from dataclasses import dataclass, field
+from datetime import datetime, timedelta
+from typing import List, Tuple
+
+CHUNK_ROWS = 5000
+
+@dataclass
+class Catalog:
+    book_ids: List[str]
+    copies: int = 0
+    users: int = 0
+    reservations: int = 0
+    # Muestra (barcode, email) de reservaciones activas, repartida sobre todo el catálogo.
+    active_samples: List[Tuple[str, str]] = field(default_factory=list)
+
+def _uuid(rnd: random.Random) -> str:
+    return str(uuid.UUID(int=rnd.getrandbits(128), version=4))
+
+def user_email(i: int) -> str:
+    return f"lector{i}@bench.local"
+
+async def seed_catalog(
+    *,
+    books: int,
+    copies_per_book: int,
+    reservations: int = 0,
+    users: int = 0,
+    samples: int = 1000,
+    seed: int = 42,
+) -> Catalog:
+    """Inserta `books` libros ("Libro 0".."Libro N-1") con `copies_per_book` copias cada uno.
+
+    Las `reservations` reservaciones activas se reparten de forma uniforme sobre las
+    copias (que quedan RESERVED) y sobre `users` usuarios.
+    """
+    from sqlalchemy import insert
+    from app.db import engine
+    from app.models import Book, BookCopy, EmailUser, Reservation, CopyStatus, ReservationStatus
+    rnd = random.Random(seed)
+    total_copies = books * copies_per_book
+    reservations = min(reservations, total_copies)
+    users = max(users, 1) if reservations else users
+    user_ids = [_uuid(rnd) for _ in range(users)]
+    catalog = Catalog(book_ids=[_uuid(rnd) for _ in range(books)], copies=total_copies, users=users, reservations=reservations)
+    sample_every = max(1, reservations // samples) if samples else 0
+    due = datetime.utcnow() + timedelta(days=30)
+
+    async with engine.begin() as conn:
+        for i in range(0, users, CHUNK_ROWS):
+            await conn.execute(insert(EmailUser), [
+                {"id": uid, "email": user_email(i + j), "name": f"Lector {i + j}"}
+                for j, uid in enumerate(user_ids[i:i + CHUNK_ROWS])
+            ])
+        for i in range(0, books, CHUNK_ROWS):
+            await conn.execute(insert(Book), [
+                {"id": bid, "title": f"Libro {i + j}", "author": f"Autor {(i + j) % 997}"}
+                for j, bid in enumerate(catalog.book_ids[i:i + CHUNK_ROWS])
+            ])
+        copy_rows, resv_rows = [], []
+        n = r = 0
+        for b, bid in enumerate(catalog.book_ids):
+            for k in range(copies_per_book):
+                copy_id = _uuid(rnd)
+                barcode = f"BC-{b}-{k}"
+                # La copia n queda reservada cuando floor(n*R/T) avanza: exactamente R, espaciadas.
+                reserved = reservations and (n + 1) * reservations // total_copies > n * reservations // total_copies
+                copy_rows.append({
+                    "id": copy_id, "book_id": bid, "barcode": barcode, "location": f"Estante {b % 50}",
+                    "status": CopyStatus.RESERVED if reserved else CopyStatus.AVAILABLE,
+                })
+                if reserved:
+                    u = rnd.randrange(users)
+                    resv_rows.append({
+                        "id": _uuid(rnd), "email_user_id": user_ids[u], "book_id": bid, "copy_id": copy_id,
+                        "status": ReservationStatus.ACTIVE, "due_date": due, "renewed_cnt": 0,
+                    })
+                    if sample_every and r % sample_every == 0 and len(catalog.active_samples) < samples:
+                        catalog.active_samples.append((barcode, user_email(u)))
+                    r += 1
+                n += 1
+            if len(copy_rows) >= CHUNK_ROWS:
+                await conn.execute(insert(BookCopy), copy_rows)
+                copy_rows = []
+                if resv_rows:
+                    await conn.execute(insert(Reservation), resv_rows)
+                    resv_rows = []
+        if copy_rows:
+            await conn.execute(insert(BookCopy), copy_rows)
+        if resv_rows:
+            await conn.execute(insert(Reservation), resv_rows)
+    return catalog
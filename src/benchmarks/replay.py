@@ -0,0 +1,207 @@
+"""Reproduce una captura del poller (POLLER_CAPTURE_PATH) contra el pipeline actual.
+
+Cada registro se inyecta en un `FakeGraph` con el mensaje (y sus adjuntos) tal como
+los devolvió Graph y se procesa con `process_message`, respetando los intervalos de
+llegada originales divididos por `--speed` (0 = todo de inmediato). El LLM responde
+con lo grabado (latencia incluida, salvo `--no-llm-latency`) o, con `--llm live`,
+Gemini real para probar cambios de prompt. Reporta correos/s, percentiles por etapa
+y los correos cuyo resultado difiere del grabado (regresiones de comportamiento).
+
+Uso (desde src/):
+    python -m benchmarks.replay captura.ndjson.gz --speed 10
+    python -m benchmarks.replay captura.ndjson.gz --speed 0 --reset --books 2000 --compare
+"""
+import argparse
+import asyncio
+import json
+import time
+from datetime import datetime, timedelta
+from typing import Any, Dict, List, Optional
+from benchmarks._common import use_database, reset_database, save_result, latest_result, compare
+
+DEFAULT_URL = "sqlite+aiosqlite:///./bench_replay.db"
+DEFAULT_MAILBOX = "replay@bench.local"
+MAX_MISMATCHES = 50
+COMPARE_KEYS = ("emails_per_sec", "mismatches", "stages.total.p50", "stages.total.p95", "stages.llm.p95", "stages.db.p95")
+
+class CaptureSink(list):
+    """Destino de captura en memoria: recoge lo que produce cada correo reproducido."""
+    def write(self, record: Dict[str, Any]) -> None:
+        self.append(record)
+
+def outcome(record: Dict[str, Any]) -> str:
+    """Resumen comparable de lo que pasó con un correo: supresión, o intent y código de resultado."""
+    if record.get("suppressed"):
+        return f"suppressed:{record['suppressed']}"
+    result = record.get("result") or {}
+    intent = (record.get("intent") or {}).get("intent") or "unknown"
+    return f"{intent}:{result.get('code') or ('OK' if result.get('ok') else 'ERROR')}"
+
+def _captured_at(record: Dict[str, Any]) -> Optional[datetime]:
+    try:
+        return datetime.fromisoformat(record["captured_at"].rstrip("Z"))
+    except (KeyError, ValueError):
+        return None
+
+async def replay_records(
+    records: List[Dict[str, Any]],
+    *,
+    fake,
+    client,
+    log_buffer,
+    throttle_for,
+    llm=None,
+    speed: float = 0.0,
+    concurrency: int = 4,
+    llm_latency: bool = True,
+) -> Dict[str, Any]:
+    """Procesa `records` con `process_message`. `throttle_for(upn)` da el throttle de cada buzón;
+    con `llm=None` se usa la respuesta grabada en cada registro."""
+    from app.worker.capture import RecordedLLM
+    from app.worker.poller import process_message
+
+    sink = CaptureSink()
+    by_msg: Dict[str, Dict[str, Any]] = {}
+    sem = asyncio.Semaphore(max(1, concurrency))
+    first = next((t for t in map(_captured_at, records) if t), None)
+    t0 = time.perf_counter()
+    recorded_llm_calls = 0
+
+    async def _one(record: Dict[str, Any]):
+        nonlocal recorded_llm_calls
+        at = _captured_at(record)
+        if speed > 0 and first and at:
+            await asyncio.sleep(max(0.0, (at - first).total_seconds() / speed - (time.perf_counter() - t0)))
+        async with sem:
+            upn = record.get("mailbox") or DEFAULT_MAILBOX
+            msg_id = fake.add_raw(upn, record["message"], record.get("attachments"))
+            by_msg[msg_id] = record
+            msg_llm = llm
+            if msg_llm is None:
+                latency = (record.get("stages_ms") or {}).get("llm", 0.0) / 1000 if llm_latency else 0.0
+                msg_llm = RecordedLLM(record.get("llm"), latency=latency)
+            stub = {"id": msg_id, "receivedDateTime": fake.mailboxes[upn.lower()][msg_id]["receivedDateTime"]}
+            try:
+                await process_message(client, stub, throttle=throttle_for(upn), log_buffer=log_buffer,
+                                      llm=msg_llm, user_upn=upn, capture=sink)
+            except Exception as ex:
+                sink.write({"message": {"id": msg_id}, "result": {"ok": False, "code": f"REPLAY_ERROR: {ex}"}})
+            if isinstance(msg_llm, RecordedLLM):
+                recorded_llm_calls += msg_llm.calls
+
+    await asyncio.gather(*(_one(r) for r in records))
+    elapsed = time.perf_counter() - t0
+
+    mismatches = []
+    for new in sink:
+        old = by_msg.get((new.get("message") or {}).get("id"))
+        if old is not None and outcome(old) != outcome(new):
+            mismatches.append({
+                "subject": (old.get("message") or {}).get("subject"),
+                "captured_at": old.get("captured_at"),
+                "recorded": outcome(old), "replayed": outcome(new),
+            })
+    return {
+        "emails": len(records),
+        "processed": len(sink),
+        "elapsed_seconds": round(elapsed, 3),
+        "emails_per_sec": round(len(records) / elapsed, 2) if elapsed else None,
+        "recorded_llm_calls": recorded_llm_calls,
+        "mismatches": len(mismatches),
+        "mismatch_samples": mismatches[:MAX_MISMATCHES],
+    }
+
+async def run(args) -> dict:
+    from app.config import settings
+    from app.db import SessionLocal, engine, init_db
+    from app.email.client import GraphClient
+    from app.nlp.client import GeminiClient
+    from app.traces import stage_percentiles
+    from app.worker.capture import read_capture
+    from app.worker.email_log import EmailLogBuffer
+    from app.worker.poller import build_throttle
+    from app.worker.throttle import SenderThrottle
+    from benchmarks.dataset import seed_catalog
+    from tests.fakes import FakeGraph
+
+    records = [r for r in read_capture(args.capture) if r.get("message")]
+    if args.limit:
+        records = records[:args.limit]
+    if args.reset:
+        await reset_database(settings.DATABASE_URL)
+        await seed_catalog(books=args.books, copies_per_book=args.copies, seed=args.seed)
+    else:
+        await init_db()
+
+    upns = sorted({r.get("mailbox") or DEFAULT_MAILBOX for r in records})
+    throttles: Dict[str, SenderThrottle] = {
+        upn: (SenderThrottle(burst=len(records) or 1, refill_per_hour=0, duplicate_window_seconds=0, own_addresses=upns)
+              if args.no_throttle else build_throttle(upns))
+        for upn in upns
+    }
+    fake = FakeGraph(latency=args.graph_latency, jitter=args.graph_latency / 2, seed=args.seed)
+    client = GraphClient("replay-tenant", "replay-client", "replay-secret", transport=fake.transport())
+    llm = GeminiClient() if args.llm == "live" else None
+    log_buffer = EmailLogBuffer(SessionLocal)
+    flusher = asyncio.create_task(log_buffer.run())
+    started = datetime.utcnow()
+    try:
+        await client.start()
+        report = await replay_records(
+            records, fake=fake, client=client, log_buffer=log_buffer, throttle_for=throttles.__getitem__,
+            llm=llm, speed=args.speed, concurrency=args.concurrency, llm_latency=not args.no_llm_latency,
+        )
+    finally:
+        flusher.cancel()
+        await log_buffer.flush()
+        await client.aclose()
+
+    async with SessionLocal() as session:
+        stages = await stage_percentiles(session, since=started, until=datetime.utcnow() + timedelta(seconds=1))
+    await engine.dispose()
+    return {
+        "url": engine.url.render_as_string(hide_password=True),
+        "params": {k: v for k, v in vars(args).items() if k not in ("url", "out", "compare", "baseline")},
+        **report,
+        "replies": len(fake.sent),
+        "graph_calls": dict(fake.calls),
+        "suppressed": sum(sum(t.suppressed.values()) for t in throttles.values()),
+        "stages": stages,
+    }
+
+def main(argv=None) -> dict:
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("capture", help="archivo .ndjson.gz generado con POLLER_CAPTURE_PATH")
+    ap.add_argument("--url", default=None, help=f"base donde reproducir (por defecto {DEFAULT_URL}; "
+                                                  "se ignora DATABASE_URL del entorno)")
+    ap.add_argument("--speed", type=float, default=1.0, help="multiplicador del ritmo de llegada (0 = sin esperas)")
+    ap.add_argument("--concurrency", type=int, default=4, help="correos procesados en paralelo")
+    ap.add_argument("--limit", type=int, default=0, help="reproducir solo los primeros N registros")
+    ap.add_argument("--llm", choices=("recorded", "live"), default="recorded", help="respuestas grabadas o Gemini real")
+    ap.add_argument("--no-llm-latency", action="store_true", help="responder lo grabado sin esperar la latencia original")
+    ap.add_argument("--no-throttle", action="store_true", help="sin límite por remitente ni fusión de duplicados")
+    ap.add_argument("--graph-latency", type=float, default=0.0, help="segundos por llamada a Graph")
+    ap.add_argument("--reset", action="store_true", help="vaciar la base y sembrar un catálogo antes de reproducir")
+    ap.add_argument("--books", type=int, default=2000)
+    ap.add_argument("--copies", type=int, default=3, help="copias por libro (con --reset)")
+    ap.add_argument("--seed", type=int, default=42)
+    ap.add_argument("--out", default=None, help="directorio de resultados (por defecto benchmarks/results)")
+    ap.add_argument("--compare", action="store_true", help="comparar con el resultado anterior")
+    ap.add_argument("--baseline", default=None, help="archivo de resultado contra el cual comparar")
+    args = ap.parse_args(argv)
+    args.url = use_database(args.url, DEFAULT_URL)
+
+    report = asyncio.run(run(args))
+    path = save_result("replay", report, args.out)
+    print(json.dumps(report, indent=2, ensure_ascii=False))
+    print(f"Resultado guardado en {path}")
+    baseline = args.baseline or (latest_result("replay", args.out, exclude=path) if args.compare else None)
+    if baseline:
+        with open(baseline, encoding="utf-8") as fh:
+            diff = compare(report, json.load(fh), COMPARE_KEYS)
+        print(f"Comparación contra {baseline}:")
+        print(json.dumps(diff, indent=2))
+    return report
+
+if __name__ == "__main__":
+    main()
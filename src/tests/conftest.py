@@ -1,23 +1,53 @@
+import pytest
 import pytest_asyncio
+from contextlib import asynccontextmanager
 from sqlalchemy.ext.asyncio import create_async_engine, AsyncSession, async_sessionmaker
 from app.db import Base
 from app import models  
+from app.search import ensure_search_index
+from app.users import USER_IDS
+from app.worker import poller
 
 @pytest_asyncio.fixture(scope="session")
 async def async_engine():
     engine = create_async_engine("sqlite+aiosqlite:///:memory:", echo=False, future=True)
     async with engine.begin() as conn:
         await conn.run_sync(Base.metadata.create_all)
+        await conn.run_sync(ensure_search_index)
     try:
         yield engine
     finally:
         await engine.dispose()
 
 @pytest_asyncio.fixture
-async def session(async_engine):
-    SessionLocal = async_sessionmaker(async_engine, expire_on_commit=False, class_=AsyncSession)
-    async with SessionLocal() as s:
+async def session(session_factory):
+    async with session_factory() as s:
         try:
             yield s
         finally:
             await s.rollback()
+
+@pytest.fixture(autouse=True)
+def _fresh_user_cache():
+    # USER_IDS es global al proceso y solo usa el email como llave: un id de otra base (p. ej. las de
+    # test_db) no debe filtrarse entre pruebas.
+    USER_IDS.clear()
+    yield
+    USER_IDS.clear()
+
+@pytest.fixture
+def session_factory(async_engine):
+    return async_sessionmaker(async_engine, expire_on_commit=False, class_=AsyncSession)
+
+@pytest.fixture
+def poller_db(session_factory, monkeypatch):
+    """El poller abre sus sesiones (primario y lectura, sin réplica) sobre el engine de prueba."""
+    @asynccontextmanager
+    async def _read_session(*, fresh=False):
+        async with session_factory() as s:
+            yield s
+
+    monkeypatch.setattr(poller, "SessionLocal", session_factory)
+    monkeypatch.setattr(poller, "ReadSessionLocal", session_factory)
+    monkeypatch.setattr(poller, "read_session", _read_session)
+    return session_factory
@@ -0,0 +1,195 @@
+"""Dobles de Microsoft Graph y Gemini para las pruebas y los benchmarks del pipeline de correo.
+
+Viven con las pruebas; `benchmarks.e2e` y `benchmarks.replay` los importan desde aquí
+(se ejecutan desde `src/`, igual que pytest).
+
+- `FakeGraph` atiende la API de Graph que usa `GraphClient` mediante `httpx.MockTransport`,
+  con buzones en memoria y latencia configurable.
+- `FakeGeminiClient` responde como Gemini con latencia y tasa de error configurables.
+  El intent se toma de un marcador `[[bench:{...json...}]]` en el cuerpo del correo
+  (ver `bench_body`), así el resultado es determinista.
+"""
+import asyncio
+import base64
+import json
+import random
+import re
+import uuid
+from collections import Counter
+from datetime import datetime, timedelta, timezone
+from types import SimpleNamespace
+from typing import Any, Dict, List, Optional
+from urllib.parse import unquote
+import httpx
+
+_MARKER = re.compile(r"\[\[bench:(\{.*?\})\]\]", re.S)
+
+def bench_body(text: str, intent: str, params: Optional[Dict[str, Any]] = None, confidence: float = 0.95) -> str:
+    marker = json.dumps({"intent": intent, "params": params or {}, "confidence": confidence}, ensure_ascii=False)
+    return f"{text}\n[[bench:{marker}]]"
+
+class FakeGraph:
+    def __init__(self, *, latency: float = 0.0, jitter: float = 0.0, token_ttl: int = 3600, seed: int = 0):
+        self.latency = latency
+        self.token_ttl = token_ttl
+        self.jitter = jitter
+        self._rnd = random.Random(seed)
+        self.mailboxes: Dict[str, Dict[str, Dict[str, Any]]] = {}
+        self.attachments: Dict[str, Dict[str, Dict[str, Any]]] = {}
+        self.sent: List[Dict[str, Any]] = []
+        self.calls: Counter = Counter()
+        self.token_requests = 0
+
+    def add_message(
+        self,
+        upn: str,
+        *,
+        subject: str,
+        body: str,
+        from_email: str,
+        from_name: str = "",
+        received_at: Optional[datetime] = None,
+        headers: Optional[List[Dict[str, str]]] = None,
+        attachments: Optional[List[Dict[str, Any]]] = None,
+    ) -> str:
+        """`attachments`: [{"name", "content": bytes, "contentType"?, "isInline"?}]."""
+        msg_id = uuid.uuid4().hex
+        received = received_at or datetime.now(timezone.utc)
+        self.mailboxes.setdefault(upn.lower(), {})[msg_id] = {
+            "id": msg_id,
+            "subject": subject,
+            "from": {"emailAddress": {"address": from_email, "name": from_name}},
+            "receivedDateTime": received.astimezone(timezone.utc).isoformat().replace("+00:00", "Z"),
+            "body": {"contentType": "text", "content": body},
+            "bodyPreview": body[:255],
+            "internetMessageHeaders": headers or [],
+            "hasAttachments": bool(attachments),
+            "isRead": False,
+        }
+        for att in attachments or []:
+            att_id = uuid.uuid4().hex
+            self.attachments.setdefault(msg_id, {})[att_id] = {
+                "id": att_id,
+                "name": att["name"],
+                "contentType": att.get("contentType", "application/octet-stream"),
+                "size": len(att["content"]),
+                "isInline": att.get("isInline", False),
+                "content": att["content"],
+            }
+        return msg_id
+
+    def add_raw(self, upn: str, message: Dict[str, Any], attachments: Optional[List[Dict[str, Any]]] = None,
+                *, received_at: Optional[datetime] = None) -> str:
+        """Agrega un mensaje tal como lo devolvió Graph (p. ej. desde una captura) con un id nuevo, como no leído.
+        `attachments` con el formato de la captura: metadatos de Graph + `content` en base64."""
+        msg_id = uuid.uuid4().hex
+        received = received_at or datetime.now(timezone.utc)
+        self.mailboxes.setdefault(upn.lower(), {})[msg_id] = {
+            **message, "id": msg_id, "isRead": False,
+            "receivedDateTime": received.astimezone(timezone.utc).isoformat().replace("+00:00", "Z"),
+        }
+        for att in attachments or []:
+            content = base64.b64decode(att["content"]) if att.get("content") else b""
+            att_id = uuid.uuid4().hex
+            self.attachments.setdefault(msg_id, {})[att_id] = {
+                **{k: v for k, v in att.items() if k != "content"}, "id": att_id,
+                "size": att.get("size", len(content)), "content": content,
+            }
+        return msg_id
+
+    def unread(self, upn: str) -> int:
+        return sum(1 for m in self.mailboxes.get(upn.lower(), {}).values() if not m["isRead"])
+
+    def transport(self) -> httpx.MockTransport:
+        return httpx.MockTransport(self._handle)
+
+    async def _sleep(self):
+        delay = self.latency + (self._rnd.uniform(0, self.jitter) if self.jitter else 0.0)
+        if delay > 0:
+            await asyncio.sleep(delay)
+
+    @staticmethod
+    def _public(msg: Dict[str, Any], select: Optional[str]) -> Dict[str, Any]:
+        fields = select.split(",") if select else list(msg)
+        return {k: msg[k] for k in fields if k in msg}
+
+    async def _handle(self, request: httpx.Request) -> httpx.Response:
+        await self._sleep()
+        path = unquote(request.url.path)
+        if path.endswith("/oauth2/v2.0/token"):
+            self.token_requests += 1
+            self.calls["token"] += 1
+            return httpx.Response(200, json={"access_token": uuid.uuid4().hex, "expires_in": self.token_ttl})
+        m = re.match(r"^/v1\.0/users/([^/]+)/(.*)$", path)
+        if not m:
+            return httpx.Response(404, json={"error": {"code": "NotFound"}})
+        upn, rest = m.group(1).lower(), m.group(2)
+        box = self.mailboxes.setdefault(upn, {})
+        params = request.url.params
+        if rest == "mailFolders/inbox/messages" and request.method == "GET":
+            self.calls["list"] += 1
+            top = int(params.get("$top", "10"))
+            unread = [msg for msg in box.values() if not msg["isRead"]]
+            unread.sort(key=lambda x: x["receivedDateTime"], reverse="desc" in params.get("$orderby", ""))
+            return httpx.Response(200, json={"value": [self._public(x, params.get("$select")) for x in unread[:top]]})
+        if rest == "sendMail" and request.method == "POST":
+            self.calls["send"] += 1
+            self.sent.append({"from": upn, **json.loads(request.content)["message"]})
+            return httpx.Response(202)
+        m = re.match(r"^messages/([^/]+)/attachments(?:/([^/]+)/\$value)?$", rest)
+        if m and request.method == "GET":
+            atts = self.attachments.get(m.group(1), {})
+            if m.group(2) is None:
+                self.calls["attachments"] += 1
+                meta = [{k: v for k, v in a.items() if k != "content"} for a in atts.values()]
+                return httpx.Response(200, json={"value": meta})
+            if m.group(2) not in atts:
+                return httpx.Response(404, json={"error": {"code": "ErrorItemNotFound"}})
+            self.calls["attachment"] += 1
+            return httpx.Response(200, content=atts[m.group(2)]["content"])
+        m = re.match(r"^messages/([^/]+)$", rest)
+        if not m or m.group(1) not in box:
+            return httpx.Response(404, json={"error": {"code": "ErrorItemNotFound"}})
+        msg = box[m.group(1)]
+        if request.method == "GET":
+            self.calls["get"] += 1
+            return httpx.Response(200, json=self._public(msg, params.get("$select")))
+        if request.method == "PATCH":
+            self.calls["mark"] += 1
+            msg["isRead"] = bool(json.loads(request.content).get("isRead", True))
+            return httpx.Response(200, json={"id": msg["id"], "isRead": msg["isRead"]})
+        return httpx.Response(405)
+
+class FakeGeminiClient:
+    """Mismo contrato que `app.nlp.client.GeminiClient.ainvoke`."""
+
+    def __init__(self, *, latency: float = 0.0, jitter: float = 0.0, error_rate: float = 0.0, seed: int = 0):
+        self.latency = latency
+        self.jitter = jitter
+        self.error_rate = error_rate
+        self._rnd = random.Random(seed)
+        self.calls = 0
+        self.errors = 0
+
+    async def ainvoke(self, messages):
+        self.calls += 1
+        delay = self.latency + (self._rnd.uniform(0, self.jitter) if self.jitter else 0.0)
+        if delay > 0:
+            await asyncio.sleep(delay)
+        if self.error_rate and self._rnd.random() < self.error_rate:
+            self.errors += 1
+            raise RuntimeError("fake LLM: error simulado")
+        prompt = getattr(messages[-1], "content", "") if messages else ""
+        m = _MARKER.search(prompt)
+        payload = json.loads(m.group(1)) if m else {"intent": "unknown", "params": {}, "confidence": 0.1}
+        payload.setdefault("reason", "fake")
+        payload.setdefault("sql_like", "-- fake")
+        content = json.dumps(payload, ensure_ascii=False)
+        usage = {"input_tokens": sum(len(getattr(x, "content", "")) for x in messages) // 4, "output_tokens": len(content) // 4}
+        return SimpleNamespace(content=content, usage_metadata=usage)
+
+def received_spread(n: int, seconds: float) -> List[datetime]:
+    """`n` instantes de recepción repartidos en los últimos `seconds` segundos (más antiguo primero)."""
+    now = datetime.now(timezone.utc)
+    step = seconds / max(1, n)
+    return [now - timedelta(seconds=seconds - i * step) for i in range(n)]
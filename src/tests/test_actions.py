@@ -1,11 +1,16 @@
 import pytest
-from sqlalchemy import select
-from app import models
+from sqlalchemy import select, event
+from sqlalchemy.ext.asyncio import AsyncSession, create_async_engine
+from app import actions, models
+from app.db import Base
 from app.actions import (
     list_books,
+    search_books,
     register_book,
     register_copy,
+    register_copies_bulk,
     reserve,
+    reserve_batch,
     renew,
     cancel,
     DEFAULT_LOAN_DAYS,
@@ -109,3 +114,151 @@ async def test_delete_book_not_found(session):
     r = await delete_book(session, book_id="00000000-0000-0000-0000-000000000000")
     assert r["ok"] is False
     assert r["code"] == "BOOK_NOT_FOUND"
+
+async def test_list_books_pages_by_title(session):
+    for t in ("Página C", "Página A", "Página B"):
+        await register_book(session, title=t, author=None)
+    titles, ids = [], []
+    offset = 0
+    while True:
+        r = await list_books(session, limit=2, offset=offset)
+        titles += [it["title"] for it in r["data"]["items"]]
+        ids += [it["book_id"] for it in r["data"]["items"]]
+        if not r["data"]["has_more"]:
+            break
+        offset += r["data"]["limit"]
+    assert titles == sorted(titles) and len(ids) == len(set(ids))
+    assert [t for t in titles if t.startswith("Página")] == ["Página A", "Página B", "Página C"]
+
+async def test_search_books_ranked_and_paginated(session):
+    r_a = await register_book(session, title="Refactoring Databases", author="Ambler")
+    r_b = await register_book(session, title="Database Internals", author="Petrov")
+    await register_book(session, title="Domain-Driven Design", author="Evans")
+    await register_copy(session, book_id=r_b["data"]["book_id"], barcode="6666666666", location="B2")
+    r = await search_books(session, q="databa")
+    assert r["ok"] is True
+    ids = {it["book_id"] for it in r["data"]["items"]}
+    assert ids == {r_a["data"]["book_id"], r_b["data"]["book_id"]}
+    hit = next(it for it in r["data"]["items"] if it["book_id"] == r_b["data"]["book_id"])
+    assert hit["copies_total"] == 1 and hit["copies_available"] == 1
+    r_author = await search_books(session, q="petrov internals")
+    assert [it["book_id"] for it in r_author["data"]["items"]] == [r_b["data"]["book_id"]]
+    page1 = await search_books(session, q="databa", limit=1)
+    page2 = await search_books(session, q="databa", limit=1, offset=1)
+    assert page1["data"]["has_more"] is True
+    assert page2["data"]["has_more"] is False
+    assert page1["data"]["items"][0]["book_id"] != page2["data"]["items"][0]["book_id"]
+    await delete_book(session, book_id=r_a["data"]["book_id"])
+    r_after = await search_books(session, q="refactoring")
+    assert r_after["data"]["items"] == []
+    r_empty = await search_books(session, q="  ")
+    assert r_empty["code"] == "MISSING_QUERY"
+
+async def test_search_index_follows_updates_and_pages_deterministically(session):
+    ids = sorted([(await register_book(session, title="Gemelo Idéntico", author="Mismo"))["data"]["book_id"] for _ in range(3)])
+    pages = [(await search_books(session, q="gemelo", limit=1, offset=i))["data"]["items"] for i in range(3)]
+    # Empate de relevancia: el id desempata, así cada página es estable y no se repiten libros.
+    assert [p[0]["book_id"] for p in pages] == ids
+    book = await session.get(models.Book, ids[0])
+    book.title = "Renombrado"
+    await session.commit()
+    assert [it["book_id"] for it in (await search_books(session, q="renombrado"))["data"]["items"]] == [ids[0]]
+    assert [it["book_id"] for it in (await search_books(session, q="gemelo"))["data"]["items"]] == ids[1:]
+
+async def test_reserve_rechecks_replica_book_on_primary(session):
+    # Réplica atrasada: todavía tiene un libro que en el primario ya no existe.
+    replica_engine = create_async_engine("sqlite+aiosqlite:///:memory:")
+    async with replica_engine.begin() as conn:
+        await conn.run_sync(Base.metadata.create_all)
+    try:
+        async with AsyncSession(replica_engine) as replica:
+            replica.add(models.Book(title="Libro Borrado", author=None))
+            await replica.commit()
+            r = await reserve(session, book_id=None, book_title="Libro Borrado", name=None,
+                              email="stale@example.com", read_session=replica)
+    finally:
+        await replica_engine.dispose()
+    assert r["code"] == "BOOK_NOT_FOUND"
+
+async def test_malformed_ids_are_not_found(session):
+    r = await register_copy(session, book_id="no-es-un-uuid", barcode="8888888888", location="A1")
+    assert r["code"] == "BOOK_NOT_FOUND"
+    r2 = await delete_book(session, book_id="no-es-un-uuid")
+    assert r2["code"] == "BOOK_NOT_FOUND"
+
+async def test_reserve_batch_partial_success_in_one_transaction(session, async_engine):
+    r_book = await register_book(session, title="Operating Systems", author="Tanenbaum")
+    book_id = r_book["data"]["book_id"]
+    for bc in ("9000000001", "9000000002", "9000000003"):
+        await register_copy(session, book_id=book_id, barcode=bc, location="C1")
+    # Alice ya existe como usuaria antes del lote.
+    await _mk_book_with_copy(session, title="Batch Previo", barcode="9000000000")
+    await reserve(session, book_id=None, book_title="Batch Previo", name="Alice", email="alice@example.com")
+    statements = []
+    listener = lambda *args: statements.append(args[2])
+    event.listen(async_engine.sync_engine, "before_cursor_execute", listener)
+    try:
+        r = await reserve_batch(session, items=[
+            {"book_id": book_id, "name": "Ana", "email": "Ana@Example.com"},
+            {"book_title": "Operating Systems", "name": "Alice", "email": "alice@example.com"},
+            # El id no existe: se usa el título.
+            {"book_id": "00000000-0000-0000-0000-000000000001", "book_title": "Operating Systems", "name": "Luis", "email": "luis@example.com"},
+            {"book_id": book_id, "name": "Zoe", "email": "zoe@example.com"},
+            {"book_id": "00000000-0000-0000-0000-000000000000", "email": "x@example.com"},
+            {"book_id": book_id, "email": ""},
+        ])
+    finally:
+        event.remove(async_engine.sync_engine, "before_cursor_execute", listener)
+    assert r["ok"] is True
+    d = r["data"]
+    assert (d["reserved"], d["failed"]) == (3, 3)
+    codes = [res.get("code") for res in d["results"]]
+    assert codes == [None, None, None, "NO_AVAILABLE_COPIES", "BOOK_NOT_FOUND", "MISSING_EMAIL"]
+    assert d["results"][0]["data"]["user_email"] == "ana@example.com"
+    assert {res["data"]["barcode"] for res in d["results"][:3]} == {"9000000001", "9000000002", "9000000003"}
+    assert len(statements) <= 8
+    copies = (await session.execute(select(models.BookCopy).where(models.BookCopy.book_id == book_id))).scalars().all()
+    assert {c.status for c in copies} == {models.CopyStatus.RESERVED}
+    users = (await session.execute(select(models.EmailUser).where(models.EmailUser.email.in_(["ana@example.com", "alice@example.com"])))).scalars().all()
+    assert len(users) == 2
+
+async def test_repeat_sender_skips_user_lookup(session, async_engine):
+    book_id, _, barcode = await _mk_book_with_copy(session, title="Caché Libro", barcode="CACHE-1")
+    r = await reserve(session, book_id=book_id, book_title=None, name="Eva", email=" Eva@Example.com ")
+    assert r["ok"] and r["data"]["user_email"] == "eva@example.com"
+    statements = []
+    listener = lambda *args: statements.append(args[2])
+    event.listen(async_engine.sync_engine, "before_cursor_execute", listener)
+    try:
+        assert (await cancel(session, barcode=barcode, email="eva@example.com"))["ok"]
+    finally:
+        event.remove(async_engine.sync_engine, "before_cursor_execute", listener)
+    assert not [s for s in statements if "FROM email_user" in s]
+
+async def test_get_or_create_user_survives_concurrent_insert(session, monkeypatch):
+    session.add(models.EmailUser(email="carrera@example.com", name="Otro correo"))
+    await session.commit()
+    existing = (await session.execute(select(models.EmailUser.id).where(models.EmailUser.email == "carrera@example.com"))).scalar_one()
+
+    async def _not_seen(session, email_norm):
+        return None  # la búsqueda ocurrió antes de que el otro correo confirmara el alta
+    monkeypatch.setattr(actions, "_find_user_id", _not_seen)
+    assert await actions._get_or_create_user(session, "carrera@example.com", "Nuevo") == (existing, False)
+
+async def test_register_copies_bulk_reports_row_errors(session):
+    book_id, _, _ = await _mk_book_with_copy(session, title="Bulk Libro", barcode="BULK-0")
+    rows = [
+        {"row": 2, "book_id": book_id, "barcode": "BULK-1", "location": "A"},
+        {"row": 3, "title": "Bulk Libro", "barcode": "BULK-2", "location": "B"},
+        {"row": 4, "title": "Bulk Libro", "barcode": "BULK-0", "location": "C"},
+        {"row": 5, "title": "No existe", "barcode": "BULK-3", "location": "D"},
+        {"row": 6, "book_id": book_id, "barcode": "BULK-1", "location": "E"},
+        {"row": 7, "book_id": book_id, "barcode": "", "location": "F"},
+    ]
+    r = await register_copies_bulk(session, rows=rows)
+    assert r["ok"] and r["data"]["inserted"] == 2 and r["data"]["failed"] == 4
+    assert [(e["row"], e["code"]) for e in r["data"]["errors"]] == [
+        (4, "BARCODE_EXISTS"), (5, "BOOK_NOT_FOUND"), (6, "DUPLICATE_BARCODE"), (7, "MISSING_FIELDS"),
+    ]
+    listed = {b["title"]: b for b in (await list_books(session))["data"]["items"]}
+    assert listed["Bulk Libro"]["copies_total"] == 3
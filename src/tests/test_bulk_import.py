@@ -0,0 +1,64 @@
+import io
+import pytest
+from app.bulk_import import iter_csv_rows, iter_xlsx_rows, attachment_format, import_copies, BulkImportError, openpyxl
+
+async def _chunks(data: bytes, size: int):
+    for i in range(0, len(data), size):
+        yield data[i:i + size]
+
+async def _collect(agen):
+    return [r async for r in agen]
+
+@pytest.mark.asyncio
+async def test_csv_rows_are_parsed_across_chunk_boundaries():
+    data = '﻿Título;Código de barras;Ubicación\n"Cien años; edición\nespecial";123;Sala Ñ\n\n"Otro";456;B2\r\n'.encode()
+    rows = await _collect(iter_csv_rows(_chunks(data, 3)))
+    assert rows == [
+        {"row": 2, "title": "Cien años; edición\nespecial", "barcode": "123", "location": "Sala Ñ"},
+        {"row": 4, "title": "Otro", "barcode": "456", "location": "B2"},
+    ]
+
+@pytest.mark.asyncio
+async def test_csv_without_required_headers_is_rejected():
+    with pytest.raises(BulkImportError) as exc:
+        await _collect(iter_csv_rows(_chunks(b"nombre,autor\nx,y\n", 64)))
+    assert exc.value.code == "INVALID_HEADER"
+
+@pytest.mark.asyncio
+@pytest.mark.skipif(openpyxl is None, reason="openpyxl no instalado")
+async def test_xlsx_rows():
+    wb = openpyxl.Workbook()
+    ws = wb.active
+    ws.append(["book_id", "barcode", "location"])
+    ws.append(["0b6c8f1e-8d0e-4b7a-9c55-0d6a4c1f2e3a", 1234567890, "A1"])
+    ws.append([None, None, None])
+    buf = io.BytesIO()
+    wb.save(buf)
+    rows = await _collect(iter_xlsx_rows(_chunks(buf.getvalue(), 1024)))
+    assert rows == [{"row": 2, "book_id": "0b6c8f1e-8d0e-4b7a-9c55-0d6a4c1f2e3a", "barcode": "1234567890", "location": "A1"}]
+
+@pytest.mark.asyncio
+async def test_size_limit_uses_streamed_bytes_not_metadata():
+    data = b"title,barcode,location\n" + b"".join(b"Libro,%d,A1\n" % i for i in range(100))
+    r = await import_copies(None, _chunks(data, 64), "csv", batch_rows=1000, max_bytes=512)
+    assert r["code"] == "FILE_TOO_LARGE"
+
+@pytest.mark.asyncio
+@pytest.mark.skipif(openpyxl is None, reason="openpyxl no instalado")
+async def test_xlsx_row_limit_is_checked_before_reading_rows():
+    wb = openpyxl.Workbook()
+    ws = wb.active
+    ws.append(["title", "barcode", "location"])
+    for i in range(5):
+        ws.append(["Libro", str(i), "A1"])
+    buf = io.BytesIO()
+    wb.save(buf)
+    with pytest.raises(BulkImportError) as exc:
+        await _collect(iter_xlsx_rows(_chunks(buf.getvalue(), 1024), max_rows=3))
+    assert exc.value.code == "TOO_MANY_ROWS"
+
+def test_attachment_format():
+    assert attachment_format({"name": "copias.CSV"}) == "csv"
+    assert attachment_format({"name": "copias.xlsx"}) == "xlsx"
+    assert attachment_format({"name": "logo.png", "contentType": "image/png"}) is None
+    assert attachment_format({"name": "tabla.csv", "isInline": True}) is None
@@ -0,0 +1,63 @@
+import pytest
+from app.email.client import GraphClient
+from app.worker import poller
+from app.worker.capture import CaptureWriter, read_capture
+from app.worker.email_log import EmailLogBuffer
+from app.worker.throttle import SenderThrottle
+from tests.fakes import FakeGraph, FakeGeminiClient, bench_body
+from benchmarks.replay import replay_records, outcome
+
+pytestmark = pytest.mark.asyncio
+
+MAILBOX = "biblioteca@example.com"
+
+def _throttle():
+    return SenderThrottle(burst=5, refill_per_hour=0, duplicate_window_seconds=0, own_addresses=[MAILBOX])
+
+async def test_capture_then_replay_with_recorded_llm(poller_db, tmp_path):
+    fake = FakeGraph()
+    fake.add_message(MAILBOX, subject="Catálogo", from_email="lector@example.com",
+                     body=bench_body("¿Qué hay?", "list_books"))
+    fake.add_message(MAILBOX, subject="Eco", from_email=MAILBOX, body="respuesta propia")
+    fake.add_message(MAILBOX, subject="Alta", from_email="staff@example.com", body="Planilla",
+                     attachments=[{"name": "c.csv", "contentType": "text/csv", "content": b"titulo,barcode,ubicacion\nNo existe,CAP-1,A\n"}])
+    path = str(tmp_path / "captura.ndjson.gz")
+    capture = CaptureWriter(path)
+    client = GraphClient("t", "c", "s", MAILBOX, transport=fake.transport())
+    try:
+        await poller.poll_once(client, throttle=_throttle(), log_buffer=EmailLogBuffer(poller_db),
+                               llm=FakeGeminiClient(), top=10, capture=capture)
+    finally:
+        capture.close()
+        await client.aclose()
+
+    records = list(read_capture(path))
+    assert sorted(outcome(r) for r in records) == ["list_books:OK", "register_copies_bulk:OK", "suppressed:loop"]
+    llm_record = next(r for r in records if r.get("llm"))
+    assert '"list_books"' in llm_record["llm"]["content"] and llm_record["text"].startswith("¿Qué hay?")
+
+    # Reproducción: Graph simulado, LLM grabado (el cliente falso no se llama) y mismos resultados.
+    replay_fake = FakeGraph()
+    llm = FakeGeminiClient()
+    client = GraphClient("t", "c", "s", transport=replay_fake.transport())
+    throttle = _throttle()
+    try:
+        report = await replay_records(records, fake=replay_fake, client=client, log_buffer=EmailLogBuffer(poller_db),
+                                      throttle_for=lambda upn: throttle)
+    finally:
+        await client.aclose()
+    assert report["processed"] == 3 and report["mismatches"] == 0 and report["recorded_llm_calls"] == 1
+    assert llm.calls == 0 and replay_fake.calls["attachment"] == 1 and len(replay_fake.sent) == 2
+
+async def test_capture_survives_truncated_tail(tmp_path):
+    path = str(tmp_path / "captura.ndjson.gz")
+    capture = CaptureWriter(path, flush_every=1)
+    capture.write({"n": 1})
+    capture.write({"n": 2})
+    # Sin close(): el proceso "muere" con el miembro gzip abierto.
+    assert [r["n"] for r in read_capture(path)] == [1, 2]
+    capture.close()
+    capture = CaptureWriter(path)
+    capture.write({"n": 3})
+    capture.close()
+    assert [r["n"] for r in read_capture(path)] == [1, 2, 3]
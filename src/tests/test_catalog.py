@@ -0,0 +1,47 @@
+import pytest
+import pytest_asyncio
+import httpx
+from contextlib import asynccontextmanager
+from fastapi import FastAPI
+from app.api import router as router_module
+from app.catalog import VersionedResponseCache, catalog_version
+from app.actions import register_book
+
+pytestmark = pytest.mark.asyncio
+
+@pytest_asyncio.fixture
+async def client(session_factory, monkeypatch):
+    queries = []
+
+    @asynccontextmanager
+    async def _read_session(**_):
+        queries.append(1)
+        async with session_factory() as s:
+            yield s
+
+    monkeypatch.setattr(router_module, "read_session", _read_session)
+    monkeypatch.setattr(router_module, "_responses", VersionedResponseCache(ttl_seconds=60))
+    app = FastAPI()
+    app.include_router(router_module.router)
+    async with httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://test") as c:
+        yield c, queries
+
+async def test_books_etag_and_not_modified(client, session):
+    c, queries = client
+    r1 = await c.get("/books")
+    assert r1.status_code == 200
+    etag = r1.headers["etag"]
+    r2 = await c.get("/books", headers={"If-None-Match": etag})
+    assert r2.status_code == 304
+    assert r2.content == b""
+    r3 = await c.get("/books")
+    assert r3.content == r1.content
+    assert len(queries) == 1
+    before = catalog_version()
+    await register_book(session, title="Versionado", author=None)
+    assert catalog_version() == before + 1
+    r4 = await c.get("/books", headers={"If-None-Match": etag})
+    assert r4.status_code == 200
+    assert r4.headers["etag"] != etag
+    assert any(it["title"] == "Versionado" for it in r4.json())
+    assert len(queries) == 2
@@ -0,0 +1,79 @@
+import json
+import pytest
+from app import changes
+from app.actions import register_book, register_copy, reserve, cancel
+from app.api.router import _sse_events
+from app.changes import ChangeBus
+
+def _parse(raw: bytes) -> dict:
+    fields = dict(line.split(": ", 1) for line in raw.decode().strip().split("\n"))
+    return {**json.loads(fields["data"]), "id": fields["id"], "event": fields["event"]}
+
+@pytest.mark.asyncio
+async def test_bus_filters_by_book_and_resumes_from_last_event_id():
+    bus = ChangeBus(log_size=3, queue_size=10, epoch="e1")
+    everything = bus.subscribe()
+    only_a = bus.subscribe(book_id="a")
+    bus.publish("reserved", "a", available_delta=-1)
+    bus.publish("copy_added", "b", available_delta=1, total_delta=1)
+    assert [_parse(await everything.get())["book_id"] for _ in range(2)] == ["a", "b"]
+    assert _parse(await only_a.get())["available_delta"] == -1 and only_a.queue.empty()
+
+    resumed = bus.subscribe(last_event_id="e1-1")
+    assert _parse(await resumed.get())["id"] == "e1-2"
+    assert bus.subscribe(last_event_id="e1-2").queue.empty()
+    for _ in range(3):
+        bus.publish("reserved", "a", available_delta=-1)
+    # El evento 2 ya salió del registro (tamaño 3): el cliente debe recargar el listado.
+    reset = _parse(await bus.subscribe(last_event_id="e1-1").get())
+    assert reset["event"] == "reset" and reset["id"] == bus.last_id == "e1-5"
+    assert _parse(await bus.subscribe(last_event_id="e1-2").get())["id"] == "e1-3"
+
+@pytest.mark.asyncio
+async def test_foreign_or_future_event_ids_get_reset():
+    bus = ChangeBus(epoch="e1")
+    bus.publish("reserved", "a", available_delta=-1)
+    # Id de otra réplica o de antes de un reinicio, id adelantado e id ilegible: no se puede reanudar.
+    for last in ("e0-1", "e1-7", "7"):
+        assert _parse(await bus.subscribe(last_event_id=last).get())["event"] == "reset"
+
+@pytest.mark.asyncio
+async def test_slow_subscriber_is_cut_off():
+    bus = ChangeBus(queue_size=2)
+    sub = bus.subscribe()
+    for _ in range(3):
+        bus.publish("reserved", "a", available_delta=-1)
+    assert sub.overflowed and await sub.get() is None
+    assert bus.subscribers() == 0
+
+@pytest.mark.asyncio
+async def test_actions_publish_availability_deltas(session):
+    book_id = (await register_book(session, title="SSE Libro", author=None))["data"]["book_id"]
+    sub = changes.BUS.subscribe(book_id=book_id)
+    try:
+        await register_copy(session, book_id=book_id, barcode="SSE-1", location="A")
+        await reserve(session, book_id=book_id, book_title=None, name=None, email="sse@example.com")
+        await cancel(session, barcode="SSE-1", email="sse@example.com")
+        events = [_parse(await sub.get()) for _ in range(3)]
+    finally:
+        sub.close()
+    assert [(e["type"], e["available_delta"], e["total_delta"]) for e in events] == [
+        ("copy_added", 1, 1), ("reserved", -1, 0), ("canceled", 1, 0),
+    ]
+
+class _Request:
+    async def is_disconnected(self):
+        return True
+
+@pytest.mark.asyncio
+async def test_sse_stream_sends_events_and_keepalives():
+    bus = ChangeBus()
+    sub = bus.subscribe()
+    stream = _sse_events(_Request(), sub, keepalive=0.01)
+    assert await stream.__anext__() == b"retry: 3000\n\n"
+    bus.publish("reserved", "a", available_delta=-1)
+    assert _parse(await stream.__anext__())["type"] == "reserved"
+    # Sin eventos y con el cliente desconectado, el stream termina y libera la suscripción.
+    with pytest.raises(StopAsyncIteration):
+        await stream.__anext__()
+    assert bus.subscribers() == 0
@@ -0,0 +1,117 @@
+import pytest
+import pytest_asyncio
+from sqlalchemy.ext.asyncio import create_async_engine, AsyncSession, async_sessionmaker
+from app import db
+from app.db import Base
+from app.actions import list_books, register_book, register_copy, reserve, search_books
+from app.migrations import migrate_keys
+from app.search import ensure_search_index
+
+pytestmark = pytest.mark.asyncio
+
+async def _mk_engine(url):
+    engine = create_async_engine(url, echo=False, future=True)
+    async with engine.begin() as conn:
+        await conn.run_sync(Base.metadata.create_all)
+    return engine
+
+@pytest_asyncio.fixture
+async def primary_and_replica(tmp_path, monkeypatch):
+    primary = await _mk_engine(f"sqlite+aiosqlite:///{tmp_path / 'primary.db'}")
+    replica = await _mk_engine(f"sqlite+aiosqlite:///{tmp_path / 'replica.db'}")
+    Primary = async_sessionmaker(primary, expire_on_commit=False, class_=AsyncSession)
+    Replica = async_sessionmaker(replica, expire_on_commit=False, class_=AsyncSession)
+    monkeypatch.setattr(db, "SessionLocal", Primary)
+    monkeypatch.setattr(db, "ReadSessionLocal", Replica)
+    monkeypatch.setattr(db, "_replica_down_until", 0.0)
+    try:
+        yield Primary, Replica
+    finally:
+        await primary.dispose()
+        await replica.dispose()
+
+async def test_read_session_routes_to_replica(primary_and_replica):
+    Primary, Replica = primary_and_replica
+    async with Replica() as s:
+        await register_book(s, title="Solo en réplica", author=None)
+    async with db.read_session() as s:
+        r = await list_books(s)
+    assert [it["title"] for it in r["data"]["items"]] == ["Solo en réplica"]
+    async with db.read_session(fresh=True) as s:
+        r = await list_books(s)
+    assert r["data"]["items"] == []
+
+async def test_read_session_falls_back_when_replica_unavailable(primary_and_replica, tmp_path, monkeypatch):
+    Primary, _ = primary_and_replica
+    broken = create_async_engine(f"sqlite+aiosqlite:///{tmp_path / 'missing' / 'replica.db'}")
+    BrokenReplica = async_sessionmaker(broken, expire_on_commit=False, class_=AsyncSession)
+    attempts = []
+    monkeypatch.setattr(db, "ReadSessionLocal", lambda: attempts.append(1) or BrokenReplica())
+    async with Primary() as s:
+        await register_book(s, title="En primario", author=None)
+    for _ in range(3):
+        async with db.read_session() as s:
+            r = await list_books(s)
+        assert [it["title"] for it in r["data"]["items"]] == ["En primario"]
+    # Después del primer fallo la réplica queda en enfriamiento: no se vuelve a intentar conectar.
+    assert len(attempts) == 1
+    await broken.dispose()
+
+async def test_replica_connect_timeout_per_driver():
+    assert db._connect_timeout_args("postgresql+asyncpg://u@h/db", 2) == {"timeout": 2}
+    assert db._connect_timeout_args("postgresql+psycopg://u@h/db", 0.5) == {"connect_timeout": 1}
+    assert db._connect_timeout_args("sqlite+aiosqlite:///x.db", 2) == {}
+
+async def test_reserve_by_title_falls_back_to_primary_on_replica_miss(primary_and_replica):
+    Primary, Replica = primary_and_replica
+    async with Primary() as s:
+        r_book = await register_book(s, title="Recién creado", author=None)
+        await register_copy(s, book_id=r_book["data"]["book_id"], barcode="5555555555", location="A1")
+    async with Primary() as s, Replica() as rs:
+        r = await reserve(s, book_id=None, book_title="Recién creado", name="Ana", email="ana@example.com", read_session=rs)
+    assert r["ok"] is True
+    assert r["data"]["book_id"] == r_book["data"]["book_id"]
+
+async def test_migrate_legacy_string_keys(tmp_path):
+    engine = create_async_engine(f"sqlite+aiosqlite:///{tmp_path / 'legacy.db'}")
+    book_id, copy_id = "6f1c2a8e-0d4b-4f53-9a55-3c2b1f0e9d77", "0b7e7d3a-8c1e-4a4f-bf0a-5d9e2c6a1b34"
+    async with engine.begin() as conn:
+        await conn.exec_driver_sql(
+            "CREATE TABLE book (id VARCHAR PRIMARY KEY, title VARCHAR NOT NULL, author VARCHAR, created_at DATETIME)"
+        )
+        await conn.exec_driver_sql(
+            "CREATE TABLE book_copie (id VARCHAR PRIMARY KEY, book_id VARCHAR NOT NULL REFERENCES book(id), "
+            "barcode VARCHAR NOT NULL UNIQUE, status VARCHAR(9), location VARCHAR NOT NULL)"
+        )
+        await conn.exec_driver_sql(f"INSERT INTO book (id, title, author) VALUES ('{book_id}', 'Legacy', 'Anon')")
+        await conn.exec_driver_sql(
+            f"INSERT INTO book_copie VALUES ('{copy_id}', '{book_id}', '7777777777', 'AVAILABLE', 'C3')"
+        )
+    for _ in range(2):
+        async with engine.begin() as conn:
+            await conn.run_sync(Base.metadata.create_all)
+            await conn.run_sync(migrate_keys)
+            await conn.run_sync(ensure_search_index)
+    async with async_sessionmaker(engine, expire_on_commit=False, class_=AsyncSession)() as s:
+        items = (await list_books(s))["data"]["items"]
+        assert [(it["book_id"], it["copies_total"]) for it in items] == [(book_id, 1)]
+        hits = (await search_books(s, q="legacy"))["data"]["items"]
+        assert [it["book_id"] for it in hits] == [book_id]
+        r = await reserve(s, book_id=book_id, book_title=None, name="Ana", email="ana@example.com")
+        assert r["ok"] is True and r["data"]["copy_id"] == copy_id
+    await engine.dispose()
+
+async def test_old_fts_schema_is_replaced(tmp_path):
+    engine = await _mk_engine(f"sqlite+aiosqlite:///{tmp_path / 'fts.db'}")
+    async with engine.begin() as conn:
+        await conn.exec_driver_sql("CREATE VIRTUAL TABLE book_fts USING fts5(book_id UNINDEXED, title, author)")
+        await conn.exec_driver_sql(
+            "CREATE TRIGGER book_fts_ad AFTER DELETE ON book BEGIN DELETE FROM book_fts WHERE book_id = old.id; END"
+        )
+    for _ in range(2):
+        async with engine.begin() as conn:
+            await conn.run_sync(ensure_search_index)
+    async with async_sessionmaker(engine, expire_on_commit=False, class_=AsyncSession)() as s:
+        book_id = (await register_book(s, title="Índice Nuevo", author=None))["data"]["book_id"]
+        assert [it["book_id"] for it in (await search_books(s, q="indice"))["data"]["items"]] == [book_id]
+    await engine.dispose()
@@ -0,0 +1,49 @@
+import pytest
+from datetime import datetime, timedelta
+from sqlalchemy import select, func
+from app import models
+from app.worker.email_log import EmailLogBuffer, prune_email_logs, prune_email_traces
+
+pytestmark = pytest.mark.asyncio
+
+async def _count(session, model, prefix):
+    r = await session.execute(select(func.count()).select_from(model).where(model.message_id.like(f"{prefix}%")))
+    return r.scalar_one()
+
+async def test_buffer_flushes_in_batches_and_ignores_duplicates(session_factory, session):
+    buf = EmailLogBuffer(session_factory, batch_size=10)
+    for i in range(3):
+        buf.add(message_id=f"buf-{i}", from_email="a@example.com", subject="hola")
+    buf.add(message_id="buf-0", from_email="a@example.com", subject="repetido")
+    assert await _count(session, models.EmailLog, "buf-") == 0
+    assert await buf.flush() == 4
+    assert len(buf) == 0
+    assert await _count(session, models.EmailLog, "buf-") == 3
+    assert await buf.flush() == 0
+
+async def test_prune_email_logs_batches_and_archives(session_factory, session):
+    buf = EmailLogBuffer(session_factory)
+    old = datetime.utcnow() - timedelta(days=90)
+    for i in range(5):
+        buf.add(message_id=f"old-{i}", from_email="b@example.com", subject=None, processed_at=old)
+    buf.add(message_id="new-0", from_email="b@example.com", subject=None)
+    await buf.flush()
+    removed = await prune_email_logs(session, older_than=datetime.utcnow() - timedelta(days=30), batch_size=2, archive=True)
+    assert removed == 5
+    assert await _count(session, models.EmailLog, "old-") == 0
+    assert await _count(session, models.EmailLog, "new-") == 1
+    assert await _count(session, models.EmailLogArchive, "old-") == 5
+
+async def test_prune_email_traces_by_picked_up_at(session_factory, session):
+    buf = EmailLogBuffer(session_factory)
+    old = datetime.utcnow() - timedelta(days=90)
+    for i in range(3):
+        buf.add(message_id=f"tr-old-{i}", from_email="c@example.com", subject=None, processed_at=old,
+                trace={"message_id": f"tr-old-{i}", "picked_up_at": old})
+    buf.add(message_id="tr-new-0", from_email="c@example.com", subject=None,
+            trace={"message_id": "tr-new-0", "picked_up_at": datetime.utcnow()})
+    await buf.flush()
+    removed = await prune_email_traces(session, older_than=datetime.utcnow() - timedelta(days=30), batch_size=2)
+    assert removed == 3
+    assert await _count(session, models.EmailTrace, "tr-old-") == 0
+    assert await _count(session, models.EmailTrace, "tr-new-") == 1
@@ -0,0 +1,53 @@
+import asyncio
+import pytest
+from app.email.client import GraphClient
+from tests.fakes import FakeGraph
+
+pytestmark = pytest.mark.asyncio
+
+MAILBOX = "biblioteca@example.com"
+
+async def test_concurrent_calls_share_one_token_request():
+    fake = FakeGraph(latency=0.01)
+    ids = [fake.add_message(MAILBOX, subject=f"m{i}", body="hola", from_email="a@example.com") for i in range(10)]
+    client = GraphClient("t", "c", "s", MAILBOX, transport=fake.transport())
+    try:
+        msgs = await asyncio.gather(*(client.get_message(i) for i in ids))
+    finally:
+        await client.aclose()
+    assert [m["id"] for m in msgs] == ids
+    assert fake.token_requests == 1
+
+async def test_token_is_renewed_in_background_before_expiry():
+    fake = FakeGraph(token_ttl=3600)
+    fake.add_message(MAILBOX, subject="m", body="hola", from_email="a@example.com")
+    now = [1000.0]
+    sleeps = []
+    ticks = asyncio.Queue()
+
+    async def fake_sleep(delay):
+        # Cada espera del renovador avanza el reloj solo cuando la prueba lo permite.
+        sleeps.append(delay)
+        if delay > 0:
+            await ticks.get()
+            now[0] += delay
+
+    client = GraphClient("t", "c", "s", MAILBOX, transport=fake.transport(), refresh_margin=600,
+                         clock=lambda: now[0], sleep=fake_sleep)
+    try:
+        await client.start()
+        first = client._access_token
+        await asyncio.wait_for(_until(lambda: sleeps and sleeps[-1] > 0), timeout=1)
+        assert fake.token_requests == 1 and sleeps[-1] == 3600 - 600
+        ticks.put_nowait(None)
+        await asyncio.wait_for(_until(lambda: fake.token_requests == 2), timeout=1)
+        assert client._access_token != first
+        # La llamada encuentra un token vigente: no espera a la renovación.
+        await client.list_unread_messages()
+        assert fake.token_requests == 2
+    finally:
+        await client.aclose()
+
+async def _until(cond):
+    while not cond():
+        await asyncio.sleep(0)
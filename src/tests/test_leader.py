@@ -0,0 +1,47 @@
+import asyncio
+import pytest
+from sqlalchemy import delete
+from app import models
+from app.worker.leader import LeaderElector
+
+pytestmark = pytest.mark.asyncio
+
+@pytest.fixture(autouse=True)
+async def _clear_leases(session_factory):
+    yield
+    async with session_factory() as s:
+        await s.execute(delete(models.LeaderLease))
+        await s.commit()
+
+async def test_only_one_elector_holds_the_lease(session_factory):
+    a = LeaderElector(session_factory, "test", holder="a", ttl=1)
+    b = LeaderElector(session_factory, "test", holder="b", ttl=1)
+    assert await a.try_acquire() and not await b.try_acquire()
+    assert await a.try_acquire()  # renovación
+    # Si "a" deja de renovar, "b" toma el lease al vencer y "a" lo pierde.
+    await asyncio.sleep(1.1)
+    assert await b.try_acquire() and not await a.try_acquire()
+    await b.release()
+    assert await a.try_acquire()
+
+async def test_work_fails_over_when_leader_stops(session_factory):
+    running = []
+
+    def work(name):
+        async def _run():
+            running.append(name)
+            await asyncio.Event().wait()
+        return _run
+
+    a = LeaderElector(session_factory, "poller", holder="a", ttl=1, renew_every=0.05)
+    b = LeaderElector(session_factory, "poller", holder="b", ttl=1, renew_every=0.05)
+    a.start(work("a"))
+    await asyncio.sleep(0.1)
+    b.start(work("b"))
+    await asyncio.sleep(0.2)
+    assert running == ["a"] and a.is_leader and not b.is_leader
+    # Apagado ordenado: "a" libera el lease y "b" lo toma sin esperar el ttl.
+    await a.stop()
+    await asyncio.sleep(0.2)
+    await b.stop()
+    assert running == ["a", "b"]
@@ -0,0 +1,24 @@
+from app.metrics import Registry, Counter, Gauge, Histogram
+
+def test_render_prometheus_text_format():
+    reg = Registry()
+    c = reg.register(Counter("demo_emails", "Correos.", ["intent", "code"]))
+    h = reg.register(Histogram("demo_latency_seconds", "Latencia.", ["op"], buckets=(0.1, 1.0)))
+    g = reg.register(Gauge("demo_backlog", "Backlog."))
+    p = reg.register(Gauge("demo_pool", "Pool.", fn=lambda: 3))
+    c.labels("reserve", "OK").inc()
+    c.labels("reserve", "OK").inc()
+    h.labels("send").observe(0.05)
+    h.labels("send").observe(0.1)
+    h.labels("send").observe(5)
+    g.set(7)
+    out = reg.render()
+    assert "# HELP demo_emails_total Correos." in out
+    assert "# TYPE demo_emails_total counter" in out
+    assert 'demo_emails_total{intent="reserve",code="OK"} 2.0' in out
+    assert 'demo_latency_seconds_bucket{op="send",le="0.1"} 2' in out
+    assert 'demo_latency_seconds_bucket{op="send",le="1.0"} 2' in out
+    assert 'demo_latency_seconds_bucket{op="send",le="+Inf"} 3' in out
+    assert 'demo_latency_seconds_count{op="send"} 3' in out
+    assert "demo_backlog 7.0" in out
+    assert "demo_pool 3.0" in out
@@ -0,0 +1,115 @@
+import pytest
+from sqlalchemy import select
+from app import models
+from app.email.client import GraphClient
+from app.worker import poller
+from app.worker.email_log import EmailLogBuffer
+from app.worker.throttle import SenderThrottle
+from tests.fakes import FakeGraph, FakeGeminiClient, bench_body
+
+MAILBOX = "biblioteca@example.com"
+
+@pytest.mark.asyncio
+async def test_poll_once_replies_marks_read_and_traces(poller_db, session):
+    session.add(models.Book(title="Poller Libro", author="A"))
+    await session.flush()
+    book = (await session.execute(select(models.Book).where(models.Book.title == "Poller Libro"))).scalar_one()
+    session.add(models.BookCopy(book_id=book.id, barcode="POLL-1", location="A1"))
+    await session.commit()
+
+    fake = FakeGraph()
+    ids = [
+        fake.add_message(MAILBOX, subject="Reserva", from_email="lector@example.com",
+                         body=bench_body("Quiero Poller Libro", "reserve", {"book_title": "Poller Libro"})),
+        fake.add_message(MAILBOX, subject="Catálogo", from_email="otro@example.com",
+                         body=bench_body("¿Qué hay?", "list_books")),
+        fake.add_message(MAILBOX, subject="Fuera de oficina", from_email="bot@example.com", body="...",
+                         headers=[{"name": "Auto-Submitted", "value": "auto-replied"}]),
+    ]
+    client = GraphClient("t", "c", "s", MAILBOX, transport=fake.transport())
+    llm = FakeGeminiClient()
+    throttle = SenderThrottle(burst=5, refill_per_hour=0, duplicate_window_seconds=0, own_addresses=[MAILBOX])
+    buf = EmailLogBuffer(poller_db)
+    try:
+        assert await poller.poll_once(client, throttle=throttle, log_buffer=buf, llm=llm, top=10) == 3
+    finally:
+        await client.aclose()
+
+    assert fake.unread(MAILBOX) == 0
+    assert llm.calls == 2
+    assert sorted(m["toRecipients"][0]["emailAddress"]["address"] for m in fake.sent) == ["lector@example.com", "otro@example.com"]
+    reserve_reply = next(m for m in fake.sent if m["subject"] == "Re: Reserva")["body"]["content"]
+    assert "Reserva realizada" in reserve_reply and "POLL-1" in reserve_reply
+
+    assert await buf.flush() == 3
+    traces = (await session.execute(
+        select(models.EmailTrace).where(models.EmailTrace.message_id.in_(ids))
+    )).scalars().all()
+    assert {t.intent for t in traces} == {"reserve", "list_books"}
+    assert all(t.llm_input_tokens and t.total_ms >= t.llm_ms for t in traces)
+
+@pytest.mark.asyncio
+async def test_page_token_lists_books_without_llm(poller_db, session, monkeypatch):
+    for t in ("Token A", "Token B", "Token C"):
+        session.add(models.Book(title=t))
+    await session.commit()
+    monkeypatch.setattr(poller.settings, "REPLY_LIST_PAGE_SIZE", 2)
+    fake = FakeGraph()
+    fake.add_message(MAILBOX, subject="Catálogo [[libros:0]]", body="", from_email="lector@example.com")
+    client = GraphClient("t", "c", "s", MAILBOX, transport=fake.transport())
+    llm = FakeGeminiClient()
+    try:
+        await poller.poll_once(client, throttle=SenderThrottle(burst=5, refill_per_hour=0, duplicate_window_seconds=0, own_addresses=[MAILBOX]), log_buffer=EmailLogBuffer(poller_db), llm=llm)
+    finally:
+        await client.aclose()
+    sent = fake.sent[0]
+    assert llm.calls == 0 and sent["subject"] == "Re: Catálogo" and sent["body"]["contentType"] == "HTML"
+    assert '<ol start="1">' in sent["body"]["content"] and "subject=%5B%5Blibros%3A2%5D%5D" in sent["body"]["content"]
+
+def test_parse_mailboxes_with_per_mailbox_interval():
+    assert poller.parse_mailboxes("Norte@x.org, sur@x.org:120,norte@x.org:30", None, 60) == [("norte@x.org", 60), ("sur@x.org", 120.0)]
+    assert poller.parse_mailboxes(None, "unico@x.org", 60) == [("unico@x.org", 60)]
+    assert poller.parse_mailboxes("", None, 60) == []
+    assert poller.parse_mailboxes("norte@x.org:2m,sur@x.org:90", None, 60) == [("norte@x.org", 60), ("sur@x.org", 90.0)]
+
+@pytest.mark.asyncio
+async def test_poll_mailboxes_shares_client_and_applies_quota(poller_db):
+    fake = FakeGraph()
+    for i in range(12):
+        fake.add_message("norte@x.org", subject=f"n{i}", body=f"hola {i}", from_email=f"n{i}@example.com")
+    for i in range(2):
+        fake.add_message("sur@x.org", subject=f"s{i}", body=f"hola {i}", from_email=f"s{i}@example.com")
+    client = GraphClient("t", "c", "s", transport=fake.transport())
+    boxes = poller.build_mailboxes([("norte@x.org", 60), ("sur@x.org", 60)])
+    buf = EmailLogBuffer(poller_db)
+    try:
+        assert await poller.poll_mailboxes(client, boxes, log_buffer=buf, llm=FakeGeminiClient(), quota=5) == 2
+        norte, sur = boxes
+        assert (fake.unread("norte@x.org"), fake.unread("sur@x.org")) == (7, 0)
+        # norte agotó su cuota y queda listo para el siguiente turno; sur espera su intervalo.
+        assert await poller.poll_mailboxes(client, boxes, log_buffer=buf, llm=FakeGeminiClient(), quota=5) == 1
+        assert (norte.processed, sur.processed) == (10, 2)
+    finally:
+        await client.aclose()
+    assert fake.token_requests == 1
+    assert {m["from"] for m in fake.sent} == {"norte@x.org", "sur@x.org"}
+    assert "sur@x.org" in norte.throttle.own_addresses
+
+@pytest.mark.asyncio
+async def test_csv_attachment_registers_copies_without_llm(poller_db, session):
+    session.add(models.Book(title="Planilla Libro"))
+    await session.commit()
+    csv_data = "titulo,barcode,ubicacion\n" + "".join(f"Planilla Libro,PL-{i},A{i}\n" for i in range(30)) + "Sin libro,PL-X,A\n"
+    fake = FakeGraph()
+    fake.add_message(MAILBOX, subject="Alta de copias", body="Adjunto la planilla", from_email="bibliotecaria@example.com",
+                     attachments=[{"name": "copias.csv", "contentType": "text/csv", "content": csv_data.encode()}])
+    client = GraphClient("t", "c", "s", MAILBOX, transport=fake.transport())
+    llm = FakeGeminiClient()
+    throttle = SenderThrottle(burst=5, refill_per_hour=0, duplicate_window_seconds=0, own_addresses=[MAILBOX])
+    try:
+        await poller.poll_once(client, throttle=throttle, log_buffer=EmailLogBuffer(poller_db), llm=llm)
+    finally:
+        await client.aclose()
+    assert llm.calls == 0 and fake.calls["attachment"] == 1
+    reply = fake.sent[0]["body"]["content"]
+    assert "Copias registradas: 30 de 31" in reply and "Fila 32: El libro indicado no existe." in reply
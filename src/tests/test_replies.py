@@ -0,0 +1,30 @@
+from app.replies import find_page_token, page_token, render_reply, strip_page_token
+
+def test_success_template_renders_text_and_html():
+    result = {"ok": True, "data": {"title": "Rayuela <1963>", "barcode": "R-1", "book_id": "b1"}}
+    reply = render_reply("reserve", {"book_title": "Rayuela"}, result, "2025-01-01T00:00:00")
+    lines = reply.text.splitlines()
+    assert lines[:3] == ["¡Hola! 👋", "", "✅ Reserva realizada con éxito."]
+    assert "- Libro: Rayuela <1963> (ID: b1)" in lines and "- Renovaciones: 0" in lines
+    assert lines[-1] == "(Procesado: 2025-01-01T00:00:00Z)"
+    assert "<li>Libro: Rayuela &lt;1963&gt; (ID: b1)</li>" in reply.html
+
+def test_error_codes_and_fallbacks():
+    known = render_reply("renew", {}, {"ok": False, "code": "RESERVATION_EXPIRED"}, "t")
+    assert "❌ La reservación está vencida; no se puede renovar." in known.text
+    other = render_reply("renew", {}, {"ok": False, "code": "ACTION_ERROR", "message": "Error interno"}, "t")
+    assert "❌ Error interno" in other.text
+    assert "No entendí tu solicitud" in render_reply("unknown", {}, {"ok": False, "code": "UNKNOWN_INTENT"}, "t").text
+
+def test_list_page_links_to_next_page():
+    items = [{"title": f"Libro {i}", "author": "A", "book_id": str(i), "copies_total": 2, "copies_available": 1} for i in range(2)]
+    result = {"ok": True, "data": {"items": items, "offset": 20, "limit": 2, "has_more": True}}
+    reply = render_reply("list_books", {}, result, "t", reply_to="biblioteca@example.com")
+    assert "21) Libro 0 — A | Copias: 1/2 (ID: 0)" in reply.text
+    assert "el asunto: [[libros:22]]" in reply.text
+    assert '<ol start="21">' in reply.html and 'href="mailto:biblioteca@example.com?subject=%5B%5Blibros%3A22%5D%5D"' in reply.html
+
+def test_page_token_round_trip():
+    assert find_page_token(f"RE: Catálogo {page_token(40)}") == 40
+    assert find_page_token("[[ Libros : 5 ]]") == 5 and find_page_token("Catálogo") is None
+    assert strip_page_token(f"Catálogo {page_token(40)}") == "Catálogo"
@@ -0,0 +1,58 @@
+from app.worker.throttle import SenderThrottle, is_auto_generated, LOOP, DUPLICATE, RATE_LIMITED
+
+class FakeClock:
+    def __init__(self):
+        self.now = 1000.0
+    def __call__(self):
+        return self.now
+
+def _throttle(clock, **kw):
+    opts = dict(burst=2, refill_per_hour=60, duplicate_window_seconds=600, own_addresses=["biblioteca@example.com"])
+    opts.update(kw)
+    return SenderThrottle(clock=clock, **opts)
+
+def test_detects_auto_replies_and_own_mail():
+    assert is_auto_generated([{"name": "Auto-Submitted", "value": "auto-replied"}], "a@example.com", "Fuera de oficina")
+    assert not is_auto_generated([{"name": "Auto-Submitted", "value": "no"}], "a@example.com", "Reservar libro")
+    assert is_auto_generated([{"name": "Precedence", "value": "bulk"}], "a@example.com", "Hola")
+    assert is_auto_generated([], "Biblioteca@Example.com", "Re: Reservar", own_addresses=["biblioteca@example.com"])
+    assert is_auto_generated([], "a@example.com", "Re: RE: Automatic reply: Re: Reservar libro")
+    assert not is_auto_generated([], "a@example.com", "Re: Reservar libro")
+
+def test_duplicate_requests_are_coalesced_within_window():
+    clock = FakeClock()
+    t = _throttle(clock, burst=10)
+    assert t.check(from_email="a@example.com", subject="Reservar", body="Quiero  Clean Code") is None
+    assert t.check(from_email="A@example.com", subject="RE: reservar", body="quiero clean code") == DUPLICATE
+    assert t.check(from_email="b@example.com", subject="Reservar", body="Quiero Clean Code") is None
+    clock.now += 601
+    assert t.check(from_email="a@example.com", subject="Reservar", body="Quiero Clean Code") is None
+
+def test_messages_with_attachments_are_not_coalesced():
+    t = _throttle(FakeClock(), burst=10)
+    assert t.check(from_email="a@example.com", subject="Copias", body="Adjunto planilla", has_attachments=True) is None
+    assert t.check(from_email="a@example.com", subject="Copias", body="Adjunto planilla", has_attachments=True) is None
+
+def test_token_bucket_per_sender_refills_over_time():
+    clock = FakeClock()
+    t = _throttle(clock)
+    assert t.check(from_email="a@example.com", subject="1", body="") is None
+    assert t.check(from_email="a@example.com", subject="2", body="") is None
+    assert t.check(from_email="a@example.com", subject="3", body="") == RATE_LIMITED
+    assert t.check(from_email="c@example.com", subject="1", body="") is None
+    clock.now += 60
+    assert t.check(from_email="a@example.com", subject="4", body="") is None
+    assert t.check(from_email="x@example.com", subject="x", body="", headers=[{"name": "X-Autoreply", "value": "yes"}]) == LOOP
+    assert t.suppressed == {RATE_LIMITED: 1, LOOP: 1}
+
+def test_rate_limited_request_can_be_retried_and_is_notified_once():
+    clock = FakeClock()
+    t = _throttle(clock, burst=1)
+    assert t.check(from_email="a@example.com", subject="1", body="") is None
+    assert t.check(from_email="a@example.com", subject="Reservar", body="Clean Code") == RATE_LIMITED
+    assert t.should_notify("a@example.com") and not t.should_notify("A@example.com")
+    clock.now += 60
+    # El rechazo no ocupó la ventana de duplicados: el reintento se procesa.
+    assert t.check(from_email="a@example.com", subject="Reservar", body="Clean Code") is None
+    assert t.check(from_email="a@example.com", subject="2", body="") == RATE_LIMITED
+    assert t.should_notify("a@example.com")
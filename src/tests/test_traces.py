@@ -0,0 +1,32 @@
+import pytest
+from datetime import datetime, timedelta, timezone
+from app.traces import StageTrace, stage_percentiles
+from app.worker.email_log import EmailLogBuffer
+
+def test_stage_trace_row():
+    received = datetime.now(timezone.utc) - timedelta(seconds=30)
+    trace = StageTrace(received)
+    with trace.stage("llm"):
+        pass
+    row = trace.as_row(message_id="m-1", intent="reserve", confidence=0.9, usage={"input_tokens": 120, "output_tokens": 40})
+    assert 29_000 <= row["queue_ms"] <= 60_000
+    assert row["llm_ms"] is not None and row["db_ms"] is None
+    assert row["received_at"].tzinfo is None
+    assert (row["llm_input_tokens"], row["llm_output_tokens"]) == (120, 40)
+
+@pytest.mark.asyncio
+async def test_stage_percentiles_over_window(session_factory, session):
+    buf = EmailLogBuffer(session_factory)
+    base = datetime(2030, 1, 1, 12, 0, 0)
+    for i in range(1, 101):
+        row = StageTrace().as_row(message_id=f"trace-{i}", intent="list_books", confidence=1.0)
+        row.update(picked_up_at=base + timedelta(seconds=i), llm_ms=float(i), db_ms=None)
+        buf.add(message_id=f"trace-{i}", from_email="t@example.com", subject=None, trace=row)
+    old = StageTrace().as_row(message_id="trace-old", intent="list_books", confidence=1.0)
+    old.update(picked_up_at=base - timedelta(days=1), llm_ms=10_000.0)
+    buf.add(message_id="trace-old", from_email="t@example.com", subject=None, trace=old)
+    await buf.flush()
+    stats = await stage_percentiles(session, since=base, until=base + timedelta(hours=1))
+    assert stats["llm"] == {"count": 100, "p50": 50.0, "p95": 95.0, "p99": 99.0}
+    assert stats["db"]["count"] == 0 and stats["db"]["p50"] is None
+    assert stats["total"]["count"] == 100